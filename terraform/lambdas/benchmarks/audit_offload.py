@@ -0,0 +1,75 @@
+"""
+Compares audit table size and consumed write units with and without offloading large values to a content-addressed
+blob store. Parameters are mostly small values plus a few multi-KB certificates / JSON documents that are re-put
+with unchanged or slightly changed content, the pattern that makes inline storage expensive.
+
+Run from terraform/lambdas:  python -m benchmarks.audit_offload [events]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.fakes import FakeDynamoResource, FakeTable, item_size
+from config.constants import *
+from lib.data.dynamo.audit_dao import AuditDao, AuditRecord
+from lib.data.s3.blob_store import LocalBlobStore
+
+DEFAULT_EVENTS = 5000
+LARGE_VALUE_SHARE = 0.2
+
+
+def audit_table() -> FakeTable:
+    return FakeTable(AUDIT_TABLE_NAME, AUDIT_PARAM_NAME_KEY, AUDIT_TIME_KEY,
+                     indexes={AUDIT_TIME_INDEX_NAME: (AUDIT_TIME_BUCKET_ATTR, AUDIT_TIME_KEY),
+                              AUDIT_USER_INDEX_NAME: (AUDIT_USER_ATTR, AUDIT_TIME_KEY)})
+
+
+def large_value(seed: int) -> str:
+    rng = random.Random(seed)
+    return json.dumps({"service": f"service-{seed}", "certificate": "".join(rng.choice("ABCDEFGHIJKLMNOP")
+                                                                             for _ in range(3000)),
+                       "endpoints": [f"https://service-{seed}.example.com/{i}" for i in range(20)]})
+
+
+def write_events(dao: AuditDao, events: int) -> None:
+    rng = random.Random(42)
+    now = int(time.time() * 1000)
+    for i in range(events):
+        if rng.random() < LARGE_VALUE_SHARE:
+            # 20 large documents, each re-put many times and with only a handful of distinct versions.
+            seed = rng.randrange(20)
+            name, value = f"/app/service-{seed}/config/document", large_value(seed * 10 + rng.randrange(3))
+        else:
+            name, value = f"/app/service-{i % 40}/config/param-{i % 500}", f"value-{rng.randrange(1000)}"
+
+        dao.put_audit_log("benchmark", PUT_PARAM_ACTION, name, value, "String", None, None, "1", timestamp=now + i)
+
+
+def main(events: int):
+    inline_table = audit_table()
+    write_events(AuditDao(FakeDynamoResource([inline_table])), events)
+
+    with tempfile.TemporaryDirectory() as blob_dir:
+        offload_table = audit_table()
+        dao = AuditDao(FakeDynamoResource([offload_table]), blob_store=LocalBlobStore(blob_dir))
+        write_events(dao, events)
+
+        blobs = os.listdir(blob_dir)
+        blob_bytes = sum(os.path.getsize(os.path.join(blob_dir, blob)) for blob in blobs)
+        for item in offload_table.items.values():
+            record = AuditRecord.from_dict(item)
+            assert record.value_ref is None or len(dao.get_value(record)) > AUDIT_VALUE_OFFLOAD_THRESHOLD
+
+    inline_bytes = sum(item_size(item) for item in inline_table.items.values())
+    offload_bytes = sum(item_size(item) for item in offload_table.items.values())
+    print(f"{events} audit events")
+    print(f"  inline values:    {inline_bytes / 1024:>9.1f} KB in table, {inline_table.write_units:>8.0f} WCU")
+    print(f"  offloaded values: {offload_bytes / 1024:>9.1f} KB in table, {offload_table.write_units:>8.0f} WCU, "
+          f"{len(blobs)} blobs / {blob_bytes / 1024:.1f} KB in the blob store")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_EVENTS)
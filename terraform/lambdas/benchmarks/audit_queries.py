@@ -0,0 +1,70 @@
+"""
+Compares consumed read units for common incident-response questions answered with a filtered full scan of the audit
+table against AuditDao.query.
+
+Run from terraform/lambdas:  python -m benchmarks.audit_queries [records] [days]
+"""
+import sys
+import time
+
+from boto3.dynamodb.conditions import Attr
+
+from benchmarks.fakes import FakeDynamoResource, FakeTable
+from config.constants import *
+from lib.data.dynamo.audit_dao import AuditDao, AuditRecord
+from lib.data.dynamo.paginator import paginate
+
+DEFAULT_RECORDS = 50000
+DEFAULT_DAYS = 90
+USERS = 25
+HOUR = 60 * 60 * 1000
+
+
+def build_audit_table(records: int, days: int) -> FakeTable:
+    table = FakeTable(AUDIT_TABLE_NAME, AUDIT_PARAM_NAME_KEY, AUDIT_TIME_KEY,
+                      indexes={AUDIT_TIME_INDEX_NAME: (AUDIT_TIME_BUCKET_ATTR, AUDIT_TIME_KEY),
+                               AUDIT_USER_INDEX_NAME: (AUDIT_USER_ATTR, AUDIT_TIME_KEY)})
+    dao = AuditDao(FakeDynamoResource([table]))
+    now = int(time.time() * 1000)
+    span = days * 24 * HOUR
+
+    for i in range(records):
+        dao.put_audit_log(f"user-{i % USERS}", PUT_PARAM_ACTION, f"/app/service-{i % 40}/config/param-{i % 1000}",
+                          f"value-{i}", "String", None, "A benchmark parameter", str(i % 7 + 1),
+                          timestamp=now - (i * span // records))
+
+    return table
+
+
+def measure(table: FakeTable, name: str, scan_filter, query) -> None:
+    table.read_units = 0
+    scanned = set(AuditRecord.from_dict(item) for item in paginate(table.scan, FilterExpression=scan_filter))
+    scan_units = table.read_units
+
+    table.read_units = 0
+    queried = set(query())
+    query_units = table.read_units
+
+    assert scanned == queried, f"{name}: scan and query disagree."
+    print(f"  {name:<36} {len(queried):>6} records  scan {scan_units:>9.1f} RCU  query {query_units:>7.1f} RCU")
+
+
+def main(records: int, days: int):
+    table = build_audit_table(records, days)
+    dao = AuditDao(FakeDynamoResource([table]))
+    now = int(time.time() * 1000)
+    week_ago, hour_ago = now - 7 * 24 * HOUR, now - HOUR
+
+    print(f"{records} audit records over {days} days")
+    measure(table, "last hour", Attr(AUDIT_TIME_KEY).between(hour_ago, now),
+            lambda: dao.iter_records(hour_ago, now))
+    measure(table, "user-3 this week", Attr(AUDIT_USER_ATTR).eq("user-3") & Attr(AUDIT_TIME_KEY).between(week_ago, now),
+            lambda: dao.iter_records(week_ago, now, user="user-3"))
+    measure(table, "/app/service-7/ puts this week",
+            Attr(AUDIT_PARAM_NAME_KEY).begins_with("/app/service-7/") & Attr(AUDIT_TIME_KEY).between(week_ago, now),
+            lambda: dao.iter_records(week_ago, now, action=PUT_PARAM_ACTION, prefix="/app/service-7/"))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_RECORDS,
+         int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_DAYS)
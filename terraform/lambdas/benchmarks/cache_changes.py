@@ -0,0 +1,72 @@
+"""
+Compares consumed read units for a client refresh using a full scan of the config cache against
+ConfigCacheDao.get_changes_since for a client that last synced `hours_behind` hours ago.
+
+Run from terraform/lambdas:  python -m benchmarks.cache_changes [items] [changes] [hours_behind]
+"""
+import sys
+import time
+
+from benchmarks.fakes import FakeDynamoResource, FakeTable
+from config.constants import *
+from lib.data.dynamo.config_cache_dao import ConfigCacheDao
+
+DEFAULT_ITEMS = 50000
+DEFAULT_CHANGES = 200
+DEFAULT_HOURS_BEHIND = 6
+
+
+def build_cache(items: int, changes: int, hours_behind: int) -> FakeTable:
+    table = FakeTable(CONFIG_CACHE_TABLE_NAME, CONFIG_CACHE_PARAM_NAME_KEY, CONFIG_CACHE_LAST_UPDATED_KEY,
+                      indexes={CONFIG_CACHE_CHANGES_INDEX_NAME: (CONFIG_CACHE_TIME_BUCKET_ATTR_NAME,
+                                                                 CONFIG_CACHE_WRITTEN_AT_ATTR_NAME)})
+    dao = ConfigCacheDao(FakeDynamoResource([table]))
+    now = int(time.time() * 1000)
+    recent_window = hours_behind * 60 * 60 * 1000
+    old_window = CONFIG_CACHE_TOMBSTONE_MAX_AGE * 1000 - recent_window
+
+    for i in range(items):
+        if i < changes:
+            timestamp = now - (i * recent_window // changes)
+            state = CONFIG_CACHE_STATE_DELETED if i % 10 == 0 else CONFIG_CACHE_STATE_ACTIVE
+        else:
+            timestamp = now - recent_window - 1 - (i * old_window // items)
+            state = CONFIG_CACHE_STATE_ACTIVE
+
+        # Backdate the write as well, as if every item had been written when its event happened.
+        table.put_item(Item=dao._item(f"/app/service-{i % 200}/config/param-{i}", state, timestamp,
+                                      written_at=timestamp))
+
+    return table
+
+
+def main(items: int, changes: int, hours_behind: int):
+    table = build_cache(items, changes, hours_behind)
+    dao = ConfigCacheDao(FakeDynamoResource([table]))
+    since = int(time.time() * 1000) - hours_behind * 60 * 60 * 1000 - 1
+
+    table.read_units = 0
+    scanned = dao.get_all_configs()
+    scan_units = table.read_units
+
+    table.read_units = 0
+    received, token, pages = [], None, 0
+    while True:
+        page, token = dao.get_changes_since(since, page_token=token, limit=100)
+        received.extend(page)
+        pages += 1
+        if not token:
+            break
+    feed_units = table.read_units
+
+    expected = set([item for item in scanned if item.last_updated > since])
+    assert set(received) == expected, "Changes feed and full scan disagree."
+    print(f"{items} items, {len(received)} changes in the last {hours_behind}h")
+    print(f"  full scan:              {scan_units:>10.1f} RCU")
+    print(f"  changes feed:           {feed_units:>10.1f} RCU ({pages} pages)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ITEMS,
+         int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_CHANGES,
+         int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_HOURS_BEHIND)
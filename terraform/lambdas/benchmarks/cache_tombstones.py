@@ -0,0 +1,57 @@
+"""
+Compares consumed read units for finding DELETED config cache items with a filtered full-table scan (the old
+approach) against a query of the sparse tombstone-index.
+
+Run from terraform/lambdas:  python -m benchmarks.cache_tombstones [items] [deleted_ratio]
+"""
+import sys
+import time
+
+from boto3.dynamodb.conditions import Attr
+
+from benchmarks.fakes import FakeDynamoResource, FakeTable
+from config.constants import *
+from lib.data.dynamo.config_cache_dao import ConfigCacheDao, ConfigItem
+from lib.data.dynamo.paginator import paginate
+
+DEFAULT_ITEMS = 50000
+DEFAULT_DELETED_RATIO = 0.01
+
+
+def build_cache(items: int, deleted_ratio: float) -> FakeTable:
+    table = FakeTable(CONFIG_CACHE_TABLE_NAME, CONFIG_CACHE_PARAM_NAME_KEY, CONFIG_CACHE_LAST_UPDATED_KEY,
+                      indexes={CONFIG_CACHE_TOMBSTONE_INDEX_NAME: (CONFIG_CACHE_TOMBSTONE_ATTR_NAME,
+                                                                   CONFIG_CACHE_LAST_UPDATED_KEY)})
+    dao = ConfigCacheDao(FakeDynamoResource([table]))
+    deleted_every = int(1 / deleted_ratio) if deleted_ratio else 0
+    now = int(time.time() * 1000)
+
+    for i in range(items):
+        state = CONFIG_CACHE_STATE_DELETED if deleted_every and i % deleted_every == 0 else CONFIG_CACHE_STATE_ACTIVE
+        dao.put_in_cache(f"/app/service-{i % 200}/config/param-{i}", state=state, timestamp=now - i)
+
+    return table
+
+
+def main(items: int, deleted_ratio: float):
+    table = build_cache(items, deleted_ratio)
+    dao = ConfigCacheDao(FakeDynamoResource([table]))
+
+    table.read_units = 0
+    filter_exp = Attr(CONFIG_CACHE_STATE_ATTR_NAME).eq(CONFIG_CACHE_STATE_DELETED)
+    scanned = set(ConfigItem.from_dict(item) for item in paginate(table.scan, FilterExpression=filter_exp))
+    scan_units = table.read_units
+
+    table.read_units = 0
+    queried = dao.get_deleted_configs()
+    query_units = table.read_units
+
+    assert scanned == queried, "Scan and index query returned different tombstones."
+    print(f"{items} items, {len(queried)} tombstones")
+    print(f"  filtered scan:          {scan_units:>10.1f} RCU")
+    print(f"  tombstone-index query:  {query_units:>10.1f} RCU")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ITEMS,
+         float(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_DELETED_RATIO)
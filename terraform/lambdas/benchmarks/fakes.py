@@ -0,0 +1,704 @@
+"""
+In-memory stand-ins for the AWS APIs figgy's lambdas talk to. They implement the subset of the boto3 API the DAOs use.
+The DynamoDB fakes evaluate boto3 condition objects, paginate at DynamoDB's 1MB page limit and account for consumed
+read / write capacity units the way DynamoDB bills them. Every fake can be handed a `Faults` to add per call latency
+and throttling.
+"""
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+PAGE_SIZE_BYTES = 1024 * 1024
+READ_UNIT_BYTES = 4 * 1024
+WRITE_UNIT_BYTES = 1024
+SDK_MAX_RETRIES = 4  # botocore's legacy retry mode, throttled calls are retried this many times before raising
+SDK_RETRY_BASE_DELAY = 0.025  # seconds
+
+
+class Faults:
+    """
+    Latency and throttling injected into every API call made against a fake. A throttled call is retried the way the
+    boto SDK would, with exponential backoff, and only raises once SDK_MAX_RETRIES retries were throttled as well.
+    Throttles are counted in `throttles`.
+    """
+
+    def __init__(self, latency: float = 0.0, throttle_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.throttles = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _throttled(self) -> bool:
+        with self._lock:
+            throttled = self.throttle_rate and self._random.random() < self.throttle_rate
+            self.throttles += 1 if throttled else 0
+            return throttled
+
+    def apply(self, operation: str, error_code: str) -> None:
+        self.latency and time.sleep(self.latency)
+        retries = 0
+        while self._throttled():
+            if retries >= SDK_MAX_RETRIES:
+                raise client_error(error_code, 'Rate exceeded', operation)
+            time.sleep(SDK_RETRY_BASE_DELAY * 2 ** retries)
+            retries += 1
+            self.latency and time.sleep(self.latency)
+
+
+def item_size(value: Any) -> int:
+    """
+    Approximates DynamoDB's item size calculation.
+    """
+    if isinstance(value, dict):
+        return sum(len(str(key)) + item_size(val) for key, val in value.items())
+    if isinstance(value, (list, set, tuple)):
+        return sum(item_size(val) for val in value)
+    if isinstance(value, (int, float, Decimal)):
+        return min(21, len(str(value)))
+    if isinstance(value, bool) or value is None:
+        return 1
+
+    return len(str(value).encode('utf-8'))
+
+
+def evaluate(condition: Any, item: Dict) -> bool:
+    """
+    Evaluates a boto3 Key / Attr condition object against an item.
+    """
+    if condition is None:
+        return True
+
+    expression = condition.get_expression()
+    operator, values = expression['operator'], expression['values']
+
+    if operator == 'AND':
+        return all(evaluate(value, item) for value in values)
+    if operator == 'OR':
+        return any(evaluate(value, item) for value in values)
+    if operator == 'NOT':
+        return not evaluate(values[0], item)
+
+    name = values[0].name
+    present = name in item
+    actual = item.get(name)
+    operands = [value for value in values[1:]]
+
+    if operator == 'attribute_exists':
+        return present
+    if operator == 'attribute_not_exists':
+        return not present
+    if not present:
+        return False
+    if operator == '=':
+        return actual == operands[0]
+    if operator == '<>':
+        return actual != operands[0]
+    if operator == '<':
+        return actual < operands[0]
+    if operator == '<=':
+        return actual <= operands[0]
+    if operator == '>':
+        return actual > operands[0]
+    if operator == '>=':
+        return actual >= operands[0]
+    if operator == 'BETWEEN':
+        return operands[0] <= actual <= operands[1]
+    if operator == 'begins_with':
+        return isinstance(actual, str) and actual.startswith(operands[0])
+    if operator == 'contains':
+        return operands[0] in actual
+    if operator == 'IN':
+        return actual in operands
+
+    raise NotImplementedError(f"Unsupported condition operator: {operator}")
+
+
+EXPRESSION_TOKEN = re.compile(r"\s*(attribute_not_exists|attribute_exists|AND|OR|NOT|<>|<=|>=|[=<>(),]|[#:]?[\w.]+)")
+
+
+def evaluate_string(expression: str, item: Dict, names: Dict[str, str] = None, values: Dict[str, Any] = None) -> bool:
+    """
+    Evaluates a string ConditionExpression against an item. Supports comparisons, attribute_exists /
+    attribute_not_exists, AND / OR / NOT and parentheses.
+    """
+    names, values = names or {}, values or {}
+    tokens = EXPRESSION_TOKEN.findall(expression)
+    position = 0
+
+    def next_token() -> str:
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def peek() -> Optional[str]:
+        return tokens[position] if position < len(tokens) else None
+
+    def operand(token: str) -> Tuple[bool, Any]:
+        if token.startswith(':'):
+            return True, values[token]
+        name = names.get(token, token)
+        return name in item, item.get(name)
+
+    def disjunction() -> bool:
+        result = conjunction()
+        while peek() == 'OR':
+            next_token()
+            result = conjunction() or result
+        return result
+
+    def conjunction() -> bool:
+        result = term()
+        while peek() == 'AND':
+            next_token()
+            result = term() and result
+        return result
+
+    def term() -> bool:
+        token = next_token()
+        if token == 'NOT':
+            return not term()
+        if token == '(':
+            result = disjunction()
+            next_token()
+            return result
+        if token in ('attribute_exists', 'attribute_not_exists'):
+            next_token()
+            present, _ = operand(next_token())
+            next_token()
+            return present if token == 'attribute_exists' else not present
+
+        (left_present, left), operator, (right_present, right) = operand(token), next_token(), operand(next_token())
+        if not left_present or not right_present:
+            return operator == '<>' and left_present != right_present
+        return {'=': left == right, '<>': left != right, '<': left < right, '<=': left <= right,
+                '>': left > right, '>=': left >= right}[operator]
+
+    return disjunction()
+
+
+def project(item: Dict, expression: Optional[str], names: Optional[Dict[str, str]]) -> Dict:
+    if not expression:
+        return dict(item)
+
+    attributes = [names.get(attr.strip(), attr.strip()) if names else attr.strip() for attr in expression.split(',')]
+    return dict((attr, item[attr]) for attr in attributes if attr in item)
+
+
+class FakeTable:
+    """
+    A single DynamoDB table, optionally with global secondary indexes. Consumed capacity is tracked in
+    `read_units` / `write_units` and API calls in `calls`.
+    """
+
+    def __init__(self, name: str, hash_key: str, range_key: str = None,
+                 indexes: Dict[str, Tuple[str, Optional[str]]] = None, faults: Faults = None):
+        self.name = name
+        self.hash_key = hash_key
+        self.range_key = range_key
+        self.indexes = indexes or {}
+        self.faults = faults
+        self.items: Dict[Tuple, Dict] = {}
+        self.read_units = 0.0
+        self.write_units = 0.0
+        self.calls: Counter = Counter()
+        self._lock = threading.Lock()
+        self._sorted: Dict[Optional[str], List[Tuple[Tuple, Dict]]] = {}
+
+    # --- helpers
+    def _api(self, operation: str) -> None:
+        self.faults and self.faults.apply(operation, 'ProvisionedThroughputExceededException')
+        with self._lock:
+            self.calls[operation] += 1
+
+    def _key(self, item: Dict) -> Tuple:
+        return (item[self.hash_key], item[self.range_key]) if self.range_key else (item[self.hash_key],)
+
+    def _key_dict(self, item: Dict, index: str = None) -> Dict:
+        keys = [self.hash_key, self.range_key]
+        if index:
+            keys = keys + list(self.indexes[index])
+
+        return dict((key, item[key]) for key in keys if key and key in item)
+
+    def _charge_read(self, size: int) -> None:
+        with self._lock:
+            self.read_units += max(1, math.ceil(size / READ_UNIT_BYTES)) * 0.5  # eventually consistent
+
+    def _charge_write(self, item: Optional[Dict], multiplier: int = 1) -> None:
+        with self._lock:
+            self.write_units += multiplier * max(1, math.ceil(item_size(item or {}) / WRITE_UNIT_BYTES))
+
+    def _store(self, key: Tuple, item: Optional[Dict]) -> None:
+        """
+        Writes (or with `item` None, removes) an item and drops the sorted views built by `_sorted_items`.
+        """
+        with self._lock:
+            if item is None:
+                self.items.pop(key, None)
+            else:
+                self.items[key] = item
+            self._sorted = {}
+
+    def _sorted_items(self, index: str = None) -> List[Tuple[Tuple, Dict]]:
+        return self._sorted_view(index)[0]
+
+    def _sorted_view(self, index: str = None) -> Tuple[List[Tuple[Tuple, Dict]], List[str]]:
+        """
+        Returns the items in key order along with the partition (hash key) of each, cached until the next write.
+        """
+        view = self._sorted.get(index)
+        if view is None:
+            items = list(self.items.values())
+            if index:
+                hash_key, range_key = self.indexes[index]
+                items = [item for item in items if hash_key in item and (not range_key or range_key in item)]
+
+            entries = sorted(((self._sort_key(item, index), item) for item in items), key=lambda entry: entry[0])
+            view = (entries, [entry[0][0] for entry in entries])
+            self._sorted[index] = view
+
+        return view
+
+    def _partition(self, condition: Any, index: str = None) -> List[Tuple[Tuple, Dict]]:
+        """
+        Returns the sorted entries of the partition named by the hash key equality of a key condition.
+        """
+        entries, partitions = self._sorted_view(index)
+        hash_key = self.indexes[index][0] if index else self.hash_key
+        expression = condition.get_expression()
+        if expression['operator'] == 'AND':
+            expression = expression['values'][0].get_expression()
+        if expression['operator'] != '=' or expression['values'][0].name != hash_key:
+            return entries
+
+        partition = str(expression['values'][1])
+        return entries[bisect_left(partitions, partition):bisect_right(partitions, partition)]
+
+    def _page(self, entries: List[Tuple[Tuple, Dict]], start_key: Optional[Dict], index: str = None,
+              limit: int = None, reverse: bool = False) -> Tuple[List[Dict], Optional[Dict], int]:
+        if start_key:
+            marker = self._sort_key(start_key, index)
+            position = bisect_right([entry[0] for entry in entries], marker)
+            entries = entries[:position - 1] if reverse else entries[position:]
+
+        if reverse:
+            entries = list(reversed(entries))
+
+        page, size = [], 0
+        for sort_key, item in entries:
+            page.append(item)
+            size += item_size(item)
+            if size >= PAGE_SIZE_BYTES or (limit and len(page) >= limit):
+                break
+
+        last_key = self._key_dict(page[-1], index) if page and len(page) < len(entries) else None
+        return page, last_key, size
+
+    def _sort_key(self, item: Dict, index: str = None) -> Tuple:
+        table_key = (str(item[self.hash_key]), item[self.range_key] if self.range_key else 0)
+        if not index:
+            return table_key
+
+        hash_key, range_key = self.indexes[index]
+        return (str(item[hash_key]), item[range_key] if range_key else 0) + table_key
+
+    # --- resource API
+    def put_item(self, Item: Dict, ConditionExpression=None, **kwargs) -> Dict:
+        self._api('PutItem')
+        return self._put(Item, ConditionExpression)
+
+    def _put(self, Item: Dict, ConditionExpression=None) -> Dict:
+        existing = self.items.get(self._key(Item))
+        self._charge_write(Item)
+        if ConditionExpression is not None and not evaluate(ConditionExpression, existing or {}):
+            raise conditional_check_failed('PutItem')
+
+        self._store(self._key(Item), dict(Item))
+        return {}
+
+    def delete_item(self, Key: Dict, ConditionExpression=None, **kwargs) -> Dict:
+        self._api('DeleteItem')
+        return self._delete(Key, ConditionExpression)
+
+    def _delete(self, Key: Dict, ConditionExpression=None) -> Dict:
+        existing = self.items.get(self._key(Key))
+        self._charge_write(existing)
+        if ConditionExpression is not None and not evaluate(ConditionExpression, existing or {}):
+            raise conditional_check_failed('DeleteItem')
+
+        self._store(self._key(Key), None)
+        return {}
+
+    def update_item(self, Key: Dict, UpdateExpression: str, ConditionExpression: str = None,
+                    ExpressionAttributeNames: Dict = None, ExpressionAttributeValues: Dict = None, **kwargs) -> Dict:
+        """
+        Supports `SET #a = :v, ...` and `REMOVE #a, ...` update expressions.
+        """
+        self._api('UpdateItem')
+        names, values = ExpressionAttributeNames or {}, ExpressionAttributeValues or {}
+        existing = self.items.get(self._key(Key))
+        if ConditionExpression and not evaluate_string(ConditionExpression, existing or {}, names, values):
+            raise conditional_check_failed('UpdateItem')
+
+        item = dict(existing or Key)
+        for clause, arguments in re.findall(r"(SET|REMOVE)\s+(.*?)(?=\s+(?:SET|REMOVE)\s|$)", UpdateExpression):
+            for argument in arguments.split(','):
+                if clause == 'SET':
+                    name, value = [part.strip() for part in argument.split('=')]
+                    item[names.get(name, name)] = values[value]
+                else:
+                    item.pop(names.get(argument.strip(), argument.strip()), None)
+
+        self._charge_write(item)
+        self._store(self._key(Key), item)
+        return {}
+
+    def get_item(self, Key: Dict, **kwargs) -> Dict:
+        self._api('GetItem')
+        item = self.items.get(self._key(Key))
+        self._charge_read(item_size(item or {}))
+        return {'Item': dict(item)} if item else {}
+
+    def query(self, KeyConditionExpression, IndexName: str = None, FilterExpression=None,
+              ExclusiveStartKey: Dict = None, Limit: int = None, ScanIndexForward: bool = True,
+              ProjectionExpression: str = None, ExpressionAttributeNames: Dict = None, **kwargs) -> Dict:
+        self._api('Query')
+        entries = [(key, item) for key, item in self._partition(KeyConditionExpression, IndexName)
+                   if evaluate(KeyConditionExpression, item)]
+        page, last_key, size = self._page(entries, ExclusiveStartKey, IndexName, Limit, not ScanIndexForward)
+        self._charge_read(size)
+        return self._result(page, last_key, FilterExpression, ProjectionExpression, ExpressionAttributeNames)
+
+    def scan(self, FilterExpression=None, ExclusiveStartKey: Dict = None, Segment: int = None,
+             TotalSegments: int = None, Limit: int = None, IndexName: str = None, ProjectionExpression: str = None,
+             ExpressionAttributeNames: Dict = None, **kwargs) -> Dict:
+        self._api('Scan')
+        entries = self._sorted_items(IndexName)
+        if TotalSegments:
+            entries = [(key, item) for key, item in entries
+                       if zlib.crc32(str(item[self.hash_key]).encode('utf-8')) % TotalSegments == Segment]
+
+        page, last_key, size = self._page(entries, ExclusiveStartKey, IndexName, Limit)
+        self._charge_read(size)
+        return self._result(page, last_key, FilterExpression, ProjectionExpression, ExpressionAttributeNames)
+
+    def _result(self, page: List[Dict], last_key: Optional[Dict], filter_exp, projection_exp: Optional[str],
+                names: Optional[Dict]) -> Dict:
+        matched = [project(item, projection_exp, names) for item in page if evaluate(filter_exp, item)]
+        result = {'Items': matched, 'Count': len(matched), 'ScannedCount': len(page)}
+        if last_key:
+            result['LastEvaluatedKey'] = last_key
+
+        return result
+
+    def batch_writer(self, **kwargs) -> "FakeTableBatchWriter":
+        return FakeTableBatchWriter(self)
+
+    def describe(self) -> Dict:
+        indexes = [{'IndexName': name, 'IndexStatus': 'ACTIVE', 'Backfilling': False} for name in self.indexes]
+        return {'Table': {'TableName': self.name, 'ItemCount': len(self.items), 'GlobalSecondaryIndexes': indexes}}
+
+
+class FakeTableBatchWriter:
+    """
+    Stand-in for boto3's Table.batch_writer(). Writes are buffered and sent as BatchWriteItem requests of 25 items.
+    """
+
+    def __init__(self, table: FakeTable):
+        self._table = table
+        self._requests: List[Dict] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._flush()
+
+    def _add(self, request: Dict) -> None:
+        self._requests.append(request)
+        if len(self._requests) >= 25:
+            self._flush()
+
+    def _flush(self) -> None:
+        while self._requests:
+            batch, self._requests = self._requests[:25], self._requests[25:]
+            self._table.meta.client.batch_write_item(RequestItems={self._table.name: batch})
+
+    def put_item(self, Item: Dict) -> None:
+        self._add({'PutRequest': {'Item': Item}})
+
+    def delete_item(self, Key: Dict) -> None:
+        self._add({'DeleteRequest': {'Key': Key}})
+
+
+class FakeDynamoClient:
+    """
+    Stand-in for the high-level client exposed as `dynamodb_resource.meta.client`.
+    """
+
+    def __init__(self, resource: "FakeDynamoResource"):
+        self._resource = resource
+
+    def scan(self, TableName: str, **kwargs) -> Dict:
+        return self._resource.Table(TableName).scan(**kwargs)
+
+    def query(self, TableName: str, **kwargs) -> Dict:
+        return self._resource.Table(TableName).query(**kwargs)
+
+    def describe_table(self, TableName: str) -> Dict:
+        return self._resource.Table(TableName).describe()
+
+    def transact_write_items(self, TransactItems: List[Dict]) -> Dict:
+        """
+        Applies every Put / Delete / ConditionCheck atomically, or none of them if any condition fails.
+        """
+        writes = []
+        for request in TransactItems:
+            (operation, params), = request.items()
+            table = self._resource.Table(params['TableName'])
+            key = table._key(params.get('Item', params.get('Key')))
+            condition = params.get('ConditionExpression')
+            if condition and not evaluate_string(condition, table.items.get(key, {}),
+                                                 params.get('ExpressionAttributeNames'),
+                                                 params.get('ExpressionAttributeValues')):
+                raise transaction_cancelled()
+            writes.append((table, operation, key, params))
+
+        for table in set(write[0] for write in writes):
+            table._api('TransactWriteItems')
+
+        for table, operation, key, params in writes:
+            table._charge_write(params.get('Item', table.items.get(key, {})), multiplier=2)
+            if operation == 'Put':
+                table._store(key, dict(params['Item']))
+            elif operation == 'Delete':
+                table._store(key, None)
+
+        return {}
+
+    def batch_get_item(self, RequestItems: Dict[str, Dict]) -> Dict:
+        responses = {}
+        for table_name, request in RequestItems.items():
+            table = self._resource.Table(table_name)
+            table._api('BatchGetItem')
+            items = [table.items.get(table._key(key)) for key in request['Keys']]
+            responses[table_name] = [dict(item) for item in items if item]
+            table._charge_read(sum(item_size(item) for item in responses[table_name]))
+
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def batch_write_item(self, RequestItems: Dict[str, List[Dict]]) -> Dict:
+        for table_name, requests in RequestItems.items():
+            table = self._resource.Table(table_name)
+            table._api('BatchWriteItem')
+            for request in requests:
+                if 'PutRequest' in request:
+                    table._put(request['PutRequest']['Item'])
+                else:
+                    table._delete(request['DeleteRequest']['Key'])
+
+        return {'UnprocessedItems': {}}
+
+
+class FakeDynamoResource:
+    """
+    Stand-in for boto3.resource('dynamodb') holding a fixed set of FakeTables.
+    """
+
+    def __init__(self, tables: Iterable[FakeTable]):
+        self.tables: Dict[str, FakeTable] = dict((table.name, table) for table in tables)
+        self.meta = SimpleNamespace(client=FakeDynamoClient(self))
+        for table in self.tables.values():
+            table.meta = self.meta
+
+    def Table(self, name: str) -> FakeTable:
+        return self.tables[name]
+
+
+def client_error(code: str, message: str, operation: str) -> Exception:
+    from botocore.exceptions import ClientError
+    return ClientError({'Error': {'Code': code, 'Message': message}}, operation)
+
+
+def conditional_check_failed(operation: str) -> Exception:
+    return client_error('ConditionalCheckFailedException', 'The conditional request failed', operation)
+
+
+def transaction_cancelled() -> Exception:
+    return client_error('TransactionCanceledException', 'Transaction cancelled, please refer cancellation reasons for '
+                                                        'specific reasons [ConditionalCheckFailed]', 'TransactWriteItems')
+
+
+class FakeSsmClient:
+    """
+    Stand-in for boto3.client('ssm') holding parameters in memory. Values are stored as given, SecureStrings are not
+    actually encrypted. API calls are counted in `calls`.
+    """
+
+    def __init__(self, faults: Faults = None):
+        self.faults = faults
+        self.parameters: Dict[str, Dict] = {}
+        self.calls: Counter = Counter()
+        self._names: List[str] = []
+        self._lock = threading.Lock()
+
+    def _api(self, operation: str) -> None:
+        self.faults and self.faults.apply(operation, 'ThrottlingException')
+        with self._lock:
+            self.calls[operation] += 1
+
+    def _under(self, path: str, recursive: bool, start_after: str = None) -> Iterable[Dict]:
+        """
+        Yields the parameters below `path` in name order, optionally starting after a given name.
+        """
+        prefix = path.rstrip('/') + '/'
+        with self._lock:
+            names = self._names
+            position = bisect_right(names, start_after) if start_after else bisect_right(names, prefix)
+
+        while position < len(names) and names[position].startswith(prefix):
+            name = names[position]
+            position += 1
+            if recursive or '/' not in name[len(prefix):]:
+                param = self.parameters.get(name)
+                if param:
+                    yield param
+
+    def _page(self, params: Iterable[Dict], max_results: int) -> Tuple[List[Dict], Optional[str]]:
+        page = []
+        for param in params:
+            if len(page) == max_results:
+                return page, page[-1]['Name']
+            page.append(param)
+
+        return page, None
+
+    def put(self, name: str, value: str, type: str = 'String', description: str = None, key_id: str = None) -> None:
+        """
+        Seeds a parameter without counting an API call.
+        """
+        with self._lock:
+            existing = self.parameters.get(name)
+            if not existing:
+                names = list(self._names)
+                names.insert(bisect_right(names, name), name)
+                self._names = names
+
+            self.parameters[name] = {
+                'Name': name,
+                'Value': value,
+                'Type': type,
+                'Version': existing['Version'] + 1 if existing else 1,
+                'Description': description,
+                'KeyId': key_id,
+            }
+
+    def put_many(self, params: Dict[str, str], type: str = 'String') -> None:
+        """
+        Seeds many String parameters at once, without counting API calls.
+        """
+        with self._lock:
+            for name, value in params.items():
+                version = self.parameters[name]['Version'] + 1 if name in self.parameters else 1
+                self.parameters[name] = {'Name': name, 'Value': value, 'Type': type, 'Version': version}
+            self._names = sorted(self.parameters.keys())
+
+    def get_parameter(self, Name: str, WithDecryption: bool = False) -> Dict:
+        self._api('GetParameter')
+        param = self.parameters.get(Name)
+        if not param:
+            raise client_error('ParameterNotFound', f'Parameter {Name} not found.', 'GetParameter')
+
+        return {'Parameter': dict(param)}
+
+    def get_parameters(self, Names: List[str], WithDecryption: bool = False) -> Dict:
+        self._api('GetParameters')
+        found = [dict(self.parameters[name]) for name in Names if name in self.parameters]
+        return {'Parameters': found, 'InvalidParameters': [name for name in Names if name not in self.parameters]}
+
+    def get_parameters_by_path(self, Path: str, Recursive: bool = False, WithDecryption: bool = False,
+                               MaxResults: int = 10, NextToken: str = None, **kwargs) -> Dict:
+        self._api('GetParametersByPath')
+        page, next_token = self._page(self._under(Path, Recursive, NextToken), MaxResults)
+        result = {'Parameters': [dict(param) for param in page]}
+        if next_token:
+            result['NextToken'] = next_token
+
+        return result
+
+    def describe_parameters(self, ParameterFilters: List[Dict], MaxResults: int = 50, NextToken: str = None) -> Dict:
+        """
+        Supports a single `Path` filter.
+        """
+        self._api('DescribeParameters')
+        path_filter = ParameterFilters[0]
+        params = self._under(path_filter['Values'][0], path_filter.get('Option') == 'Recursive', NextToken)
+        page, next_token = self._page(params, MaxResults)
+        result = {'Parameters': [dict((key, val) for key, val in param.items() if key != 'Value') for param in page]}
+        if next_token:
+            result['NextToken'] = next_token
+
+        return result
+
+    def put_parameter(self, Name: str, Value: str, Type: str, Description: str = None, KeyId: str = None,
+                      Overwrite: bool = False) -> Dict:
+        self._api('PutParameter')
+        if Name in self.parameters and not Overwrite:
+            raise client_error('ParameterAlreadyExists', f'Parameter {Name} already exists.', 'PutParameter')
+
+        self.put(Name, Value, Type, Description, KeyId)
+        return {'Version': self.parameters[Name]['Version']}
+
+    def delete_parameter(self, Name: str) -> Dict:
+        self._api('DeleteParameter')
+        with self._lock:
+            if not self.parameters.pop(Name, None):
+                raise client_error('ParameterNotFound', f'Parameter {Name} not found.', 'DeleteParameter')
+            self._names = [name for name in self._names if name != Name]
+
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+
+class FakeS3Client:
+    """
+    Stand-in for boto3.client('s3'), holding objects of any number of buckets in memory.
+    """
+
+    def __init__(self, faults: Faults = None):
+        self.faults = faults
+        self.objects: Dict[Tuple[str, str], bytes] = {}
+        self.calls: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def _api(self, operation: str) -> None:
+        self.faults and self.faults.apply(operation, 'SlowDown')
+        with self._lock:
+            self.calls[operation] += 1
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, **kwargs) -> Dict:
+        self._api('PutObject')
+        self.objects[(Bucket, Key)] = Body
+        return {}
+
+    def head_object(self, Bucket: str, Key: str) -> Dict:
+        self._api('HeadObject')
+        if (Bucket, Key) not in self.objects:
+            raise client_error('404', 'Not Found', 'HeadObject')
+
+        return {'ContentLength': len(self.objects[(Bucket, Key)])}
+
+    def get_object(self, Bucket: str, Key: str) -> Dict:
+        self._api('GetObject')
+        if (Bucket, Key) not in self.objects:
+            raise client_error('NoSuchKey', 'The specified key does not exist.', 'GetObject')
+
+        return {'Body': SimpleNamespace(read=lambda: self.objects[(Bucket, Key)])}
@@ -0,0 +1,437 @@
+"""
+Drives figgy's lambda handlers end to end against the in-memory fakes, so their throughput can be measured without an
+AWS account. Each scenario seeds a fresh set of fakes, imports the handler module against them and invokes `handle`
+with generated events. Wall time, AWS API calls, consumed DynamoDB capacity, throttles and peak traced memory are
+reported per scenario and compared against a stored baseline.
+
+Run from terraform/lambdas:
+    python -m benchmarks.harness                              # every scenario at full scale
+    python -m benchmarks.harness replication_syncer --scale 0.1
+    python -m benchmarks.harness --latency-ms 5 --throttle-rate 0.02
+    python -m benchmarks.harness --update-baseline            # store the results as the new baseline
+
+Wall time includes the overhead of tracemalloc and of the fakes themselves, so it is only meaningful relative to a
+baseline recorded on the same machine. API call counts and capacity are deterministic for a given scale and seed.
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional
+
+from boto3.dynamodb.types import TypeSerializer
+
+from benchmarks.fakes import FakeDynamoResource, FakeS3Client, FakeSsmClient, FakeTable, Faults
+from config.constants import *
+from lib.data.dynamo.config_cache_dao import ConfigCacheDao
+from lib.data.dynamo.replication_dao import ReplicationDao
+from lib.data.ssm import ssm as ssm_module
+from lib.models.replication_config import ReplicationConfig, ReplicationType
+from lib.models.run_env import RunEnv
+from lib.utils import bootstrap
+from lib.utils.rate_limiter import RateLimiter
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+ACCOUNT_ID = '123456789012'
+DEPLOY_BUCKET = 'figgy-benchmark-deploy-bucket'
+NAMESPACES = ['/app', '/shared', '/data', '/devops']
+UNTHROTTLED_SSM_RATE = 100000  # calls / second, effectively disables the SsmDao rate limiter
+
+# Scenario sizes at --scale 1
+REPL_SOURCE_PARAMS = 10000
+REPL_APP_CONFIGS = 5000
+REPL_MERGE_CONFIGS = 1000
+REPL_STALE_RATIO = 0.2
+STREAM_EVENTS = 1000
+DYNAMO_STREAM_RECORDS = 2000
+DYNAMO_STREAM_BATCH_SIZE = 100
+DYNAMO_STREAM_HOT_DESTINATIONS = 20  # Destinations edited over and over, half of all records touch one of them
+CACHE_PARAMS = 100000
+CACHE_STALE_ITEMS = 2000
+CACHE_UNCACHED_RATIO = 0.03
+AUDIT_EVENTS = 2000
+AUDIT_DELETE_RATIO = 0.1
+AUDIT_LARGE_VALUE_RATIO = 0.02
+
+DEFAULT_TIME_TOLERANCE = 0.3
+DEFAULT_CALLS_TOLERANCE = 0.05
+DEFAULT_CAPACITY_TOLERANCE = 0.05
+DEFAULT_MEMORY_TOLERANCE = 0.3
+
+
+class Environment:
+    """
+    One set of fakes standing in for every AWS service the lambdas use, installed behind lib.utils.bootstrap.
+    """
+
+    def __init__(self, faults: Faults):
+        self.faults = faults
+        self.ssm = FakeSsmClient(faults)
+        self.s3 = FakeS3Client(faults)
+        self.tables = [
+            FakeTable(REPL_TABLE_NAME, REPL_DEST_KEY_NAME,
+                      indexes={REPL_SOURCE_INDEX_NAME: (REPL_SOURCE_KEY_ATTR_NAME, None)}, faults=faults),
+            FakeTable(REPL_REFS_TABLE_NAME, REPL_DEST_KEY_NAME, REPL_REFS_REFERENCE_KEY_NAME,
+                      indexes={REPL_REFS_REFERENCE_INDEX_NAME: (REPL_REFS_REFERENCE_KEY_NAME, REPL_DEST_KEY_NAME)},
+                      faults=faults),
+            FakeTable(REPL_LAG_TABLE_NAME, REPL_DEST_KEY_NAME,
+                      indexes={REPL_LAG_INDEX_NAME: (REPL_LAG_PARTITION_ATTR_NAME, REPL_LAG_ROLLING_ATTR_NAME)},
+                      faults=faults),
+            FakeTable(CONFIG_CACHE_TABLE_NAME, CONFIG_CACHE_PARAM_NAME_KEY, CONFIG_CACHE_LAST_UPDATED_KEY,
+                      indexes={CONFIG_CACHE_TOMBSTONE_INDEX_NAME: (CONFIG_CACHE_TOMBSTONE_ATTR_NAME,
+                                                                   CONFIG_CACHE_LAST_UPDATED_KEY),
+                               CONFIG_CACHE_CHANGES_INDEX_NAME: (CONFIG_CACHE_TIME_BUCKET_ATTR_NAME,
+                                                                 CONFIG_CACHE_WRITTEN_AT_ATTR_NAME)}, faults=faults),
+            FakeTable(AUDIT_TABLE_NAME, AUDIT_PARAM_NAME_KEY, AUDIT_TIME_KEY,
+                      indexes={AUDIT_TIME_INDEX_NAME: (AUDIT_TIME_BUCKET_ATTR, AUDIT_TIME_KEY),
+                               AUDIT_USER_INDEX_NAME: (AUDIT_USER_ATTR, AUDIT_TIME_KEY)}, faults=faults),
+        ]
+        self.dynamo = FakeDynamoResource(self.tables)
+
+        self.ssm.put(ACCOUNT_ID_PS_PATH, ACCOUNT_ID)
+        self.ssm.put(ACCOUNT_ENV_PS_PATH, 'benchmark')
+        self.ssm.put(FIGGY_NAMESPACES_PATH, json.dumps(NAMESPACES))
+        self.ssm.put(FIGGY_DEPLOY_BUCKET_PS_PATH, DEPLOY_BUCKET)
+        self.ssm.put(REPL_KEY_PS_PATH, 'alias/figgy-replication')
+        self.ssm.put(NOTIFY_DELETES_PS_PATH, 'false')
+        # Seeded configs are written with `source_key`, so there is nothing to backfill.
+        self.ssm.put(f"{FIGGY_MIGRATIONS_PREFIX}{REPL_SOURCE_INDEX_MIGRATION}", '0')
+
+    def install(self, ssm_rate: float) -> None:
+        ssm_module.shared_rate_limiter = RateLimiter(ssm_rate, max(1, int(ssm_rate)))
+        bootstrap.install(clients={'ssm': self.ssm, 's3': self.s3}, resources={'dynamodb': self.dynamo})
+
+    def reset_counters(self) -> None:
+        for fake in [self.ssm, self.s3] + self.tables:
+            fake.calls.clear()
+        for table in self.tables:
+            table.read_units = table.write_units = 0.0
+        self.faults.throttles = 0
+
+    def calls(self) -> Dict[str, int]:
+        calls = {}
+        for service, fake in [('ssm', self.ssm), ('s3', self.s3)] + [(f'ddb.{table.name}', table)
+                                                                    for table in self.tables]:
+            for operation, count in fake.calls.items():
+                if count:
+                    calls[f'{service}.{operation}'] = count
+
+        return dict(sorted(calls.items()))
+
+
+@dataclass
+class Result:
+    scenario: str
+    scale: float
+    invocations: int = 0
+    wall_time: float = 0.0
+    peak_memory_mb: float = 0.0
+    total_calls: int = 0
+    read_units: float = 0.0
+    write_units: float = 0.0
+    throttles: int = 0
+    calls: Dict[str, int] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+@dataclass
+class Scenario:
+    name: str
+    handler: str
+    description: str
+    seed: Callable[[Environment, float, random.Random], Iterable[Dict]]
+
+
+def scaled(count: int, scale: float) -> int:
+    return max(1, int(count * scale))
+
+
+def event_time(offset: int = 0) -> str:
+    return datetime.fromtimestamp(time.time() - offset, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+# --- replication
+def seed_replication(env: Environment, scale: float, rng: random.Random) -> List[ReplicationConfig]:
+    """
+    Seeds source parameters and app / merge replication configs reading from them. REPL_STALE_RATIO of the
+    destinations are out of date.
+    """
+    sources = [f"/shared/team-{i % 50}/service-config/param-{i}" for i in range(scaled(REPL_SOURCE_PARAMS, scale))]
+    env.ssm.put_many(dict((name, f"value-{i}") for i, name in enumerate(sources)))
+
+    dao = ReplicationDao(env.dynamo, bootstrap.settings)
+    configs = []
+    for i in range(scaled(REPL_APP_CONFIGS, scale)):
+        service = f"/app/service-{i % 250}/"
+        configs.append(ReplicationConfig(f"{service}replicated/param-{i}", RunEnv('benchmark'), service,
+                                         rng.choice(sources), ReplicationType(REPL_TYPE_APP), user='benchmark'))
+    for i in range(scaled(REPL_MERGE_CONFIGS, scale)):
+        service = f"/app/service-{i % 250}/"
+        host, db, password = rng.sample(sources, 3)
+        source = f"jdbc:postgresql://${{{host}}}:5432/${{{db}}}?password=${{{password}:uri}}"
+        configs.append(ReplicationConfig(f"{service}replicated/merged-{i}", RunEnv('benchmark'), service, source,
+                                         ReplicationType(REPL_TYPE_MERGE), user='benchmark'))
+
+    for config in configs:
+        dao.put_config_repl(config.destination, config.props)
+        if rng.random() >= REPL_STALE_RATIO:
+            value = env.ssm.parameters[config.source]['Value'] if config.type == REPL_TYPE_APP else 'merged'
+            env.ssm.put(config.destination, value, SSM_SECURE_STRING if config.type == REPL_TYPE_MERGE else 'String')
+
+    return configs
+
+
+def replication_syncer_events(env: Environment, scale: float, rng: random.Random) -> Iterable[Dict]:
+    seed_replication(env, scale, rng)
+    yield {}
+
+
+def ssm_stream_replicator_events(env: Environment, scale: float, rng: random.Random) -> Iterable[Dict]:
+    configs = seed_replication(env, scale, rng)
+    sources = sorted(set([config.source for config in configs if config.type == REPL_TYPE_APP]))
+    for i in range(scaled(STREAM_EVENTS, scale)):
+        source = rng.choice(sources)
+        env.ssm.put(source, f"updated-{i}")
+        yield {
+            'account': ACCOUNT_ID,
+            'detail': {
+                'eventName': PUT_PARAM_ACTION,
+                'eventTime': event_time(),
+                'requestParameters': {'name': source, 'type': 'String', 'overwrite': True},
+                'userIdentity': {'principalId': 'AROAEXAMPLE:benchmark-user',
+                                 'arn': 'arn:aws:sts::123456789012:assumed-role/figgy-devops/benchmark-user'},
+            },
+        }
+
+
+def dynamo_stream_replicator_events(env: Environment, scale: float, rng: random.Random) -> Iterable[Dict]:
+    """
+    Re-points app configs at new sources the way the figgy CLI does and delivers the resulting replication table
+    stream records in batches. Half of the records touch a small set of hot destinations, so most batches carry
+    several records for the same destination.
+    """
+    configs = [config for config in seed_replication(env, scale, rng) if config.type == REPL_TYPE_APP]
+    sources = sorted(set([config.source for config in configs]))
+    hot = configs[:DYNAMO_STREAM_HOT_DESTINATIONS]
+    dao = ReplicationDao(env.dynamo, bootstrap.settings)
+    serializer = TypeSerializer()
+
+    records = []
+    for i in range(scaled(DYNAMO_STREAM_RECORDS, scale)):
+        config = rng.choice(hot) if rng.random() < 0.5 else rng.choice(configs)
+        props = dict(config.props, source=rng.choice(sources))
+        dao.put_config_repl(config.destination, props)
+        image = env.dynamo.Table(REPL_TABLE_NAME).items[(config.destination,)]
+        records.append({
+            'eventName': 'MODIFY',
+            'dynamodb': {
+                'ApproximateCreationDateTime': time.time(),
+                'Keys': {REPL_DEST_KEY_NAME: {'S': config.destination}},
+                'SequenceNumber': str(i + 1),
+                'NewImage': dict((key, serializer.serialize(value)) for key, value in image.items()),
+                'StreamViewType': 'NEW_IMAGE',
+            },
+        })
+
+    # Every edit is made before the first batch is delivered, so the edits themselves are left out of the measurement.
+    for i in range(0, len(records), DYNAMO_STREAM_BATCH_SIZE):
+        yield {'Records': records[i:i + DYNAMO_STREAM_BATCH_SIZE]}
+
+
+# --- config cache
+def config_cache_syncer_events(env: Environment, scale: float, rng: random.Random) -> Iterable[Dict]:
+    """
+    Seeds PS with parameters spread across every namespace and a cache that is missing a few of them, holds stale
+    entries for parameters that no longer exist and a handful of duplicates.
+    """
+    names = [f"{NAMESPACES[i % len(NAMESPACES)]}/service-{i % 500}/config/param-{i}"
+             for i in range(scaled(CACHE_PARAMS, scale))]
+    env.ssm.put_many(dict((name, 'value') for name in names))
+
+    dao = ConfigCacheDao(env.dynamo)
+    now = int(time.time() * 1000)
+    with dao.batch_writer() as writer:
+        for i, name in enumerate(names):
+            if rng.random() >= CACHE_UNCACHED_RATIO:
+                dao.put_in_cache(name, timestamp=now - i, writer=writer)
+                if i % 200 == 0:
+                    dao.put_in_cache(name, timestamp=now - i - 1, writer=writer)
+        for i in range(scaled(CACHE_STALE_ITEMS, scale)):
+            dao.put_in_cache(f"/app/removed-{i}/config/param", timestamp=now - i, writer=writer)
+
+    yield {}
+
+
+# --- auditor
+def config_auditor_events(env: Environment, scale: float, rng: random.Random) -> Iterable[Dict]:
+    """
+    Generates a mix of PutParameter events, some with values large enough to be offloaded to the blob store, and
+    DeleteParameters events naming ten parameters each.
+    """
+    for i in range(scaled(AUDIT_EVENTS, scale)):
+        user_arn = f"arn:aws:sts::{ACCOUNT_ID}:assumed-role/figgy-devops/user-{i % 20}"
+        if rng.random() < AUDIT_DELETE_RATIO:
+            names = [f"/app/service-{rng.randrange(250)}/config/param-{rng.randrange(10000)}" for _ in range(10)]
+            detail = {'eventName': DELETE_PARAMS_ACTION, 'requestParameters': {'names': names}}
+        else:
+            name = f"/app/service-{i % 250}/config/param-{i}"
+            size = 4096 if rng.random() < AUDIT_LARGE_VALUE_RATIO else 64
+            detail = {
+                'eventName': PUT_PARAM_ACTION,
+                'requestParameters': {'name': name, 'value': f"{i}".ljust(size, 'x'), 'type': 'String',
+                                      'description': 'benchmark', 'overwrite': True},
+                'responseElements': {'version': rng.randrange(1, 20)},
+            }
+
+        detail.update({'eventTime': event_time(offset=i), 'userIdentity': {'arn': user_arn}})
+        yield {'account': ACCOUNT_ID, 'detail': detail}
+
+
+SCENARIOS = [
+    Scenario('replication_syncer', 'functions.replication_syncer',
+             f"Full resync of {REPL_APP_CONFIGS} app and {REPL_MERGE_CONFIGS} merge configs over "
+             f"{REPL_SOURCE_PARAMS} sources", replication_syncer_events),
+    Scenario('ssm_stream_replicator', 'functions.ssm_stream_replicator',
+             f"{STREAM_EVENTS} source updates fanning out to their replication configs",
+             ssm_stream_replicator_events),
+    Scenario('dynamo_stream_replicator', 'functions.dynamo_stream_replicator',
+             f"{DYNAMO_STREAM_RECORDS} replication config edits in stream batches of {DYNAMO_STREAM_BATCH_SIZE}",
+             dynamo_stream_replicator_events),
+    Scenario('config_cache_syncer', 'functions.config_cache_syncer',
+             f"Cache reconcile against {CACHE_PARAMS} parameters", config_cache_syncer_events),
+    Scenario('config_auditor', 'functions.config_auditor',
+             f"{AUDIT_EVENTS} put / delete events", config_auditor_events),
+]
+
+
+def run(scenario: Scenario, scale: float, faults: Faults, ssm_rate: float, seed: int) -> Result:
+    env = Environment(faults)
+    env.install(ssm_rate)
+    rng = random.Random(seed)
+    result = Result(scenario=scenario.name, scale=scale)
+
+    if scenario.handler in sys.modules:
+        handler = importlib.reload(sys.modules[scenario.handler])
+    else:
+        handler = importlib.import_module(scenario.handler)
+
+    events = iter(scenario.seed(env, scale, rng))
+    # The first event is generated up front so seeding is left out of the measurement.
+    pending = [next(events)]
+    env.reset_counters()
+
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            while pending:
+                handler.handle(pending.pop(), None)
+                result.invocations += 1
+                pending.extend([event for event in [next(events, None)] if event is not None])
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+        finally:
+            result.wall_time = round(time.perf_counter() - start, 3)
+            result.peak_memory_mb = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+            tracemalloc.stop()
+
+    result.calls = env.calls()
+    result.total_calls = sum(result.calls.values())
+    result.read_units = round(sum(table.read_units for table in env.tables), 1)
+    result.write_units = round(sum(table.write_units for table in env.tables), 1)
+    result.throttles = faults.throttles
+    return result
+
+
+def regressions(result: Result, baseline: Dict, tolerances: Dict[str, float]) -> List[str]:
+    found = []
+    checks = [('wall_time', 'time'), ('total_calls', 'calls'), ('read_units', 'capacity'), ('write_units', 'capacity'),
+              ('peak_memory_mb', 'memory')]
+    for metric, tolerance in checks:
+        before, after = baseline.get(metric), getattr(result, metric)
+        if before and after > before * (1 + tolerances[tolerance]):
+            found.append(f"{metric} {before} -> {after} (+{(after / before - 1) * 100:.0f}%)")
+
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for figgy's lambda handlers.")
+    parser.add_argument('scenarios', nargs='*', help=f"Scenarios to run, default all of: "
+                                                     f"{', '.join(scenario.name for scenario in SCENARIOS)}")
+    parser.add_argument('--scale', type=float, default=1.0, help="Multiplier for every scenario size.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Latency added to every AWS API call.")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Share of AWS API calls that are throttled.")
+    parser.add_argument('--ssm-rate', type=float, default=UNTHROTTLED_SSM_RATE,
+                        help="SsmDao rate limit in calls / second. Pass 40 to pace calls like in a lambda.")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true', help="Store these results as the new baseline.")
+    parser.add_argument('--time-tolerance', type=float, default=DEFAULT_TIME_TOLERANCE)
+    parser.add_argument('--calls-tolerance', type=float, default=DEFAULT_CALLS_TOLERANCE)
+    parser.add_argument('--capacity-tolerance', type=float, default=DEFAULT_CAPACITY_TOLERANCE,
+                        help="Allowed growth of consumed DynamoDB read and write units.")
+    parser.add_argument('--memory-tolerance', type=float, default=DEFAULT_MEMORY_TOLERANCE)
+    parser.add_argument('--verbose', action='store_true', help="Print per API call counts.")
+    args = parser.parse_args()
+
+    selected = [scenario for scenario in SCENARIOS if not args.scenarios or scenario.name in args.scenarios]
+    unknown = set(args.scenarios) - set(scenario.name for scenario in SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    if args.update_baseline and (args.latency_ms or args.throttle_rate):
+        parser.error("Baselines are recorded without latency or throttling injection.")
+
+    logging.disable(logging.WARNING)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    tolerances = {'time': args.time_tolerance, 'calls': args.calls_tolerance, 'capacity': args.capacity_tolerance,
+                  'memory': args.memory_tolerance}
+    injecting = args.latency_ms or args.throttle_rate
+    results, failed = [], False
+    print(f"{'scenario':<24}{'wall s':>9}{'calls':>9}{'RCU':>10}{'WCU':>10}{'throttles':>11}{'peak MB':>10}")
+    for scenario in selected:
+        faults = Faults(latency=args.latency_ms / 1000, throttle_rate=args.throttle_rate, seed=args.seed)
+        result = run(scenario, args.scale, faults, args.ssm_rate, args.seed)
+        results.append(result)
+        print(f"{result.scenario:<24}{result.wall_time:>9.2f}{result.total_calls:>9}{result.read_units:>10.1f}"
+              f"{result.write_units:>10.1f}{result.throttles:>11}{result.peak_memory_mb:>10.1f}")
+
+        if args.verbose:
+            for call, count in result.calls.items():
+                print(f"    {call:<50}{count:>9}")
+
+        if result.error:
+            failed = True
+            print(f"    FAILED: {result.error}")
+
+        previous = baseline.get(scenario.name)
+        if previous and not injecting and previous.get('scale') == args.scale and not args.update_baseline:
+            for regression in regressions(result, previous, tolerances):
+                failed = True
+                print(f"    REGRESSION: {regression}")
+
+    if args.update_baseline:
+        baseline.update(dict((result.scenario, asdict(result)) for result in results if not result.error))
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+        print(f"Baseline written to {args.baseline}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Runs the SlackService against a local HTTP stand-in for the Slack webhook and compares the time a replication run
+spends notifying with one blocking post per replicated fig (the old approach). The stand-in adds a fixed latency to
+every request and rate limits the first few with a 429 and a Retry-After, to exercise the retry path.
+
+Run from terraform/lambdas:  python -m benchmarks.slack_notifier [replications] [latency_ms] [throttled]
+"""
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import urllib3
+
+from config.constants import REPL_TYPE_APP
+from lib.models.replication_config import ReplicationConfig, ReplicationType
+from lib.models.run_env import RunEnv
+from lib.models.slack import FigReplicationMessage, SimpleSlackMessage, SlackColor
+from lib.svcs.slack import SlackService
+
+DEFAULT_REPLICATIONS = 300
+DEFAULT_LATENCY_MS = 20
+DEFAULT_THROTTLED = 2
+
+
+class FakeWebhook(ThreadingHTTPServer):
+    def __init__(self, latency: float, throttled: int):
+        super().__init__(('127.0.0.1', 0), FakeWebhookHandler)
+        self.latency = latency
+        self.throttled = throttled
+        self.requests = 0
+        self.accepted = []
+        self.connections = set()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/webhook"
+
+
+class FakeWebhookHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server: FakeWebhook = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(server.latency)
+
+        with server.lock:
+            server.requests += 1
+            server.connections.add(self.client_address)
+            throttle = server.throttled > 0
+            if throttle:
+                server.throttled -= 1
+            else:
+                server.accepted.append(json.loads(body))
+
+        if throttle:
+            self.send_response(429)
+            self.send_header('Retry-After', '1')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+def replication(i: int) -> FigReplicationMessage:
+    config = ReplicationConfig(destination=f"/app/service-{i}/replicated/shared-secret", run_env=RunEnv("dev"),
+                               namespace="/app/service/", source=f"/shared/secrets/secret-{i}",
+                               type=ReplicationType(REPL_TYPE_APP), user="benchmark")
+    return FigReplicationMessage(replication_cfg=config, triggering_user="benchmark")
+
+
+def run_blocking(url: str, replications: int) -> float:
+    start = time.time()
+    for i in range(replications):
+        # A fresh connection per post, as the vendored requests.post did.
+        urllib3.PoolManager().request('POST', url, body=json.dumps(replication(i).slack_format()),
+                                      headers={'Content-Type': 'application/json'})
+    return time.time() - start
+
+
+def run_service(url: str, replications: int) -> (float, float):
+    slack = SlackService(webhook_url=url)
+    start = time.time()
+    for i in range(replications):
+        slack.send_message(replication(i))
+    slack.send_message(SimpleSlackMessage(title="Benchmark", message="Done.", color=SlackColor.GREEN))
+    enqueued = time.time() - start
+    assert slack.flush(), "Messages were left unsent."
+    return enqueued, time.time() - start
+
+
+def main(replications: int, latency_ms: int, throttled: int):
+    blocking = FakeWebhook(latency_ms / 1000, throttled=0)
+    threading.Thread(target=blocking.serve_forever, daemon=True).start()
+    blocking_time = run_blocking(blocking.url, replications)
+    blocking.shutdown()
+
+    pooled = FakeWebhook(latency_ms / 1000, throttled=throttled)
+    threading.Thread(target=pooled.serve_forever, daemon=True).start()
+    enqueued, flushed = run_service(pooled.url, replications)
+    pooled.shutdown()
+
+    assert len(pooled.accepted) == 2, f"Expected a digest and one other message, got {len(pooled.accepted)}."
+    print(f"{replications} replications, {latency_ms}ms webhook latency, first {throttled} requests throttled")
+    print(f"  blocking post per fig:  {blocking_time:>7.2f}s  {blocking.requests:>4} requests  "
+          f"{len(blocking.connections):>4} connections")
+    print(f"  SlackService:           {flushed:>7.2f}s  {pooled.requests:>4} requests  "
+          f"{len(pooled.connections):>4} connections  ({enqueued * 1000:.1f}ms in send_message)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_REPLICATIONS,
+         int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_LATENCY_MS,
+         int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_THROTTLED)
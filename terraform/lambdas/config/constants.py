@@ -11,6 +11,27 @@ REPL_TYPE_ATTR_NAME = "type"
 REPL_TYPE_APP = 'app'
 REPL_TYPE_MERGE = 'merge'
 REPL_USER_ATTR_NAME = 'user'
+REPL_SOURCE_KEY_ATTR_NAME = 'source_key'  # Scalar copy of `source` on app configs, the source-index GSI hash key.
+REPL_SOURCE_INDEX_NAME = 'source-index'
+REPL_INDEX_STATUS_TTL = 60 * 5  # Seconds to wait before re-checking an index that is still being built.
+REPL_SYNC_MAX_WORKERS = 10
+REPL_SYNC_BATCH_SIZE = 250  # App configs synced per batch by the replication syncer while the table is still scanned
+
+# Merge reference index table - maps each PS name referenced by a merge config to that config.
+REPL_REFS_TABLE_NAME = "figgy-config-repl-merge-refs"
+REPL_REFS_REFERENCE_KEY_NAME = "reference"
+REPL_REFS_REFERENCE_INDEX_NAME = "reference-index"
+
+# Replication lag table - a rolling window of end to end replication lag samples per destination.
+REPL_LAG_TABLE_NAME = "figgy-config-repl-lag"
+REPL_LAG_INDEX_NAME = "lag-index"
+REPL_LAG_PARTITION_ATTR_NAME = "lag_partition"  # lag-index hash key, REPL_LAG_PARTITION-<shard of the destination>
+REPL_LAG_PARTITION = "lag"
+REPL_LAG_PARTITION_SHARDS = 10
+REPL_LAG_ROLLING_ATTR_NAME = "rolling_lag"  # P90 of the window, in MS. The lag-index range key.
+REPL_LAG_EXPIRES_AT_ATTR_NAME = "expires_at"  # DynamoDB TTL attribute, seconds since epoch
+REPL_LAG_WINDOW = 20  # Most recent samples kept per destination
+REPL_LAG_RETENTION = 60 * 60 * 24 * 30  # 30 days in seconds, destinations not replicated since then expire
 
 # Config cache table
 CONFIG_CACHE_TABLE_NAME = "figgy-config-cache"
@@ -19,6 +40,15 @@ CONFIG_CACHE_STATE_ATTR_NAME = "state"
 CONFIG_CACHE_LAST_UPDATED_KEY = "last_updated"
 CONFIG_CACHE_STATE_DELETED = 'DELETED'
 CONFIG_CACHE_STATE_ACTIVE = 'ACTIVE'
+CONFIG_CACHE_TOMBSTONE_ATTR_NAME = "tombstone"  # Only set on DELETED items, hash key of the sparse tombstone-index
+CONFIG_CACHE_TOMBSTONE_INDEX_NAME = "tombstone-index"
+CONFIG_CACHE_EXPIRES_AT_ATTR_NAME = "expires_at"  # DynamoDB TTL attribute, seconds since epoch
+CONFIG_CACHE_TOMBSTONE_MAX_AGE = 60 * 60 * 24 * 14  # 2 weeks in seconds
+CONFIG_CACHE_WRITTEN_AT_ATTR_NAME = "written_at"  # When the item was written, millis since epoch. changes-index range key
+CONFIG_CACHE_TIME_BUCKET_ATTR_NAME = "time_bucket"  # written_at / CONFIG_CACHE_TIME_BUCKET_SIZE, hash key of changes-index
+CONFIG_CACHE_TIME_BUCKET_SIZE = 60 * 60 * 24 * 1000  # 1 day in MS
+CONFIG_CACHE_CHANGES_INDEX_NAME = "changes-index"
+CONFIG_CACHE_CHANGES_PAGE_SIZE = 1000
 
 # Audit table
 AUDIT_TABLE_NAME = "figgy-config-auditor"
@@ -31,6 +61,16 @@ AUDIT_TYPE_ATTR = "type"
 AUDIT_KEYID_ATTR = "key_id"
 AUDIT_DESCRIPTION_ATTR = "description"
 AUDIT_VERSION_ATTR = "version"
+AUDIT_EXPIRES_AT_ATTR = "expires_at"  # DynamoDB TTL attribute, seconds since epoch. Only set on test records.
+AUDIT_TIME_BUCKET_ATTR = "time_bucket"  # time / AUDIT_TIME_BUCKET_SIZE, hash key of the time-index
+AUDIT_TIME_BUCKET_SIZE = 60 * 60 * 24 * 1000  # 1 day in MS
+AUDIT_TIME_INDEX_NAME = "time-index"
+AUDIT_USER_INDEX_NAME = "user-index"
+AUDIT_QUERY_PAGE_SIZE = 100
+# SHA-256 hex digest of an offloaded value, set instead of `value`. The value is stored zlib compressed at
+# s3://<deploy_bucket>/BLOB_S3_PREFIX<value_ref>, encrypted with the replication key.
+AUDIT_VALUE_REF_ATTR = "value_ref"
+AUDIT_VALUE_OFFLOAD_THRESHOLD = 1024  # bytes, larger values are offloaded to the blob store
 
 # Generic
 PUT_PARAM_ACTION = "PutParameter"
@@ -44,8 +84,50 @@ ACCOUNT_ENV_PS_PATH = "/figgy/env_alias"
 NOTIFY_DELETES_PS_PATH = "/figgy/integrations/slack/notify-deletes"
 FIGGY_WEBHOOK_URL_PATH = "/figgy/integrations/slack/webhook-url"
 FIGGY_NAMESPACES_PATH = "/figgy/namespaces"
+FIGGY_DEPLOY_BUCKET_PS_PATH = "/figgy/deploy_bucket"
+
+# PS read cache used by the replication lambdas. Only figgy's own settings are cached, replicated values are always
+# read fresh so concurrently running replicators never write stale data.
+FIGGY_SETTINGS_PREFIX = "/figgy/"
+FIGGY_SETTINGS_CACHE_TTL = 60 * 5
+
+# One-off data migrations are marked complete by a PS parameter under this prefix, loaded with the rest of the settings
+FIGGY_MIGRATIONS_PREFIX = "/figgy/migrations/"
+REPL_SOURCE_INDEX_MIGRATION = "repl-source-index"  # Every pre-existing app config carries `source_key`
+AUDIT_TEST_EXPIRY_MIGRATION = "audit-test-expiry"  # Test records written before TTL was set on them expire
+AUDIT_TIME_BUCKET_MIGRATION = "audit-time-bucket"  # Every pre-existing audit record is in the time-index
+MIGRATION_TIME_MARGIN = 60  # seconds, backfills stop this long before the invocation would time out
+
+# Config snapshots, compacted checkpoints of the audit log stored in the figgy deploy bucket
+SNAPSHOT_S3_PREFIX = "figgy/snapshots/"
+# Audit records land up to AUDIT_DELIVERY_ALLOWANCE (CloudTrail -> EventBridge delivery) plus AUDIT_MAX_EVENT_AGE (the
+# maximum_event_age_in_seconds of the auditor's async invocations, see lambda_config_auditor.tf) after their eventTime.
+# Checkpoints replay by eventTime and stop this far back, so every record they cover has been written.
+AUDIT_DELIVERY_ALLOWANCE = 60 * 15  # seconds
+AUDIT_MAX_EVENT_AGE = 60 * 60  # seconds
+SNAPSHOT_SETTLE_TIME = (AUDIT_DELIVERY_ALLOWANCE + AUDIT_MAX_EVENT_AGE) * 1000  # MS
+SNAPSHOT_LOOKBACK = 60 * 60 * 24 * 2 * 1000  # 2 days in MS, checkpoints are daily so the nearest one is within this
+# Snapshots are built, stored and loaded whole in the snapshotter's memory (memory_size in lambda_config_snapshotter.tf).
+# Values over AUDIT_VALUE_OFFLOAD_THRESHOLD are only referenced, so this is roughly 100k parameters.
+SNAPSHOT_MAX_SIZE = 100 * 1024 * 1024  # bytes of uncompressed JSON
+
+# Content-addressed store for large audit values, also in the figgy deploy bucket
+BLOB_S3_PREFIX = "figgy/blobs/"
+
+# Slack notifications, sent from a background worker and flushed before each handler returns
+SLACK_QUEUE_SIZE = 100
+SLACK_CONNECT_TIMEOUT = 2  # seconds
+SLACK_READ_TIMEOUT = 5  # seconds
+SLACK_MAX_RETRIES = 3
+SLACK_MAX_RETRY_AFTER = 30  # seconds, longest Slack Retry-After we will wait out
+SLACK_FLUSH_TIMEOUT = 60  # seconds
+SLACK_FLUSH_MARGIN = 3  # seconds left before the lambda times out when flush stops waiting
+SLACK_DIGEST_MAX_LINES = 40  # replications listed in a digest message before it is truncated
+
+# CloudWatch namespace of the per invocation metrics every handler emits in embedded metric format
+METRICS_NAMESPACE = "Figgy"
 
 # For PS items stored with this value, we will auto-clean them up. Used for automated E2E testing.
 DELETE_ME_VALUE = 'DELETE_ME'
 CIRCLECI_USER_NAME = 'circleci'
-TEST_VALUE_KEEP_TIME = 10
+TEST_VALUE_KEEP_TIME = 10  # minutes
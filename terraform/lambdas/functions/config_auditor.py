@@ -2,50 +2,41 @@ import random
 import time
 from datetime import datetime
 
-import boto3
 import time
 import logging
 from config.constants import *
 from lib.models.replication_config import ReplicationConfig
 from lib.data.dynamo.audit_dao import AuditDao
+from lib.data.s3.blob_store import S3BlobStore
 from lib.data.ssm import SsmDao
 from lib.models.slack import FigDeletedMessage, SlackColor, SimpleSlackMessage
 from lib.svcs.slack import SlackService
+from lib.utils import bootstrap
+from lib.utils.bootstrap import settings
+from lib.utils.metrics import metrics
 from lib.utils.utils import Utils
 
 log = Utils.get_logger(__name__, logging.INFO)
 
-dynamo_resource = boto3.resource("dynamodb")
-audit: AuditDao = AuditDao(dynamo_resource)
-ssm_client = boto3.client('ssm')
-ssm = SsmDao(ssm_client)
-webhook_url = ssm.get_parameter_value(FIGGY_WEBHOOK_URL_PATH)
-slack: SlackService = SlackService(webhook_url=webhook_url)
-
-ACCOUNT_ID = ssm.get_parameter_value(ACCOUNT_ID_PS_PATH)
-ACCOUNT_ENV = ssm.get_parameter_value(ACCOUNT_ENV_PS_PATH)
-NOTIFY_DELETES = ssm.get_parameter_value(NOTIFY_DELETES_PS_PATH)
-NOTIFY_DELETES = NOTIFY_DELETES.lower() == "true" if NOTIFY_DELETES else False
-
-FIGGY_NAMESPACES = ssm.get_parameter_value(FIGGY_NAMESPACES_PATH)
-CLEANUP_INTERVAL = 60 * 60  # Cleanup hourly
-LAST_CLEANUP = 0
+ssm = SsmDao(bootstrap.client('ssm'))
+blob_store = S3BlobStore(bootstrap.client('s3'), bucket=settings.deploy_bucket, kms_key_id=settings.replication_key_id)
+audit: AuditDao = AuditDao(bootstrap.resource('dynamodb'), blob_store=blob_store)
+slack: SlackService = SlackService(webhook_url=settings.webhook_url)
 
 
 def notify_delete(ps_name: str, user: str):
-    if NOTIFY_DELETES:
+    if settings.notify_deletes:
         slack.send_message(
-            FigDeletedMessage(name=ps_name, user=user, environment=ACCOUNT_ENV)
+            FigDeletedMessage(name=ps_name, user=user, environment=settings.account_env)
         )
 
 
+@metrics.handler('figgy-config-auditor')
 def handle(event, context):
-    global LAST_CLEANUP
-
     # Don't process other account's events.
     originating_account = event.get('account')
-    if originating_account != ACCOUNT_ID:
-        log.info(f"Received event from different account with id: {ACCOUNT_ID}. Skipping this event.")
+    if originating_account != settings.account_id:
+        log.info(f"Received event from different account with id: {settings.account_id}. Skipping this event.")
         return
 
     try:
@@ -75,45 +66,51 @@ def handle(event, context):
         else:
             event_time = int(time.time() * 1000)
 
+        delay = int(time.time() * 1000) - event_time
+        metrics.observe('AuditDelay', delay)
+        if delay > SNAPSHOT_SETTLE_TIME:
+            log.warning(f"Auditing a {action} from {delay}ms ago, past SNAPSHOT_SETTLE_TIME. Config snapshots taken "
+                        f"since {event_time} do not include it, delete them to have the next checkpoint rebuild.")
+
         log.info(f"Got user: {user}, action: {action} for parameter(s) {ps_names}")
 
-        for ps_name in ps_names:
-            ps_name = f'/{ps_name}' if not ps_name.startswith('/') else ps_name
-
-            if action == DELETE_PARAM_ACTION or action == DELETE_PARAMS_ACTION:
-                audit.put_delete_log(user, action, ps_name, timestamp=event_time)
-                notify_delete(ps_name, user)
-            elif action == PUT_PARAM_ACTION:
-                ps_value = request_params.get("value")
-                ps_type = request_params.get("type")
-                ps_description = request_params.get("description")
-                ps_version = detail.get("responseElements", {}).get("version", 1)
-                ps_key_id = request_params.get("keyId")
-
-                if not ps_value:
-                    ps_value = ssm.get_parameter_value(ps_name)
-
-                audit.put_audit_log(
-                    user,
-                    action,
-                    ps_name,
-                    ps_value,
-                    ps_type,
-                    ps_key_id,
-                    ps_description,
-                    ps_version,
-                    timestamp=event_time,
-                )
-            else:
-                log.info(f"Unsupported action type found! --> {action}")
-
-        # This will occassionally cleanup parameters with the explict value of DELETE_ME.
-        # Great for testing and adding PS parameters
-        # you don't want to be restored later on.
-        if time.time() - CLEANUP_INTERVAL > LAST_CLEANUP:
-            log.info("Cleaning up.")
-            audit.cleanup_test_logs()
-            LAST_CLEANUP = time.time()
+        # Records are buffered and flushed as BatchWriteItem requests when the writer closes, before anyone is
+        # notified of the deletes.
+        deleted = []
+        with audit.batch_writer() as writer:
+            for ps_name in ps_names:
+                ps_name = f'/{ps_name}' if not ps_name.startswith('/') else ps_name
+
+                if action == DELETE_PARAM_ACTION or action == DELETE_PARAMS_ACTION:
+                    audit.put_delete_log(user, action, ps_name, timestamp=event_time, writer=writer)
+                    deleted.append(ps_name)
+                elif action == PUT_PARAM_ACTION:
+                    ps_value = request_params.get("value")
+                    ps_type = request_params.get("type")
+                    ps_description = request_params.get("description")
+                    ps_version = detail.get("responseElements", {}).get("version", 1)
+                    ps_key_id = request_params.get("keyId")
+
+                    if not ps_value:
+                        ps_value = ssm.get_parameter_value(ps_name)
+
+                    audit.put_audit_log(
+                        user,
+                        action,
+                        ps_name,
+                        ps_value,
+                        ps_type,
+                        ps_key_id,
+                        ps_description,
+                        ps_version,
+                        timestamp=event_time,
+                        writer=writer,
+                    )
+                else:
+                    log.info(f"Unsupported action type found! --> {action}")
+
+        for ps_name in deleted:
+            notify_delete(ps_name, user)
 
     except Exception as e:
         log.error(e)
@@ -129,6 +126,8 @@ def handle(event, context):
         )
         slack.send_message(message)
         raise e
+    finally:
+        slack.flush(deadline=Utils.deadline(context, SLACK_FLUSH_MARGIN))
 
 
 if __name__ == "__main__":
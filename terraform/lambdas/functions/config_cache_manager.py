@@ -1,32 +1,27 @@
-from typing import Set
-
-import boto3
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
 import time
-from lib.data.ssm import SsmDao
 from lib.models.slack import SimpleSlackMessage, SlackColor
 from lib.svcs.slack import SlackService
+from lib.utils import bootstrap
+from lib.utils.bootstrap import settings
+from lib.utils.metrics import metrics
 from lib.utils.utils import Utils
 from config.constants import *
-from lib.data.dynamo.config_cache_dao import ConfigCacheDao, ConfigItem
+from lib.data.dynamo.config_cache_dao import ConfigCacheDao
 
 log = Utils.get_logger(__name__, logging.INFO)
 
-dynamo_resource = boto3.resource("dynamodb")
-ssm_client = boto3.client('ssm')
-ssm = SsmDao(ssm_client)
-
-webhook_url = ssm.get_parameter_value(FIGGY_WEBHOOK_URL_PATH)
-slack: SlackService = SlackService(webhook_url=webhook_url)
-ACCOUNT_ID = ssm.get_parameter_value(ACCOUNT_ID_PS_PATH)
+dynamo_resource = bootstrap.resource("dynamodb")
+slack: SlackService = SlackService(webhook_url=settings.webhook_url)
 
 
+@metrics.handler('figgy-config-cache-manager')
 def handle(event, context):
     # Don't process other account's events.
     originating_account = event.get('account')
-    if originating_account != ACCOUNT_ID:
-        log.info(f"Received event from different account with id: {ACCOUNT_ID}. Skipping this event.")
+    if originating_account != settings.account_id:
+        log.info(f"Received event from different account with id: {settings.account_id}. Skipping this event.")
         return
 
     try:
@@ -40,11 +35,12 @@ def handle(event, context):
 
         event_time = detail.get('eventTime')
 
-        # Convert to millis since epoch
-        # if event_time:
-        #     event_time = int(datetime.strptime(event_time, "%Y-%m-%dT%H:%M:%SZ").timestamp() * 1000)
-        # else:
-        #     event_time = int(time.time() * 1000)
+        # Convert to millis since epoch. The cache is last-writer-wins by event time, not by when we process it.
+        if event_time:
+            event_time = int(datetime.strptime(event_time, "%Y-%m-%dT%H:%M:%SZ")
+                             .replace(tzinfo=timezone.utc).timestamp() * 1000)
+        else:
+            event_time = int(time.time() * 1000)
 
         if not ps_name:
             log.info(f"Received an event missing parameterStore path: {event}")
@@ -52,21 +48,15 @@ def handle(event, context):
 
         if action == DELETE_PARAM_ACTION or action == DELETE_PARAMS_ACTION:
             log.info(f"Deleting from cache: {ps_name}")
-            items: Set[ConfigItem] = cache_dao.get_items(ps_name)
-            if items:
-                sorted_items = sorted(items)
-                [cache_dao.delete(item) for item in sorted_items[:-1]]  # Delete all but the most recent item.
-                cache_dao.mark_deleted(sorted_items[-1])
+            cache_dao.apply_event(ps_name, CONFIG_CACHE_STATE_DELETED, event_time)
         elif action == PUT_PARAM_ACTION:
-            items: Set[ConfigItem] = cache_dao.get_items(ps_name)
-            [cache_dao.delete(item) for item in items]  # If any stragglers exist, get rid of em
             log.info(f"Putting in cache: {ps_name}")
-            cache_dao.put_in_cache(ps_name)
+            cache_dao.apply_event(ps_name, CONFIG_CACHE_STATE_ACTIVE, event_time)
         else:
             log.info(f"Unsupported action type found! --> {action}")
     except Exception as e:
         log.error(e)
-        title = f"Figgy experienced an irrecoverable error! In account: {ACCOUNT_ID[0:5]}[REDACTED]"
+        title = f"Figgy experienced an irrecoverable error! In account: {settings.account_id[0:5]}[REDACTED]"
         message = f"The following error occurred in an the figgy-config-cache-manager lambda. "
         f"If this appears to be a bug with figgy, please tell us by submitting a GitHub issue!"
         f" \n\n{Utils.printable_exception(e)}"
@@ -77,6 +67,8 @@ def handle(event, context):
         )
         slack.send_message(message)
         raise e
+    finally:
+        slack.flush(deadline=Utils.deadline(context, SLACK_FLUSH_MARGIN))
 
 
 if __name__ == "__main__":
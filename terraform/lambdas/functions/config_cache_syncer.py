@@ -1,65 +1,93 @@
-from typing import List, Set
+from typing import Dict, List, Set
 
-import boto3
 import logging
-import time
-import json
 from config.constants import *
-from lib.data.dynamo.config_cache_dao import ConfigCacheDao, ConfigItem, ConfigState
+from lib.data.dynamo.batch_writer import BatchWriter
+from lib.data.dynamo.config_cache_dao import ConfigCacheDao, ConfigItem, ConfigState, CONFIG_ITEM_ATTRIBUTES, \
+    INDEX_ATTRIBUTES
 from lib.data.ssm.ssm import SsmDao
 from lib.models.slack import SimpleSlackMessage, SlackColor
 from lib.svcs.slack import SlackService
+from lib.utils import bootstrap
+from lib.utils.bootstrap import settings
+from lib.utils.metrics import metrics
 from lib.utils.utils import Utils
 
-dynamo_resource = boto3.resource("dynamodb")
-ssm_client = boto3.client('ssm')
-ssm_dao = SsmDao(ssm_client)
+dynamo_resource = bootstrap.resource("dynamodb")
+ssm_dao = SsmDao(bootstrap.client('ssm'))
 cache_dao: ConfigCacheDao = ConfigCacheDao(dynamo_resource)
 log = Utils.get_logger(__name__, logging.INFO)
-MAX_DELETED_AGE = 60 * 60 * 24 * 14 * 1000  # 2 weeks in MS
 
-webhook_url = ssm_dao.get_parameter_value(FIGGY_WEBHOOK_URL_PATH)
-namespaces = json.loads(ssm_dao.get_parameter_value(FIGGY_NAMESPACES_PATH))
-slack: SlackService = SlackService(webhook_url=webhook_url)
+slack: SlackService = SlackService(webhook_url=settings.webhook_url)
 
 
-def remove_old_deleted_items():
+def reindex_legacy_items(legacy_items: List[ConfigItem], writer: BatchWriter):
     """
-    Cleanup items marked as DELETED that are > MAX_AGE old
+    Items written before the changes-index and tombstone-index existed lack the attributes that place them in those
+    indexes and give tombstones an expiry. Rewrite them so they become visible to the indexes.
     """
-    deleted_items: Set[ConfigItem] = cache_dao.get_deleted_configs()
-    for item in deleted_items:
-        if int(time.time() * 1000) - item.last_updated > MAX_DELETED_AGE:
-            log.info(f"Item: {item.name} is older than {MAX_DELETED_AGE / 1000}"
-                     f" seconds and is marked deleted. Removing from cache...")
-            cache_dao.delete(item)
+    for item in legacy_items:
+        cache_dao.put_in_cache(item.name, state=item.state.name, timestamp=item.last_updated, writer=writer)
 
+    if legacy_items:
+        log.info(f"Reindexed {len(legacy_items)} legacy cache items.")
 
+
+@metrics.handler('figgy-config-cache-syncer')
 def handle(event, context):
     try:
-        param_names = ssm_dao.get_all_param_names(namespaces)
-        cached_configs: Set[ConfigItem] = cache_dao.get_active_configs()
-        cached_names = set([config.name for config in cached_configs])
-        missing_params: Set[str] = param_names.difference(cached_names)
-        names_to_delete: Set[str] = cached_names.difference(param_names)
-
-        for param in missing_params:
-            log.info(f"Storing in cache: {param}")
-            items: Set[ConfigItem] = cache_dao.get_items(param)
-            cache_dao.put_in_cache(param)
-            [cache_dao.delete(item) for item in items]  # If any dupes exist, get rid of em
-
-        for param in names_to_delete:
-            items: Set[ConfigItem] = cache_dao.get_items(param)
-            sorted_items = sorted(items)
-            [cache_dao.delete(item) for item in sorted_items[:-1]]  # Delete all but the most recent item.
-
-            # Double check that item is missing before deleting in case it was just added.
-            if not ssm_dao.get_parameter_value(param):
-                log.info(f"Deleting from cache: {param}")
-                cache_dao.mark_deleted(sorted_items[-1])
-
-        remove_old_deleted_items()
+        with metrics.phase('ScanCache'):
+            # One full read of the cache serves every lookup below, including duplicate detection.
+            cached_items: Dict[str, List[ConfigItem]] = {}
+            legacy_items: List[ConfigItem] = []
+            for raw_item in cache_dao.scan_items(attributes=CONFIG_ITEM_ATTRIBUTES + INDEX_ATTRIBUTES):
+                item = ConfigItem.from_dict(raw_item)
+                cached_items.setdefault(item.name, []).append(item)
+                if cache_dao.needs_reindex(raw_item):
+                    legacy_items.append(item)
+
+            for items in cached_items.values():
+                items.sort()
+
+            cached_names = set([name for name, items in cached_items.items()
+                                if any(item.state == ConfigState.ACTIVE for item in items)])
+
+        with cache_dao.batch_writer() as writer:
+            # Runs first so that any deletes issued by the reconcile below supersede these rewrites.
+            reindex_legacy_items(legacy_items, writer)
+
+            # Diff against PS while it is still being enumerated. Anything left in names_to_delete afterwards is gone.
+            with metrics.phase('Reconcile'):
+                names_to_delete: Set[str] = set(cached_names)
+                stored: Set[str] = set()
+                for param in ssm_dao.iter_param_names(settings.namespaces):
+                    if param in cached_names:
+                        names_to_delete.discard(param)
+                        # Keep only the most recent active item if dupes exist.
+                        active = [item for item in cached_items[param] if item.state == ConfigState.ACTIVE]
+                        [cache_dao.delete(item, writer=writer) for item in cached_items[param] if item != active[-1]]
+                    elif param not in stored:
+                        log.info(f"Storing in cache: {param}")
+                        cache_dao.put_in_cache(param, writer=writer)
+                        # If any dupes exist, get rid of em
+                        [cache_dao.delete(item, writer=writer) for item in cached_items.get(param, [])]
+                        stored.add(param)
+
+            # Double check that items are missing before deleting in case they were just added.
+            with metrics.phase('VerifyDeletes'):
+                still_present = ssm_dao.get_parameters_batch(names_to_delete)
+                for param in names_to_delete:
+                    sorted_items = cached_items[param]
+                    # Delete all but the most recent item.
+                    [cache_dao.delete(item, writer=writer) for item in sorted_items[:-1]]
+
+                    if not still_present.get(param):
+                        log.info(f"Deleting from cache: {param}")
+                        cache_dao.mark_deleted(sorted_items[-1], writer=writer)
+
+        log.info(f"Cache reconciled with {writer.written} writes in {writer.requests} batch requests.")
+
+        log.info(f"SSM rate limiter stats: {ssm_dao.rate_limiter.stats()}")
 
     except Exception as e:
         log.error(e)
@@ -76,6 +104,8 @@ def handle(event, context):
         slack.send_message(message)
 
         raise e
+    finally:
+        slack.flush(deadline=Utils.deadline(context, SLACK_FLUSH_MARGIN))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,78 @@
+import logging
+from dataclasses import asdict
+
+from config.constants import *
+from lib.data.dynamo.audit_dao import AuditDao
+from lib.data.s3.blob_store import S3BlobStore
+from lib.data.s3.snapshot_dao import Snapshot, SnapshotDao
+from lib.data.ssm.ssm import SsmDao
+from lib.models.slack import SimpleSlackMessage, SlackColor
+from lib.svcs.slack import SlackService
+from lib.svcs.snapshot import SnapshotService, RestoreResult
+from lib.utils import bootstrap
+from lib.utils.bootstrap import settings
+from lib.utils.metrics import metrics
+from lib.utils.utils import Utils
+
+log = Utils.get_logger(__name__, logging.INFO)
+
+ssm = SsmDao(bootstrap.client('ssm'))
+s3_client = bootstrap.client('s3')
+audit = AuditDao(bootstrap.resource('dynamodb'),
+                 blob_store=S3BlobStore(s3_client, settings.deploy_bucket, settings.replication_key_id))
+snapshot_dao = SnapshotDao(s3_client, bucket=settings.deploy_bucket, kms_key_id=settings.replication_key_id)
+snapshots = SnapshotService(audit, snapshot_dao, ssm)
+
+slack: SlackService = SlackService(webhook_url=settings.webhook_url)
+
+# One-off audit table migrations, run after the scheduled checkpoint until each of them completes.
+AUDIT_MIGRATIONS = [
+    (AUDIT_TEST_EXPIRY_MIGRATION, audit.backfill_test_expiry),
+    (AUDIT_TIME_BUCKET_MIGRATION, audit.backfill_time_buckets),
+]
+
+
+def run_audit_migrations(context) -> None:
+    deadline = Utils.deadline(context, MIGRATION_TIME_MARGIN)
+    for migration, backfill in AUDIT_MIGRATIONS:
+        if settings.migrated(migration):
+            continue
+
+        if backfill(deadline=deadline) is None:
+            log.info(f"Migration {migration} did not finish, it continues on the next scheduled run.")
+            return
+
+        settings.mark_migrated(migration)
+
+
+@metrics.handler('figgy-config-snapshotter')
+def handle(event, context):
+    """
+    Scheduled invocations store a new checkpoint. To restore a namespace, invoke with:
+        {"action": "restore", "prefix": "/app/my-service", "as_of": <millis since epoch>, "prune": false}
+    """
+    event = event if event else {}
+    try:
+        if event.get('action') == 'restore':
+            result: RestoreResult = snapshots.restore(int(event['as_of']), event['prefix'],
+                                                      prune=bool(event.get('prune', False)))
+            return asdict(result)
+
+        snapshot: Snapshot = snapshots.create_checkpoint()
+        run_audit_migrations(context)
+        return {"as_of": snapshot.as_of, "parameters": len(snapshot.parameters)}
+    except Exception as e:
+        log.error(e)
+        title = "Figgy experienced an irrecoverable error!"
+        message = f"The following error occurred in an the *figgy-config-snapshotter* lambda. " \
+                  f"If this appears to be a bug with figgy, please tell us by submitting a GitHub issue!" \
+                  f" \n\n```{Utils.printable_exception(e)}```"
+        message = SimpleSlackMessage(title=title, message=message, color=SlackColor.RED)
+        slack.send_message(message)
+        raise e
+    finally:
+        slack.flush(deadline=Utils.deadline(context, SLACK_FLUSH_MARGIN))
+
+
+if __name__ == '__main__':
+    handle(None, None)
@@ -1,20 +1,30 @@
-import boto3
 import logging
+from typing import Dict, List, Optional
+
+from boto3.dynamodb.types import TypeDeserializer
+
 from config.constants import *
-from lib.models.replication_config import ReplicationConfig
+from lib.models.replication_config import ReplicationConfig, ReplicationResult
 from lib.data.dynamo.replication_dao import ReplicationDao
+from lib.data.dynamo.replication_lag_dao import ReplicationLagDao, LagSample
 from lib.data.ssm.ssm import SsmDao
+from lib.data.ssm.cached_ssm import CachedSsmDao
 from lib.models.slack import SlackMessage, SlackColor, FigReplicationMessage, SimpleSlackMessage
 from lib.svcs.replication import ReplicationService
 from lib.svcs.slack import SlackService
+from lib.utils import bootstrap
+from lib.utils.bootstrap import settings
+from lib.utils.metrics import metrics
 from lib.utils.utils import Utils
 
-repl_dao: ReplicationDao = ReplicationDao(boto3.resource('dynamodb'))
-ssm: SsmDao = SsmDao(boto3.client('ssm'))
+repl_dao: ReplicationDao = ReplicationDao(bootstrap.resource('dynamodb'), settings)
+ssm: CachedSsmDao = CachedSsmDao(bootstrap.client('ssm'), ttl=0,
+                                 ttl_overrides={FIGGY_SETTINGS_PREFIX: FIGGY_SETTINGS_CACHE_TTL})
 repl_svc: ReplicationService = ReplicationService(repl_dao, ssm)
-webhook_url = ssm.get_parameter_value(FIGGY_WEBHOOK_URL_PATH)
-slack: SlackService = SlackService(webhook_url=webhook_url)
+lag_dao: ReplicationLagDao = ReplicationLagDao(bootstrap.resource('dynamodb'))
+slack: SlackService = SlackService(webhook_url=settings.webhook_url)
 log = Utils.get_logger(__name__, logging.INFO)
+deserializer = TypeDeserializer()
 
 
 def notify_slack(config: ReplicationConfig):
@@ -22,39 +32,103 @@ def notify_slack(config: ReplicationConfig):
     slack.send_message(message)
 
 
+def notify_error(e: Exception):
+    log.error(e)
+    title = "Figgy Dynamo Stream Replicator experienced and irrecoverable error!"
+    message = f"The following error occurred in an the *figgy-dynamo-stream-replicator* lambda.\n"\
+              f"Figgy is designed to continually backoff and retry in the face of error. \n```{Utils.printable_exception(e)}```"
+    slack.send_message(SimpleSlackMessage(title=title, message=message, color=SlackColor.RED))
+
+
+def latest_records(records: List[Dict]) -> Dict[str, Dict]:
+    """
+    Collapses a batch of stream records to the last record of each destination. Stream records of a single item
+    arrive in order, so the last one holds the destination's current state.
+    """
+    latest: Dict[str, Dict] = {}
+    for record in records:
+        destination = record.get("dynamodb", {}).get("Keys", {}).get(REPL_DEST_KEY_NAME, {}).get("S", None)
+        if destination:
+            latest.pop(destination, None)
+            latest[destination] = record
+
+    return latest
+
+
+def config_from_record(destination: str, record: Dict) -> Optional[ReplicationConfig]:
+    """
+    Builds the config from the record's NewImage. Records written while the stream was still KEYS_ONLY carry no
+    image, their config is read from the table instead.
+    """
+    image = record.get("dynamodb", {}).get("NewImage")
+    if not image:
+        return repl_dao.get_config_repl(destination)
+
+    return ReplicationConfig.from_item(dict((key, deserializer.deserialize(value)) for key, value in image.items()))
+
+
+@metrics.handler('figgy-dynamo-stream-replicator')
 def handle(event, context):
     log.info(f"Got Event: {event} with context {context}")
+    lag_samples: List[LagSample] = []
     try:
-        records = event.get('Records', [])
-        for record in records:
-            event_name = record.get("eventName")
+        records = latest_records(event.get('Records', []))
+        configs: List[ReplicationConfig] = []
+        event_times: Dict[str, int] = {}
+
+        for destination, record in records.items():
             # Only resync on adds / updates, never on deletes.
-            if event_name != 'REMOVE':
-                ddb_record = record.get("dynamodb", {})
-                keys = ddb_record.get("Keys", {})
-                destination = keys.get(REPL_DEST_KEY_NAME, {}).get("S", None)
-
-                if destination:
-                    log.info(f"Record updated with key: {destination}")
-                    config: ReplicationConfig = repl_dao.get_config_repl(destination)
-
-                    if config:
-                        log.info(f"Got config: {config}, syncing...")
-                        repl_svc.sync_config(config) and notify_slack(config)
-                    else:
-                        log.warning(f"Unable to find record with destination: {destination}. This *could* "
-                                    f"indicate a serious issue with replication. If you see lots of these, please pay "
-                                    f"attention.")
+            if record.get("eventName") == 'REMOVE':
+                log.info(f"{destination} was deleted, skipping sync and dropping any merge references.")
+                repl_dao.remove_merge_references(destination)
+                continue
+
+            log.info(f"Record updated with key: {destination}")
+            image = record.get("dynamodb", {}).get("NewImage", {})
+            config: Optional[ReplicationConfig] = config_from_record(destination, record)
+            if not config:
+                log.warning(f"Unable to find record with destination: {destination}. This *could* "
+                            f"indicate a serious issue with replication. If you see lots of these, please pay "
+                            f"attention.")
+                continue
+
+            if config.type == REPL_TYPE_MERGE:
+                repl_dao.index_merge_references(config)
             else:
-                log.info("Event is a delete event, skipping!")
+                repl_dao.remove_merge_references(destination)
+                # No need for the conditional write if the image shows the config is already in the source-index.
+                if image.get(REPL_SOURCE_KEY_ATTR_NAME, {}).get("S") != config.source:
+                    repl_dao.index_source(config)
+
+            configs.append(config)
+            created = record.get("dynamodb", {}).get('ApproximateCreationDateTime')
+            if created:
+                event_times[destination] = int(float(created) * 1000)
+
+        log.info(f"Syncing {len(configs)} configs from {len(event.get('Records', []))} stream records.")
+        results: List[ReplicationResult] = repl_svc.sync_many(configs, max_workers=REPL_SYNC_MAX_WORKERS)
+        for result in results:
+            if result.updated:
+                notify_slack(result.config)
+                destination = result.config.destination
+                destination in event_times and lag_samples.append(
+                    LagSample(destination, trigger='dynamo', event_time=event_times[destination],
+                              completed_at=result.completed_at))
+
+        # Report only the records of failed destinations (ReportBatchItemFailures), Lambda retries the batch from the
+        # earliest of them instead of re-running every destination that already replicated.
+        errors = [result for result in results if result.error]
+        if errors:
+            notify_error(errors[0].error)
+
+        failed = [records[result.config.destination] for result in errors]
+        return {"batchItemFailures": [{"itemIdentifier": record["dynamodb"]["SequenceNumber"]} for record in failed]}
     except Exception as e:
-        log.error(e)
-        title = "Figgy Dynamo Stream Replicator experienced and irrecoverable error!"
-        message = f"The following error occurred in an the *figgy-dynamo-stream-replicator* lambda.\n"\
-                  f"Figgy is designed to continually backoff and retry in the face of error. \n```{Utils.printable_exception(e)}```"
-        message = SimpleSlackMessage(title=title, message=message, color=SlackColor.RED)
-        slack.send_message(message)
+        notify_error(e)
         raise e
+    finally:
+        lag_samples and lag_dao.record(lag_samples)
+        slack.flush(deadline=Utils.deadline(context, SLACK_FLUSH_MARGIN))
 
 
 if __name__ == '__main__':
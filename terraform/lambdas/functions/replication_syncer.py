@@ -1,24 +1,26 @@
 import logging
-import time
 from typing import List
 
-import boto3
-
 from lib.data.dynamo.replication_dao import ReplicationDao
 from lib.data.ssm.ssm import SsmDao
-from lib.models.replication_config import ReplicationConfig
+from lib.data.ssm.cached_ssm import CachedSsmDao
+from lib.models.replication_config import ReplicationConfig, ReplicationResult
 from lib.svcs.replication import ReplicationService
 from lib.svcs.slack import SlackService
 from lib.models.slack import SlackColor, SlackMessage, FigReplicationMessage, SimpleSlackMessage
-from config.constants import FIGGY_WEBHOOK_URL_PATH
+from config.constants import FIGGY_WEBHOOK_URL_PATH, REPL_SYNC_MAX_WORKERS, REPL_SYNC_BATCH_SIZE, REPL_TYPE_MERGE, \
+    REPL_SOURCE_INDEX_NAME, FIGGY_SETTINGS_PREFIX, FIGGY_SETTINGS_CACHE_TTL, SLACK_FLUSH_MARGIN
+from lib.utils import bootstrap
+from lib.utils.bootstrap import settings
+from lib.utils.metrics import metrics
 from lib.utils.utils import Utils
 
-repl_dao: ReplicationDao = ReplicationDao(boto3.resource('dynamodb'))
-ssm: SsmDao = SsmDao(boto3.client('ssm'))
+repl_dao: ReplicationDao = ReplicationDao(bootstrap.resource('dynamodb'), settings)
+ssm: CachedSsmDao = CachedSsmDao(bootstrap.client('ssm'), ttl=0,
+                                 ttl_overrides={FIGGY_SETTINGS_PREFIX: FIGGY_SETTINGS_CACHE_TTL})
 repl_svc: ReplicationService = ReplicationService(repl_dao, ssm)
 
-webhook_url = ssm.get_parameter_value(FIGGY_WEBHOOK_URL_PATH)
-slack: SlackService = SlackService(webhook_url=webhook_url)
+slack: SlackService = SlackService(webhook_url=settings.webhook_url)
 log = Utils.get_logger(__name__, logging.INFO)
 
 
@@ -27,15 +29,47 @@ def notify_slack(config: ReplicationConfig):
     slack.send_message(message)
 
 
+@metrics.handler('figgy-replication-syncer')
 def handle(event, context):
     try:
-        repl_configs: List[ReplicationConfig] = repl_dao.get_all()
-        for config in repl_configs:
-            time.sleep(.15)  # This is to throttle PS API Calls to prevent overloading the API.
-            updated = repl_svc.sync_config(config)
+        results: List[ReplicationResult] = []
+        merge_configs: List[ReplicationConfig] = []
+
+        # App configs are synced in batches as the scan streams them in, later pages load in the background meanwhile.
+        # Merges usually read app destinations, so they are held back until every app config has been synced.
+        with metrics.phase('SyncApps'):
+            batch: List[ReplicationConfig] = []
+            for config in repl_dao.scan_configs():
+                if config.type == REPL_TYPE_MERGE:
+                    merge_configs.append(config)
+                    continue
+
+                batch.append(config)
+                if len(batch) >= REPL_SYNC_BATCH_SIZE:
+                    results.extend(repl_svc.sync_many(batch, max_workers=REPL_SYNC_MAX_WORKERS))
+                    batch = []
+
+            batch and results.extend(repl_svc.sync_many(batch, max_workers=REPL_SYNC_MAX_WORKERS))
+
+        with metrics.phase('ReindexMerges'):
+            repl_dao.reindex_merge_references(merge_configs)
+
+        with metrics.phase('BackfillSourceIndex'):
+            backfilled = repl_dao.backfill_source_index()
+            backfilled and log.info(f"Added {backfilled} app configs to the {REPL_SOURCE_INDEX_NAME}.")
+
+        with metrics.phase('SyncMerges'):
+            results.extend(repl_svc.sync_many(merge_configs, max_workers=REPL_SYNC_MAX_WORKERS))
+
+        for result in results:
+            result.updated and notify_slack(result.config)
+
+        log.info(f"SSM rate limiter stats: {ssm.rate_limiter.stats()}, cache stats: {ssm.stats()}")
 
-            if updated:
-                notify_slack(config)
+        errors = [result for result in results if result.error]
+        if errors:
+            log.error(f"{len(errors)} of {len(results)} replication configs failed to sync.")
+            raise errors[0].error
     except Exception as e:
         log.error(e)
         title = "Figgy experienced an irrecoverable error!"
@@ -45,6 +79,8 @@ def handle(event, context):
         message = SimpleSlackMessage(title=title, message=message, color=SlackColor.RED)
         slack.send_message(message)
         raise e
+    finally:
+        slack.flush(deadline=Utils.deadline(context, SLACK_FLUSH_MARGIN))
 
 
 if __name__ == '__main__':
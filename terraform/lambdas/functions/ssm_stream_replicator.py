@@ -1,25 +1,29 @@
-import boto3
 import logging
 import re
-from typing import List, Dict
+from datetime import datetime, timezone
+from typing import List, Dict, Optional
 from config.constants import *
-from lib.models.replication_config import ReplicationType, ReplicationConfig
+from lib.models.replication_config import ReplicationType, ReplicationConfig, ReplicationResult
 from lib.data.dynamo.replication_dao import ReplicationDao
+from lib.data.dynamo.replication_lag_dao import ReplicationLagDao, LagSample
 from lib.data.ssm.ssm import SsmDao
+from lib.data.ssm.cached_ssm import CachedSsmDao
 from lib.models.slack import SlackMessage, SlackColor, FigReplicationMessage, SimpleSlackMessage
 from lib.svcs.replication import ReplicationService
 from lib.svcs.slack import SlackService
+from lib.utils import bootstrap
+from lib.utils.bootstrap import settings
+from lib.utils.metrics import metrics
 from lib.utils.utils import Utils
 
-repl_dao: ReplicationDao = ReplicationDao(boto3.resource('dynamodb'))
-ssm: SsmDao = SsmDao(boto3.client('ssm'))
+repl_dao: ReplicationDao = ReplicationDao(bootstrap.resource('dynamodb'), settings)
+ssm: CachedSsmDao = CachedSsmDao(bootstrap.client('ssm'), ttl=0,
+                                 ttl_overrides={FIGGY_SETTINGS_PREFIX: FIGGY_SETTINGS_CACHE_TTL})
 repl_svc: ReplicationService = ReplicationService(repl_dao, ssm)
+lag_dao: ReplicationLagDao = ReplicationLagDao(bootstrap.resource('dynamodb'))
 log = Utils.get_logger(__name__, logging.INFO)
 
-webhook_url = ssm.get_parameter_value(FIGGY_WEBHOOK_URL_PATH)
-slack: SlackService = SlackService(webhook_url=webhook_url)
-
-ACCOUNT_ID = ssm.get_parameter_value(ACCOUNT_ID_PS_PATH)
+slack: SlackService = SlackService(webhook_url=settings.webhook_url)
 
 
 def notify_slack(config: ReplicationConfig, triggering_user: str):
@@ -27,6 +31,17 @@ def notify_slack(config: ReplicationConfig, triggering_user: str):
     slack.send_message(message)
 
 
+def parse_event_time(detail: Dict) -> Optional[int]:
+    """
+    Returns the CloudTrail eventTime of the event in millis since epoch, or None if it is missing.
+    """
+    event_time = detail.get('eventTime')
+    if not event_time:
+        return None
+
+    return int(datetime.strptime(event_time, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
 def parse_user(detail: Dict) -> str:
     """
     Returns the closest match we can find to the user's identity from the event detail.
@@ -41,12 +56,13 @@ def parse_user(detail: Dict) -> str:
         return detail.get('userIdentity', {}).get('arn', 'arn/UnknownUser').split('/')[-1]
 
 
+@metrics.handler('figgy-ssm-stream-replicator')
 def handle(event, context):
     # Don't process other account's events.
     originating_account = event.get('account')
-    if originating_account != ACCOUNT_ID:
-        log.info(f"{originating_account} != {ACCOUNT_ID}")
-        log.info(f"Received event from different account with id: {ACCOUNT_ID}. Skipping this event.")
+    if originating_account != settings.account_id:
+        log.info(f"{originating_account} != {settings.account_id}")
+        log.info(f"Received event from different account with id: {settings.account_id}. Skipping this event.")
         return
 
     try:
@@ -62,20 +78,24 @@ def handle(event, context):
         triggering_user = parse_user(detail)
 
         if ps_name and action == PUT_PARAM_ACTION:
-            repl_configs: List[ReplicationConfig] = repl_dao.get_config_repl_by_source(ps_name)
-            merge_configs: List[ReplicationConfig] = repl_dao.get_configs_by_type(ReplicationType(REPL_TYPE_MERGE))
-            for config in repl_configs:
-                updated = repl_svc.sync_config(config)
-                updated and notify_slack(config, triggering_user)  # Notify on update
-
-            for config in merge_configs:
-                log.info(f"Evaluating config: {config}")
-                if isinstance(config.source, list):
-                    for source in config.source:
-                        if ps_name in source:
-                            updated = repl_svc.sync_config(config)
-                            updated and notify_slack(config, triggering_user)
-                            continue
+            with metrics.phase('LookupConfigs'):
+                repl_configs: List[ReplicationConfig] = repl_dao.get_config_repl_by_source(ps_name)
+                affected_merges: List[ReplicationConfig] = repl_dao.get_merge_configs_by_reference(ps_name)
+
+            with metrics.phase('Sync'):
+                results: List[ReplicationResult] = repl_svc.sync_many(repl_configs + affected_merges,
+                                                                      max_workers=REPL_SYNC_MAX_WORKERS)
+            for result in results:
+                result.updated and notify_slack(result.config, triggering_user)  # Notify on update
+
+            event_time = parse_event_time(detail)
+            if event_time:
+                lag_dao.record([LagSample(result.config.destination, trigger='ssm', event_time=event_time,
+                                          completed_at=result.completed_at) for result in results if result.updated])
+
+            errors = [result for result in results if result.error]
+            if errors:
+                raise errors[0].error
 
         elif action == DELETE_PARAM_ACTION or action == DELETE_PARAMS_ACTION:
             log.info("Delete found, skipping...")
@@ -93,6 +113,8 @@ def handle(event, context):
         message = SimpleSlackMessage(title=title, message=message, color=SlackColor.RED)
         slack.send_message(message)
         raise e
+    finally:
+        slack.flush(deadline=Utils.deadline(context, SLACK_FLUSH_MARGIN))
 
 
 if __name__ == '__main__':
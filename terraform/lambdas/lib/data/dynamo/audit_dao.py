@@ -1,28 +1,126 @@
 import time
 import logging
-from typing import Optional
-from boto3.dynamodb.conditions import Attr
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
+
+from lib.data.dynamo.batch_writer import BatchWriter
+from lib.data.dynamo.paginator import parallel_scan, projection, encode_page_token, decode_page_token
+from lib.data.s3.blob_store import BlobStore
 from lib.utils.utils import Utils
 from config.constants import *
 
 log = Utils.get_logger(__name__, logging.INFO)
+AUDIT_SCAN_SEGMENTS = 8
+
+
+@dataclass(frozen=True)
+class AuditRecord:
+    name: str
+    action: str
+    user: str
+    time: int
+    value: Optional[str] = None
+    type: Optional[str] = None
+    key_id: Optional[str] = None
+    description: Optional[str] = None
+    version: Optional[str] = None
+    value_ref: Optional[str] = None  # Set instead of `value` when the value was offloaded, see AuditDao.get_value
+
+    @staticmethod
+    def from_dict(obj: Dict) -> "AuditRecord":
+        return AuditRecord(
+            name=obj.get(AUDIT_PARAM_NAME_KEY),
+            action=obj.get(AUDIT_EVENT_TYPE_ATTR),
+            user=obj.get(AUDIT_USER_ATTR),
+            time=int(obj.get(AUDIT_TIME_KEY)),
+            value=obj.get(AUDIT_VALUE_ATTR),
+            type=obj.get(AUDIT_TYPE_ATTR),
+            key_id=obj.get(AUDIT_KEYID_ATTR),
+            description=obj.get(AUDIT_DESCRIPTION_ATTR),
+            version=str(obj[AUDIT_VERSION_ATTR]) if AUDIT_VERSION_ATTR in obj else None,
+            value_ref=obj.get(AUDIT_VALUE_REF_ATTR),
+        )
 
 
 class AuditDao:
-    def __init__(self, dynamo_resource):
+    """
+    With a `blob_store`, values larger than `offload_threshold` bytes are stored once in the blob store, keyed by
+    their content, and audit rows only hold the digest. Records read back carry that digest in `value_ref`, use
+    `get_value` to fetch the value when it is actually needed.
+
+    Readers outside these lambdas (the figgy CLI reads this table directly) resolve a `value_ref` by reading
+    `BLOB_S3_PREFIX + value_ref` from the deploy bucket and zlib decompressing it; user roles are granted that read.
+    """
+
+    def __init__(self, dynamo_resource, blob_store: BlobStore = None,
+                 offload_threshold: int = AUDIT_VALUE_OFFLOAD_THRESHOLD):
         self._dynamo_resource = dynamo_resource
         self._table = self._dynamo_resource.Table(AUDIT_TABLE_NAME)
+        self._blob_store = blob_store
+        self._offload_threshold = offload_threshold
+
+    def _offload_value(self, item: Dict) -> None:
+        value = item.get(AUDIT_VALUE_ATTR)
+        if not self._blob_store or not value:
+            return
+
+        data = value.encode('utf-8')
+        if len(data) > self._offload_threshold:
+            item[AUDIT_VALUE_REF_ATTR] = self._blob_store.put(data)
+            del item[AUDIT_VALUE_ATTR]
 
-    def put_delete_log(self, user: str, action: str, ps_name: str, timestamp: int = int(time.time() * 1000)):
+    def get_value(self, record: AuditRecord) -> Optional[str]:
+        """
+        Returns the value of a record, fetching it from the blob store if it was offloaded.
+        """
+        if record.value is not None or not record.value_ref:
+            return record.value
+
+        if not self._blob_store:
+            raise ValueError(f"The value of {record.name} at {record.time} was offloaded, but this AuditDao has no "
+                             f"blob store to read it from.")
+
+        data = self._blob_store.get(record.value_ref)
+        return data.decode('utf-8') if data is not None else None
+
+    @staticmethod
+    def _set_expiry(item: Dict) -> None:
+        """
+        Records from automated E2E tests (DELETE_ME values or the circleci user) get a TTL attribute so DynamoDB
+        removes them TEST_VALUE_KEEP_TIME minutes after the event.
+        """
+        if item.get(AUDIT_VALUE_ATTR) == DELETE_ME_VALUE or item.get(AUDIT_USER_ATTR) == CIRCLECI_USER_NAME:
+            item[AUDIT_EXPIRES_AT_ATTR] = int(item[AUDIT_TIME_KEY] / 1000) + TEST_VALUE_KEEP_TIME * 60
+
+    def batch_writer(self) -> BatchWriter:
+        """
+        Returns a BatchWriter for the audit table. Pass it as `writer` to `put_delete_log` and `put_audit_log` to have
+        the records of an invocation buffered into BatchWriteItem requests.
+        """
+        return BatchWriter(self._table, [AUDIT_PARAM_NAME_KEY, AUDIT_TIME_KEY])
+
+    def _put(self, item: Dict, writer: BatchWriter = None) -> None:
+        if writer:
+            writer.put(item)
+        else:
+            self._table.put_item(Item=item)
+
+    def put_delete_log(self, user: str, action: str, ps_name: str, timestamp: int = int(time.time() * 1000),
+                       writer: BatchWriter = None):
         log.debug(f"Storing delete event: {user} | {action} | {ps_name}")
         item = {
             AUDIT_PARAM_NAME_KEY: ps_name,
             AUDIT_EVENT_TYPE_ATTR: action,
             AUDIT_USER_ATTR: user,
             AUDIT_TIME_KEY: timestamp,
+            AUDIT_TIME_BUCKET_ATTR: self.time_bucket(timestamp),
         }
 
-        self._table.put_item(Item=item)
+        self._set_expiry(item)
+        self._put(item, writer=writer)
 
     def put_audit_log(
             self,
@@ -34,7 +132,8 @@ class AuditDao:
             ps_key_id: Optional[str],
             ps_description: Optional[str],
             ps_version: str,
-            timestamp: int = int(time.time() * 1000)
+            timestamp: int = int(time.time() * 1000),
+            writer: BatchWriter = None
     ):
 
         item = {
@@ -42,6 +141,7 @@ class AuditDao:
             AUDIT_EVENT_TYPE_ATTR: action,
             AUDIT_USER_ATTR: user,
             AUDIT_TIME_KEY: timestamp,
+            AUDIT_TIME_BUCKET_ATTR: self.time_bucket(timestamp),
             AUDIT_VALUE_ATTR: ps_value,
             AUDIT_TYPE_ATTR: ps_type,
             AUDIT_KEYID_ATTR: ps_key_id,
@@ -54,23 +154,161 @@ class AuditDao:
             if value:
                 put_item[key] = value
 
-        self._table.put_item(Item=put_item)
-
-    # Should not go in this dao and should be moved...
-    def cleanup_test_logs(self):
-        filter_exp = Attr(AUDIT_VALUE_ATTR).eq(DELETE_ME_VALUE) | Attr(AUDIT_USER_ATTR).eq(CIRCLECI_USER_NAME)
-        result = self._table.scan(FilterExpression=filter_exp)
-        items = result["Items"] if result["Items"] else []
-
-        for item in items:
-            # if this record is older than TEST_VALUE_KEEP_TIME
-            age_in_minutes = (int(time.time() * 1000) - item[AUDIT_TIME_KEY]) / 1000 / 60
-            if age_in_minutes > TEST_VALUE_KEEP_TIME:
-                print(f"Cleaning up: {item[AUDIT_PARAM_NAME_KEY]}")
-                self._table.delete_item(
-                    Key={AUDIT_PARAM_NAME_KEY: item[AUDIT_PARAM_NAME_KEY], AUDIT_TIME_KEY: item[AUDIT_TIME_KEY]}
-                )
+        self._set_expiry(put_item)
+        self._offload_value(put_item)
+        self._put(put_item, writer=writer)
+
+    @staticmethod
+    def time_bucket(timestamp: int) -> int:
+        return int(timestamp // AUDIT_TIME_BUCKET_SIZE)
+
+    def query(self, start: int, end: int = None, user: str = None, action: str = None, prefix: str = None,
+              newest_first: bool = False, page_token: str = None,
+              limit: int = AUDIT_QUERY_PAGE_SIZE) -> Tuple[List[AuditRecord], Optional[str]]:
+        """
+        Returns audit records between `start` and `end`, optionally narrowed down to a user, action, or parameter
+        name prefix. Queries the user-index when a user is given, otherwise the time-index one time bucket at a time,
+        so cost is proportional to the records in range rather than the size of the table.
+        Args:
+            start: Oldest event time to return, millis since epoch.
+            end: Optional: Newest event time to return, millis since epoch. Defaults to now.
+            user: Optional: Only return records for this user.
+            action: Optional: Only return records for this action, e.g. PutParameter.
+            prefix: Optional: Only return records for parameters under this prefix, e.g. /app/my-service/
+            newest_first: Return the most recent records first.
+            page_token: Optional: Token returned by the previous call, to fetch the next page.
+            limit: Maximum number of records to return per page.
+        Returns: (records, next page token). The token is None once every matching record has been returned.
+        """
+        end = end if end else int(time.time() * 1000)
+        time_range = Key(AUDIT_TIME_KEY).between(start, end)
+        step = -1 if newest_first else 1
+
+        if user:
+            # A single partition of the user-index holds the whole range, so there is only one "bucket" to query.
+            first_bucket, last_bucket = 0, 0
+        else:
+            first_bucket, last_bucket = self.time_bucket(start), self.time_bucket(end)
+            if newest_first:
+                first_bucket, last_bucket = last_bucket, first_bucket
+
+        filter_exp = None
+        if action:
+            filter_exp = Attr(AUDIT_EVENT_TYPE_ATTR).eq(action)
+        if prefix:
+            prefix_exp = Attr(AUDIT_PARAM_NAME_KEY).begins_with(prefix)
+            filter_exp = filter_exp & prefix_exp if filter_exp else prefix_exp
+
+        bucket, start_key = first_bucket, None
+        if page_token:
+            position = decode_page_token(page_token)
+            bucket, start_key = position['bucket'], position.get('start_key')
+
+        records: List[AuditRecord] = []
+        while (bucket - last_bucket) * step <= 0 and len(records) < limit:
+            if user:
+                query_kwargs = {'IndexName': AUDIT_USER_INDEX_NAME,
+                                'KeyConditionExpression': Key(AUDIT_USER_ATTR).eq(user) & time_range}
             else:
-                print(
-                    f"{item[AUDIT_PARAM_NAME_KEY]} is too young for cleanup - it's {age_in_minutes} minutes old. Waiting..."
+                query_kwargs = {'IndexName': AUDIT_TIME_INDEX_NAME,
+                                'KeyConditionExpression': Key(AUDIT_TIME_BUCKET_ATTR).eq(bucket) & time_range}
+
+            query_kwargs['ScanIndexForward'] = not newest_first
+            query_kwargs['Limit'] = limit - len(records)
+            if filter_exp:
+                query_kwargs['FilterExpression'] = filter_exp
+            if start_key:
+                query_kwargs['ExclusiveStartKey'] = start_key
+
+            result = self._table.query(**query_kwargs)
+            records.extend([AuditRecord.from_dict(item) for item in result.get('Items', [])])
+            start_key = result.get('LastEvaluatedKey')
+            if not start_key:
+                bucket += step
+
+        more = (bucket - last_bucket) * step <= 0
+        return records, encode_page_token({'bucket': bucket, 'start_key': start_key}) if more else None
+
+    def iter_records(self, start: int, end: int = None, **filters) -> Iterator[AuditRecord]:
+        """
+        Lazily yields every record matching `query`, following page tokens. Takes the same filters as `query`.
+        """
+        page_token = None
+        while True:
+            records, page_token = self.query(start, end, page_token=page_token, **filters)
+            yield from records
+
+            if not page_token:
+                return
+
+    def scan_records(self, end: int = None, prefix: str = None) -> Iterator[AuditRecord]:
+        """
+        Lazily yields every record up to `end` with a parallel scan of the whole table. Only for consumers that need
+        the full history, e.g. the very first config snapshot; use `query` for anything else.
+        Args:
+            end: Optional: Newest event time to return, millis since epoch.
+            prefix: Optional: Only return records for parameters under this prefix.
+        """
+        filter_exp = Attr(AUDIT_TIME_KEY).lte(end) if end else None
+        if prefix:
+            prefix_exp = Attr(AUDIT_PARAM_NAME_KEY).begins_with(prefix)
+            filter_exp = filter_exp & prefix_exp if filter_exp else prefix_exp
+
+        scan_kwargs = {'FilterExpression': filter_exp} if filter_exp else {}
+        for item in parallel_scan(self._table, AUDIT_SCAN_SEGMENTS, **scan_kwargs):
+            yield AuditRecord.from_dict(item)
+
+    def backfill_time_buckets(self, deadline: float = None) -> Optional[int]:
+        """
+        Adds the time_bucket attribute to records written before the time-index existed, so they show up in time
+        range queries. Safe to re-run, the config snapshotter runs it after its checkpoints until it completes.
+        :param deadline: Optional: time.monotonic() value at which to stop, a later run picks up where this one left.
+        :return: Number of records that were backfilled, None if the deadline passed first.
+        """
+        return self._backfill(Attr(AUDIT_TIME_BUCKET_ATTR).not_exists(), AUDIT_TIME_BUCKET_ATTR,
+                              lambda item: self.time_bucket(item[AUDIT_TIME_KEY]), deadline)
+
+    def backfill_test_expiry(self, deadline: float = None) -> Optional[int]:
+        """
+        Sets the TTL attribute on test records written before `_set_expiry` existed. Their expiry is already in the
+        past, so DynamoDB removes them shortly after. Safe to re-run, the config snapshotter runs it after its
+        checkpoints until it completes.
+        :param deadline: Optional: time.monotonic() value at which to stop, a later run picks up where this one left.
+        :return: Number of records that were backfilled, None if the deadline passed first.
+        """
+        filter_exp = (Attr(AUDIT_VALUE_ATTR).eq(DELETE_ME_VALUE) | Attr(AUDIT_USER_ATTR).eq(CIRCLECI_USER_NAME)) \
+            & Attr(AUDIT_EXPIRES_AT_ATTR).not_exists()
+        return self._backfill(filter_exp, AUDIT_EXPIRES_AT_ATTR,
+                              lambda item: int(item[AUDIT_TIME_KEY] / 1000) + TEST_VALUE_KEEP_TIME * 60, deadline)
+
+    def _backfill(self, filter_exp: Any, attribute: str, value_of: Callable[[Dict], Any],
+                  deadline: Optional[float]) -> Optional[int]:
+        """
+        Sets `attribute` to `value_of(item)` on every record matching `filter_exp`. Items passed to `value_of` only
+        hold the table keys.
+        """
+        scan_kwargs = projection([AUDIT_PARAM_NAME_KEY, AUDIT_TIME_KEY])
+        scan_kwargs['FilterExpression'] = filter_exp
+
+        count = 0
+        for item in parallel_scan(self._table, AUDIT_SCAN_SEGMENTS, **scan_kwargs):
+            if deadline and time.monotonic() > deadline:
+                log.info(f"Out of time after backfilling {attribute} on {count} audit records, stopping.")
+                return None
+
+            try:
+                # The condition keeps records that TTL removed in the meantime from being recreated.
+                self._table.update_item(
+                    Key={AUDIT_PARAM_NAME_KEY: item[AUDIT_PARAM_NAME_KEY], AUDIT_TIME_KEY: item[AUDIT_TIME_KEY]},
+                    UpdateExpression="SET #attribute = :value",
+                    ConditionExpression="attribute_exists(#name)",
+                    ExpressionAttributeNames={"#attribute": attribute, "#name": AUDIT_PARAM_NAME_KEY},
+                    ExpressionAttributeValues={":value": value_of(item)},
                 )
+                count += 1
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                    raise
+
+        log.info(f"Backfilled {attribute} on {count} audit records.")
+        return count
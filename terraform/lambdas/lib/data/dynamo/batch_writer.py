@@ -0,0 +1,80 @@
+import logging
+import random
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from lib.utils.utils import Utils
+
+log = Utils.get_logger(__name__, logging.INFO)
+
+BATCH_WRITE_MAX_ITEMS = 25  # Hard limit imposed by the BatchWriteItem API
+BATCH_WRITE_MAX_RETRIES = 8
+BATCH_WRITE_BASE_DELAY = 0.05  # seconds, doubled on each retry of unprocessed items
+
+
+class BatchWriter:
+    """
+    Buffers puts and deletes against a single table and flushes them as BatchWriteItem requests of up to 25 items.
+    Unprocessed items are retried with jittered exponential backoff. BatchWriteItem rejects requests that touch the
+    same key twice, so a later write to a buffered key replaces the earlier one (last writer wins, as with sequential
+    put_item / delete_item calls). Use as a context manager to flush on exit.
+
+    Not thread-safe, use one writer per thread.
+    """
+
+    def __init__(self, table, key_names: List[str]):
+        self._client = table.meta.client
+        self._table_name = table.name
+        self._key_names = key_names
+        self._buffer: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        self.requests = 0
+        self.written = 0
+
+    def __enter__(self) -> "BatchWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+
+    def put(self, item: Dict) -> None:
+        self._add(item, {'PutRequest': {'Item': item}})
+
+    def delete(self, key: Dict) -> None:
+        self._add(key, {'DeleteRequest': {'Key': key}})
+
+    def _add(self, item: Dict, request: Dict) -> None:
+        key = tuple(item[name] for name in self._key_names)
+        self._buffer.pop(key, None)
+        self._buffer[key] = request
+
+        if len(self._buffer) >= BATCH_WRITE_MAX_ITEMS:
+            self._flush_batch()
+
+    def flush(self) -> None:
+        while self._buffer:
+            self._flush_batch()
+
+    def _flush_batch(self) -> None:
+        requests = []
+        while self._buffer and len(requests) < BATCH_WRITE_MAX_ITEMS:
+            requests.append(self._buffer.popitem(last=False)[1])
+
+        count = len(requests)
+        attempt = 0
+        while requests:
+            if attempt > BATCH_WRITE_MAX_RETRIES:
+                raise RuntimeError(f"Unable to write {len(requests)} items to {self._table_name} after "
+                                   f"{BATCH_WRITE_MAX_RETRIES} retries.")
+            if attempt:
+                time.sleep(random.uniform(0, BATCH_WRITE_BASE_DELAY * 2 ** attempt))
+
+            result = self._client.batch_write_item(RequestItems={self._table_name: requests})
+            self.requests += 1
+            requests = result.get('UnprocessedItems', {}).get(self._table_name, [])
+            attempt += 1
+
+            if requests:
+                log.info(f"{len(requests)} unprocessed items writing to {self._table_name}, backing off.")
+
+        self.written += count
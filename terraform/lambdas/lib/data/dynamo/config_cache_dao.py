@@ -1,16 +1,24 @@
 import time
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 
 from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
 
+from lib.data.dynamo.batch_writer import BatchWriter
+from lib.data.dynamo.paginator import paginate, parallel_scan, projection, encode_page_token, decode_page_token
 from lib.utils.utils import Utils
-from typing import Set, Dict, List, Any
+from typing import Set, Dict, List, Any, Iterable, Iterator, Optional, Tuple
 
 from config.constants import *
 
 log = Utils.get_logger(__name__, logging.INFO)
+CACHE_SCAN_SEGMENTS = 8
+TRANSACTION_MAX_RETRIES = 5  # Retries of a cache transition cancelled by a concurrent mutation of the same parameter
+CONFIG_ITEM_ATTRIBUTES = [CONFIG_CACHE_PARAM_NAME_KEY, CONFIG_CACHE_STATE_ATTR_NAME, CONFIG_CACHE_LAST_UPDATED_KEY]
+INDEX_ATTRIBUTES = [CONFIG_CACHE_TIME_BUCKET_ATTR_NAME, CONFIG_CACHE_WRITTEN_AT_ATTR_NAME,
+                    CONFIG_CACHE_TOMBSTONE_ATTR_NAME, CONFIG_CACHE_EXPIRES_AT_ATTR_NAME]
 
 
 class ConfigState(Enum):
@@ -23,14 +31,17 @@ class ConfigItem:
     name: str
     state: ConfigState
     last_updated: int
+    written_at: Optional[int] = field(default=None, compare=False)  # Only read back by `get_changes_since`
 
     @staticmethod
     def from_dict(obj: Dict) -> "ConfigItem":
         name = obj.get(CONFIG_CACHE_PARAM_NAME_KEY, None)
         last_updated = obj.get(CONFIG_CACHE_LAST_UPDATED_KEY, int(time.time() * 1000))
         state = obj.get(CONFIG_CACHE_STATE_ATTR_NAME, ConfigState.ACTIVE.name)
+        written_at = obj.get(CONFIG_CACHE_WRITTEN_AT_ATTR_NAME)
 
-        return ConfigItem(name=name, last_updated=last_updated, state=ConfigState[state])
+        return ConfigItem(name=name, last_updated=last_updated, state=ConfigState[state],
+                          written_at=int(written_at) if written_at is not None else None)
 
     def __lt__(self, other):
         if isinstance(other, ConfigItem):
@@ -51,21 +62,34 @@ class ConfigCacheDao:
         self._dynamo_resource = ddb_resource
         self._cache_table = self._dynamo_resource.Table(CONFIG_CACHE_TABLE_NAME)
 
-    def delete(self, item: ConfigItem) -> None:
-        self._cache_table.delete_item(Key={
+    def batch_writer(self) -> BatchWriter:
+        """
+        Returns a BatchWriter for the cache table. Pass it as `writer` to `delete`, `mark_deleted` and `put_in_cache`
+        to have those mutations buffered into BatchWriteItem requests.
+        """
+        return BatchWriter(self._cache_table, [CONFIG_CACHE_PARAM_NAME_KEY, CONFIG_CACHE_LAST_UPDATED_KEY])
+
+    def delete(self, item: ConfigItem, writer: BatchWriter = None) -> None:
+        key = {
             CONFIG_CACHE_PARAM_NAME_KEY: item.name,
             CONFIG_CACHE_LAST_UPDATED_KEY: item.last_updated
-        })
+        }
 
-    def get_items(self, name: str) -> Set[ConfigItem]:
+        if writer:
+            writer.delete(key)
+        else:
+            self._cache_table.delete_item(Key=key)
+
+    def get_items(self, name: str, consistent: bool = False) -> Set[ConfigItem]:
         """
         Returns all matching items by name, this should almost always be exactly 1 item, but in theory due to table
         structure we could have 2 items with 1 name.
         :param name: parameter name to query by
+        :param consistent: Use a strongly consistent read.
         :return: Set[ConfigItem] - Set of items that match.
         """
         filter_exp = Key(CONFIG_CACHE_PARAM_NAME_KEY).eq(name)
-        result = self._cache_table.query(KeyConditionExpression=filter_exp)
+        result = self._cache_table.query(KeyConditionExpression=filter_exp, ConsistentRead=consistent)
         items: Set[ConfigItem] = set()
         if "Items" in result and len(result['Items']) > 0:
             for item in result['Items']:
@@ -73,68 +97,226 @@ class ConfigCacheDao:
 
         return items
 
-    def mark_deleted(self, item: ConfigItem, timestamp: int = 0) -> None:
+    def mark_deleted(self, item: ConfigItem, timestamp: int = 0, writer: BatchWriter = None) -> None:
         """
         Marks an item as "DELETED" in the DB and resets the last_updated time. This will prompt the CLI to remove
-        this item from its local cache on next invocation.
+        this item from its local cache on next invocation. DynamoDB TTL removes the tombstone once it is
+        CONFIG_CACHE_TOMBSTONE_MAX_AGE seconds old. Without a `writer` the delete and put are applied as a single
+        transaction.
         """
         timestamp = timestamp if timestamp else int(time.time() * 1000)
 
-        self.delete(item)
-        self.put_in_cache(item.name, state=CONFIG_CACHE_STATE_DELETED, timestamp=timestamp)
+        if writer:
+            self.delete(item, writer=writer)
+            self.put_in_cache(item.name, state=CONFIG_CACHE_STATE_DELETED, timestamp=timestamp, writer=writer)
+        else:
+            self._transact(self._transition_requests(item.name, CONFIG_CACHE_STATE_DELETED, timestamp, [item]))
 
-    def put_in_cache(self, name: str, state=CONFIG_CACHE_STATE_ACTIVE, timestamp: int = 0):
+    def apply_event(self, name: str, state: str, event_time: int) -> bool:
+        """
+        Moves a parameter to `state` as of a CloudTrail event: every existing item for the parameter is removed and
+        the new item, stamped with `event_time`, is written in a single TransactWriteItems request. The newest event
+        time wins: events older than the newest cached item are ignored, so out of order or concurrent deliveries
+        cannot resurrect stale state. If a concurrent mutation of the same parameter cancels the transaction, the
+        items are re-read and the transition is retried.
+
+        Deleting a parameter that was never cached is a no-op.
+        :param name: parameter name
+        :param state: CONFIG_CACHE_STATE_ACTIVE or CONFIG_CACHE_STATE_DELETED
+        :param event_time: CloudTrail eventTime, millis since epoch
+        :return: False if the event was ignored.
+        """
+        for attempt in range(TRANSACTION_MAX_RETRIES + 1):
+            items = self.get_items(name, consistent=True)
+            if state == CONFIG_CACHE_STATE_DELETED and not items:
+                return False
+
+            newest = max(items) if items else None
+            if newest and newest.last_updated > event_time:
+                log.info(f"Ignoring {state} event for {name} at {event_time}, the cache holds a newer item from "
+                         f"{newest.last_updated}.")
+                return False
+
+            try:
+                self._transact(self._transition_requests(name, state, event_time, items))
+                return True
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'TransactionCanceledException' \
+                        or attempt == TRANSACTION_MAX_RETRIES:
+                    raise
+
+                log.info(f"Cache transition for {name} was cancelled by a concurrent write, retrying.")
+
+        return False
+
+    def _transition_requests(self, name: str, state: str, timestamp: int, items: Iterable[ConfigItem]) -> List[Dict]:
+        """
+        TransactWriteItems requests that replace `items` with a single item in `state`. Each request is conditioned
+        on the table still looking the way it did when `items` were read.
+        """
+        table_name = self._cache_table.name
+        name_attr = {'#name': CONFIG_CACHE_PARAM_NAME_KEY}
+        put = {'TableName': table_name, 'Item': self._item(name, state, timestamp)}
+        requests = []
+
+        for item in items:
+            if item.last_updated == timestamp:
+                # Same key as the new item, the put replaces it in place.
+                put['ConditionExpression'] = '#state = :state'
+                put['ExpressionAttributeNames'] = {'#state': CONFIG_CACHE_STATE_ATTR_NAME}
+                put['ExpressionAttributeValues'] = {':state': item.state.name}
+                continue
+
+            requests.append({'Delete': {
+                'TableName': table_name,
+                'Key': {CONFIG_CACHE_PARAM_NAME_KEY: item.name, CONFIG_CACHE_LAST_UPDATED_KEY: item.last_updated},
+                'ConditionExpression': 'attribute_exists(#name)',
+                'ExpressionAttributeNames': name_attr,
+            }})
+
+        if 'ConditionExpression' not in put:
+            put['ConditionExpression'] = 'attribute_not_exists(#name)'
+            put['ExpressionAttributeNames'] = name_attr
+
+        requests.append({'Put': put})
+        return requests
+
+    def _transact(self, requests: List[Dict]) -> None:
+        # Conditions are plain strings here, boto3 only translates condition objects for single item requests.
+        self._cache_table.meta.client.transact_write_items(TransactItems=requests)
+
+    def put_in_cache(self, name: str, state=CONFIG_CACHE_STATE_ACTIVE, timestamp: int = 0,
+                     writer: BatchWriter = None):
         """
         Stores a new parameter into the cache table and sets the last_updated to now
         :param name: Name of parameter to store
         :param state: state to set in the cache
+        :param writer: Optional: Buffer the put in this BatchWriter instead of writing it immediately.
         """
 
         timestamp = timestamp if timestamp else int(time.time() * 1000)
+        item = self._item(name, state, timestamp)
 
+        if writer:
+            writer.put(item)
+        else:
+            self._cache_table.put_item(Item=item)
+
+    def _item(self, name: str, state: str, timestamp: int, written_at: int = 0) -> Dict:
+        """
+        `timestamp` is when the change happened (the CloudTrail eventTime), which orders the items of a parameter.
+        CloudTrail can deliver events minutes late, so the changes feed is keyed by `written_at` instead, when the
+        item actually landed in the table.
+        """
+        written_at = written_at if written_at else int(time.time() * 1000)
         item = {
             CONFIG_CACHE_PARAM_NAME_KEY: name,
             CONFIG_CACHE_STATE_ATTR_NAME: state,
-            CONFIG_CACHE_LAST_UPDATED_KEY: timestamp
+            CONFIG_CACHE_LAST_UPDATED_KEY: timestamp,
+            CONFIG_CACHE_WRITTEN_AT_ATTR_NAME: written_at,
+            CONFIG_CACHE_TIME_BUCKET_ATTR_NAME: self.time_bucket(written_at),
         }
 
-        self._cache_table.put_item(Item=item)
+        if state == CONFIG_CACHE_STATE_DELETED:
+            item[CONFIG_CACHE_TOMBSTONE_ATTR_NAME] = CONFIG_CACHE_STATE_DELETED
+            item[CONFIG_CACHE_EXPIRES_AT_ATTR_NAME] = int(timestamp / 1000) + CONFIG_CACHE_TOMBSTONE_MAX_AGE
 
-    def get_deleted_configs(self) -> Set[ConfigItem]:
-        filter_exp = Attr(CONFIG_CACHE_STATE_ATTR_NAME).eq(CONFIG_CACHE_STATE_DELETED)
-        return self.get_configs_with_filter(filter_exp=filter_exp)
+        return item
+
+    @staticmethod
+    def time_bucket(timestamp: int) -> int:
+        return int(timestamp // CONFIG_CACHE_TIME_BUCKET_SIZE)
+
+    @staticmethod
+    def needs_reindex(item: Dict) -> bool:
+        """
+        True for raw items written before the changes-index / tombstone-index attributes existed. Re-putting such an
+        item through `put_in_cache` adds them.
+        """
+        if CONFIG_CACHE_TIME_BUCKET_ATTR_NAME not in item or CONFIG_CACHE_WRITTEN_AT_ATTR_NAME not in item:
+            return True
+
+        return item.get(CONFIG_CACHE_STATE_ATTR_NAME) == CONFIG_CACHE_STATE_DELETED and \
+            (CONFIG_CACHE_TOMBSTONE_ATTR_NAME not in item or CONFIG_CACHE_EXPIRES_AT_ATTR_NAME not in item)
+
+    def get_changes_since(self, since: int, page_token: str = None,
+                          limit: int = CONFIG_CACHE_CHANGES_PAGE_SIZE) -> Tuple[List[ConfigItem], Optional[str]]:
+        """
+        Returns adds and tombstones written to the cache after `since`, in write order, by querying the time-bucketed
+        changes-index one bucket at a time. Cost is proportional to the number of changes, not the size of the table.
+        Changes are ordered by `written_at`, not by their (CloudTrail) `last_updated`, so events that are delivered
+        late still show up after the client's watermark. Clients should use the newest `written_at` they received as
+        their next watermark, rewound a few seconds to cover writes that were in flight when they last synced.
+        Args:
+            since: Client watermark, millis since epoch. Must be newer than CONFIG_CACHE_TOMBSTONE_MAX_AGE, older
+                   clients may have missed deletes whose tombstones have since expired and need a full refresh.
+            page_token: Optional: Token returned by the previous call, to fetch the next page.
+            limit: Maximum number of items to return per page.
+        Returns: (changes, next page token). The token is None once the client is caught up.
+        """
+        now = int(time.time() * 1000)
+        if since < now - CONFIG_CACHE_TOMBSTONE_MAX_AGE * 1000:
+            raise ValueError(f"Watermark {since} is older than the tombstone retention of "
+                             f"{CONFIG_CACHE_TOMBSTONE_MAX_AGE} seconds. A full refresh is required.")
+
+        bucket, start_key = self.time_bucket(since), None
+        if page_token:
+            position = decode_page_token(page_token)
+            bucket, start_key = position['bucket'], position.get('start_key')
+
+        last_bucket = self.time_bucket(now)
+        changes: List[ConfigItem] = []
+        while bucket <= last_bucket and len(changes) < limit:
+            query_kwargs = {
+                'IndexName': CONFIG_CACHE_CHANGES_INDEX_NAME,
+                'KeyConditionExpression': Key(CONFIG_CACHE_TIME_BUCKET_ATTR_NAME).eq(bucket) &
+                                          Key(CONFIG_CACHE_WRITTEN_AT_ATTR_NAME).gt(since),
+                'Limit': limit - len(changes),
+            }
+            if start_key:
+                query_kwargs['ExclusiveStartKey'] = start_key
+
+            result = self._cache_table.query(**query_kwargs)
+            changes.extend([ConfigItem.from_dict(item) for item in result.get('Items', [])])
+            start_key = result.get('LastEvaluatedKey')
+            if not start_key:
+                bucket += 1
+
+        next_token = encode_page_token({'bucket': bucket, 'start_key': start_key}) if bucket <= last_bucket else None
+        return changes, next_token
+
+    def get_deleted_configs(self, older_than: int = 0) -> Set[ConfigItem]:
+        """
+        Returns DELETED items by querying the sparse tombstone-index, which only holds DELETED items. Read cost is
+        proportional to the number of tombstones, not the size of the table.
+        :param older_than: Optional: Only return tombstones with a last_updated (millis since epoch) before this.
+        """
+        key_exp = Key(CONFIG_CACHE_TOMBSTONE_ATTR_NAME).eq(CONFIG_CACHE_STATE_DELETED)
+        if older_than:
+            key_exp = key_exp & Key(CONFIG_CACHE_LAST_UPDATED_KEY).lt(older_than)
+
+        items = paginate(self._cache_table.query, IndexName=CONFIG_CACHE_TOMBSTONE_INDEX_NAME,
+                         KeyConditionExpression=key_exp)
+        return set([ConfigItem.from_dict(item) for item in items])
 
     def get_active_configs(self) -> Set[ConfigItem]:
+        """
+        ACTIVE items make up nearly the whole table, so unlike tombstones they are read with a parallel scan.
+        """
         filter_exp = Attr(CONFIG_CACHE_STATE_ATTR_NAME).eq(CONFIG_CACHE_STATE_ACTIVE)
 
         return self.get_configs_with_filter(filter_exp=filter_exp)
 
-    def get_configs_with_filter(self, filter_exp: Any = None, start_key: str = None) -> Set[ConfigItem]:
+    def get_configs_with_filter(self, filter_exp: Any = None) -> Set[ConfigItem]:
         """
         Retrieve all key names from the Dynamo DB config-cache table in each account. Much more efficient than
         querying SSM directly.
         Args:
             filter_exp: A valid dynamodb filter expression to apply to the scan
-            start_key: Optional: Is used for recursive paginated lookups to get the full data set. This should not
-            be passed in by the user.
-        Returns:
-
+        Returns: Set[ConfigItem] - All matching items
         """
         start_time = time.time()
-        if start_key:
-            log.info(f"Recursively scanning with start key: {start_key}")
-            result = self._cache_table.scan(FilterExpression=filter_exp, ExclusiveStartKey=start_key)
-        else:
-            result = self._cache_table.scan(FilterExpression=filter_exp)
-
-        configs: Set[ConfigItem] = set()
-        if "Items" in result and len(result['Items']) > 0:
-            for item in result['Items']:
-                configs.add(ConfigItem.from_dict(item))
-
-        if 'LastEvaluatedKey' in result:
-            configs = configs | self.get_configs_with_filter(filter_exp=filter_exp,
-                                                             start_key=result['LastEvaluatedKey'])
+        configs: Set[ConfigItem] = set(self.scan_parallel(filter_exp=filter_exp))
 
         log.info(
             f"Returning config names from dynamo cache after: {time.time() - start_time} "
@@ -142,33 +324,39 @@ class ConfigCacheDao:
 
         return configs
 
-    def get_all_configs(self, start_key: str = None) -> Set[ConfigItem]:
+    def get_all_configs(self) -> Set[ConfigItem]:
         """
         Retrieve all key names from the Dynamo DB config-cache table in each account. Much more efficient than
         querying SSM directly.
-        Args:
-            start_key: Optional: Is used for recursive paginated lookups to get the full data set. This should not
-            be passed in by the user.
-        Returns:
-
+        Returns: Set[ConfigItem] - Every item in the cache
         """
-        start_time = time.time()
-        if start_key:
-            log.info(f"Recursively scanning with start key: {start_key}")
-            result = self._cache_table.scan(ExclusiveStartKey=start_key)
-        else:
-            result = self._cache_table.scan()
+        return self.get_configs_with_filter()
 
-        configs: Set[ConfigItem] = set()
-        if "Items" in result and len(result['Items']) > 0:
-            for item in result['Items']:
-                configs.add(ConfigItem.from_dict(item))
+    def scan_items(self, segments: int = CACHE_SCAN_SEGMENTS, filter_exp: Any = None,
+                   attributes: List[str] = None) -> Iterator[Dict]:
+        """
+        Lazily yields raw cache items using a parallel, segmented scan of the cache table.
+        Args:
+            segments: Number of scan segments to read concurrently.
+            filter_exp: Optional: A valid dynamodb filter expression to apply to the scan
+            attributes: Optional: Only fetch these attributes. Defaults to the attributes ConfigItem is built from.
+        Returns: Iterator[Dict]
+        """
+        scan_kwargs = projection(attributes if attributes else CONFIG_ITEM_ATTRIBUTES)
+        if filter_exp is not None:
+            scan_kwargs['FilterExpression'] = filter_exp
 
-        if 'LastEvaluatedKey' in result:
-            configs = configs | self.get_all_configs(start_key=result['LastEvaluatedKey'])
+        yield from parallel_scan(self._cache_table, segments, **scan_kwargs)
 
-        log.info(
-            f"Returning config names from dynamo cache after: {time.time() - start_time} "
-            f"seconds with {len(configs)} configs.")
-
-        return configs
+    def scan_parallel(self, segments: int = CACHE_SCAN_SEGMENTS, filter_exp: Any = None,
+                      attributes: List[str] = None) -> Iterator[ConfigItem]:
+        """
+        Lazily yields cache items using a parallel, segmented scan of the cache table.
+        Args:
+            segments: Number of scan segments to read concurrently.
+            filter_exp: Optional: A valid dynamodb filter expression to apply to the scan
+            attributes: Optional: Only fetch these attributes. Defaults to the attributes ConfigItem is built from.
+        Returns: Iterator[ConfigItem]
+        """
+        for item in self.scan_items(segments, filter_exp, attributes):
+            yield ConfigItem.from_dict(item)
@@ -0,0 +1,116 @@
+import base64
+import json
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import Dict, Iterator, List
+
+BUFFERED_PAGES_PER_SEGMENT = 2  # Pages each segment worker may fetch ahead of the consumer
+
+
+def projection(attributes: List[str]) -> Dict:
+    """
+    Builds ProjectionExpression kwargs for a scan or query. Attribute names are aliased, so reserved words such as
+    `state` and `source` are safe to use. The #p prefix keeps the aliases clear of the #n aliases boto3 generates for
+    condition expressions.
+    """
+    names = {f"#p{i}": attribute for i, attribute in enumerate(attributes)}
+    return {
+        "ProjectionExpression": ", ".join(names.keys()),
+        "ExpressionAttributeNames": names,
+    }
+
+
+def paginate(api_call, **kwargs) -> Iterator[Dict]:
+    """
+    Lazily yields every item of a paginated DynamoDB scan or query, following LastEvaluatedKey until the last page.
+    :param api_call: e.g. table.scan / table.query
+    :param kwargs: Passed through to every call.
+    """
+    while True:
+        result = api_call(**kwargs)
+        yield from result.get('Items', [])
+
+        if 'LastEvaluatedKey' not in result:
+            return
+
+        kwargs['ExclusiveStartKey'] = result['LastEvaluatedKey']
+
+
+def parallel_scan(table, segments: int, **kwargs) -> Iterator[Dict]:
+    """
+    Lazily yields every item of a table using a parallel scan. Each of `segments` scan segments is paged by its own
+    worker, and pages reach the caller through a bounded buffer as they arrive. Items are yielded in arrival order.
+    Workers use the table's thread-safe client, not the Table resource itself.
+    :param table: boto3 dynamodb Table resource
+    :param segments: TotalSegments to split the scan into. 1 is a plain sequential scan.
+    :param kwargs: Additional scan kwargs, e.g. FilterExpression or the output of `projection`.
+    """
+    if segments <= 1:
+        yield from paginate(table.scan, **kwargs)
+        return
+
+    client = table.meta.client
+    pages: queue.Queue = queue.Queue(maxsize=segments * BUFFERED_PAGES_PER_SEGMENT)
+    stopped = threading.Event()
+    finished = object()
+
+    def scan_segment(segment: int):
+        try:
+            scan_kwargs = dict(kwargs, TableName=table.name, Segment=segment, TotalSegments=segments)
+            while not stopped.is_set():
+                result = client.scan(**scan_kwargs)
+                pages.put(result.get('Items', []))
+
+                if 'LastEvaluatedKey' not in result:
+                    break
+
+                scan_kwargs['ExclusiveStartKey'] = result['LastEvaluatedKey']
+        except Exception as e:
+            pages.put(e)
+        finally:
+            pages.put(finished)
+
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        for segment in range(segments):
+            pool.submit(scan_segment, segment)
+
+        running = segments
+        try:
+            while running:
+                page = pages.get()
+                if page is finished:
+                    running -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield from page
+        finally:
+            # Unblock any workers still waiting on the buffer so the pool can shut down.
+            stopped.set()
+            while running:
+                if pages.get() is finished:
+                    running -= 1
+
+
+def encode_page_token(position: Dict) -> str:
+    """
+    Encodes a pagination position, e.g. a LastEvaluatedKey plus any caller state, as an opaque URL-safe token.
+    """
+    def to_json(value):
+        if isinstance(value, Decimal):
+            return int(value) if value == value.to_integral_value() else float(value)
+        raise TypeError(f"Cannot encode {value.__class__} in a page token")
+
+    return base64.urlsafe_b64encode(json.dumps(position, default=to_json).encode('utf-8')).decode('utf-8')
+
+
+def decode_page_token(token: str) -> Dict:
+    """
+    Decodes a token created by `encode_page_token`. Raises ValueError for malformed tokens.
+    """
+    try:
+        return json.loads(base64.urlsafe_b64decode(token.encode('utf-8')).decode('utf-8'))
+    except ValueError as e:
+        raise ValueError(f"Invalid page token: {token}") from e
@@ -1,15 +1,30 @@
+import time
+import logging
 from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
 from decimal import *
 from config.constants import *
-from typing import Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from lib.data.dynamo.paginator import paginate, parallel_scan, projection
 from lib.models.replication_config import ReplicationConfig, ReplicationType
+from lib.utils.bootstrap import FiggySettings
+from lib.utils.utils import Utils
+
+log = Utils.get_logger(__name__, logging.INFO)
+REPL_SCAN_SEGMENTS = 4
+REPL_CONFIG_ATTRIBUTES = [REPL_DEST_KEY_NAME, REPL_SOURCE_ATTR_NAME, REPL_NAMESPACE_ATTR_NAME, REPL_TYPE_ATTR_NAME,
+                          REPL_USER_ATTR_NAME, REPL_RUN_ENV_KEY_NAME]
 
 
 # For interacting with the replication DDB table.
 class ReplicationDao:
-    def __init__(self, dynamo_resource):
+    def __init__(self, dynamo_resource, settings: FiggySettings):
         self._dynamo_resource = dynamo_resource
+        self._settings = settings
         self._table = self._dynamo_resource.Table(REPL_TABLE_NAME)
+        self._refs_table = self._dynamo_resource.Table(REPL_REFS_TABLE_NAME)
+        self._source_index_active = False
+        self._source_index_checked_at = 0
 
     def delete_config(self, destination) -> None:
         self._table.delete_item(
@@ -17,52 +32,112 @@ class ReplicationDao:
                 REPL_DEST_KEY_NAME: destination
             }
         )
+        self.remove_merge_references(destination)
+
+    def scan_configs(self, segments: int = REPL_SCAN_SEGMENTS, filter_exp: Any = None,
+                     attributes: List[str] = None) -> Iterator[ReplicationConfig]:
+        """
+        Lazily yields replication configs using a parallel, segmented scan of the replication table. Segments keep
+        fetching pages in the background while the caller works through the ones already read.
+        Args:
+            segments: Number of scan segments to read concurrently. 1 is a plain sequential scan.
+            filter_exp: Optional: A valid dynamodb filter expression to apply to the scan
+            attributes: Optional: Only fetch these attributes. Defaults to the attributes ReplicationConfig is built
+            from.
+        Returns: Iterator[ReplicationConfig]
+        """
+        scan_kwargs = projection(attributes if attributes else REPL_CONFIG_ATTRIBUTES)
+        if filter_exp is not None:
+            scan_kwargs['FilterExpression'] = filter_exp
+
+        for item in parallel_scan(self._table, segments, **scan_kwargs):
+            yield ReplicationConfig.from_item(item)
 
     def get_all(self) -> List[ReplicationConfig]:
-        result = self._table.scan()
-        all_configs = result.get('Items', [])
-
-        if 'LastEvaluatedKey' in result:
-            result = self._table.scan(start_key=result['LastEvaluatedKey'])
-            all_configs = all_configs + result.get('Items', [])
-
-        if all_configs:
-            all_configs = [ReplicationConfig.from_item(item) for item in all_configs]
-
-        return all_configs
+        return list(self.scan_configs())
 
     def get_config_repl_by_source(self, source: str) -> List[ReplicationConfig]:
-        filter_exp = Attr(REPL_SOURCE_ATTR_NAME).eq(source) & Attr(REPL_TYPE_ATTR_NAME).eq(REPL_TYPE_APP)
-
-        result = self._table.scan(FilterExpression=filter_exp)
-        items = result.get('Items', [])
+        """
+        Returns all app replication configs that replicate from `source`. Served by a query against the source-index
+        GSI. While that index is still being built, or pre-existing configs have not all been added to it yet, this
+        falls back to a filtered full-table scan.
+        """
+        if not self._is_source_index_active():
+            return self._scan_config_repl_by_source(source)
 
-        if 'LastEvaluatedKey' in result:
-            result = self._table.scan(start_key=result['LastEvaluatedKey'])
-            items = items + result.get('Items', [])
+        items = paginate(self._table.query, IndexName=REPL_SOURCE_INDEX_NAME,
+                         KeyConditionExpression=Key(REPL_SOURCE_KEY_ATTR_NAME).eq(source))
 
-        results: List[ReplicationConfig] = []
+        return [ReplicationConfig.from_item(item) for item in items if item.get(REPL_TYPE_ATTR_NAME) == REPL_TYPE_APP]
 
-        if items:
-            results = [ReplicationConfig.from_item(item) for item in items]
-
-        return results
+    def _scan_config_repl_by_source(self, source: str) -> List[ReplicationConfig]:
+        filter_exp = Attr(REPL_SOURCE_ATTR_NAME).eq(source) & Attr(REPL_TYPE_ATTR_NAME).eq(REPL_TYPE_APP)
+        return list(self.scan_configs(filter_exp=filter_exp))
+
+    def _is_source_index_active(self) -> bool:
+        """
+        True once the source-index GSI exists, DynamoDB has finished building it and `backfill_source_index` has
+        added every config written before the index existed. A positive index status is cached for the life of this
+        DAO, a negative one for REPL_INDEX_STATUS_TTL seconds. The backfill marker is reloaded with the figgy settings.
+        """
+        if not self._settings.migrated(REPL_SOURCE_INDEX_MIGRATION):
+            log.info(f"Configs are still being added to the {REPL_SOURCE_INDEX_NAME}, falling back to table scans.")
+            return False
+
+        if self._source_index_active or time.time() - self._source_index_checked_at < REPL_INDEX_STATUS_TTL:
+            return self._source_index_active
+
+        self._source_index_checked_at = time.time()
+        table = self._dynamo_resource.meta.client.describe_table(TableName=REPL_TABLE_NAME)['Table']
+        for index in table.get('GlobalSecondaryIndexes', []):
+            if index['IndexName'] == REPL_SOURCE_INDEX_NAME:
+                self._source_index_active = index['IndexStatus'] == 'ACTIVE' and not index.get('Backfilling', False)
+
+        if not self._source_index_active:
+            log.info(f"{REPL_SOURCE_INDEX_NAME} is not active yet, falling back to table scans.")
+
+        return self._source_index_active
+
+    def index_source(self, config: ReplicationConfig) -> None:
+        """
+        Ensures an app config written outside of this DAO (e.g. by the figgy CLI) carries the `source_key` attribute
+        that places it in the source-index GSI. No-ops for configs that are already indexed.
+        """
+        if config.type != REPL_TYPE_APP or not isinstance(config.source, str):
+            return
+
+        try:
+            self._table.update_item(
+                Key={REPL_DEST_KEY_NAME: config.destination},
+                UpdateExpression="SET #source_key = :source",
+                ConditionExpression="attribute_exists(#dest) AND "
+                                    "(attribute_not_exists(#source_key) OR #source_key <> :source)",
+                ExpressionAttributeNames={"#source_key": REPL_SOURCE_KEY_ATTR_NAME, "#dest": REPL_DEST_KEY_NAME},
+                ExpressionAttributeValues={":source": config.source},
+            )
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                raise
+
+    def backfill_source_index(self) -> int:
+        """
+        Adds the `source_key` attribute to every app config that is missing it. The first run to complete marks the
+        REPL_SOURCE_INDEX_MIGRATION done, from then on lookups by source are served by the source-index.
+        :return: Number of configs that were backfilled.
+        """
+        filter_exp = Attr(REPL_TYPE_ATTR_NAME).eq(REPL_TYPE_APP) & Attr(REPL_SOURCE_KEY_ATTR_NAME).not_exists()
+        backfilled = 0
+        for config in self.scan_configs(filter_exp=filter_exp):
+            self.index_source(config)
+            backfilled += 1
+
+        if not self._settings.migrated(REPL_SOURCE_INDEX_MIGRATION):
+            self._settings.mark_migrated(REPL_SOURCE_INDEX_MIGRATION)
+
+        return backfilled
 
     def get_configs_by_type(self, type: ReplicationType) -> List[ReplicationConfig]:
-        filter_exp = Attr(REPL_TYPE_ATTR_NAME).eq(type.type)
-        result = self._table.scan(FilterExpression=filter_exp)
-        items = result.get('Items', [])
-
-        if 'LastEvaluatedKey' in result:
-            result = self._table.scan(FilterExpression=filter_exp, start_key=result['LastEvaluatedKey'])
-            items = items + result.get('Items', [])
-
-        results = []
-
-        if items:
-            results = [ReplicationConfig.from_item(item) for item in items]
-
-        return results
+        return list(self.scan_configs(filter_exp=Attr(REPL_TYPE_ATTR_NAME).eq(type.type)))
 
     def get_config_repl(self, destination) -> Optional[ReplicationConfig]:
         filter_exp = Key(REPL_DEST_KEY_NAME).eq(destination)
@@ -87,6 +162,88 @@ class ReplicationDao:
             elif isinstance(props[key], float):
                 item[key] = Decimal(f'{props[key]}')
 
+        if item.get(REPL_TYPE_ATTR_NAME) == REPL_TYPE_APP and isinstance(item.get(REPL_SOURCE_ATTR_NAME), str):
+            item[REPL_SOURCE_KEY_ATTR_NAME] = item[REPL_SOURCE_ATTR_NAME]
+
         self._table.put_item(
             Item=item
         )
+
+        if item.get(REPL_TYPE_ATTR_NAME) == REPL_TYPE_MERGE:
+            self.index_merge_references(ReplicationConfig.from_item(item))
+        else:
+            self.remove_merge_references(destination)
+
+    def get_merge_configs_by_reference(self, ps_name: str) -> List[ReplicationConfig]:
+        """
+        Returns every merge config whose source references `ps_name` via a `${...}` token. Served by a single exact
+        key query against the merge reference index.
+        :param ps_name: PS name that was referenced, without any `:uri` suffix.
+        """
+        items = paginate(self._refs_table.query, IndexName=REPL_REFS_REFERENCE_INDEX_NAME,
+                         KeyConditionExpression=Key(REPL_REFS_REFERENCE_KEY_NAME).eq(ps_name))
+
+        return [ReplicationConfig.from_item(item) for item in items]
+
+    def index_merge_references(self, config: ReplicationConfig) -> None:
+        """
+        Brings the merge reference index in line with `config`. One index item is kept per referenced PS name, each
+        carrying a copy of the config so lookups by reference need no follow-up reads.
+        """
+        stale_refs = self._get_indexed_references(config.destination) - config.merge_references()
+        self._write_merge_references([config], [(config.destination, ref) for ref in stale_refs])
+
+    def remove_merge_references(self, destination: str) -> None:
+        refs = self._get_indexed_references(destination)
+        self._write_merge_references([], [(destination, ref) for ref in refs])
+
+    def reindex_merge_references(self, merge_configs: List[ReplicationConfig]) -> None:
+        """
+        Rebuilds the merge reference index from the full set of merge configs. Used to backfill the index and to heal
+        it if a change to the replication table was ever missed. A destination is rewritten when its references or
+        any attribute of the config copies it carries (source template, namespace, user, run env) differ. Only
+        differences are written.
+        :param merge_configs: Every merge config currently in the replication table.
+        """
+        indexed: Dict[str, Dict[str, Dict]] = {}
+        for item in paginate(self._refs_table.scan):
+            indexed.setdefault(item[REPL_DEST_KEY_NAME], {})[item[REPL_REFS_REFERENCE_KEY_NAME]] = item
+
+        changed: List[ReplicationConfig] = []
+        stale: List[Tuple[str, str]] = []
+        for config in merge_configs:
+            refs = config.merge_references()
+            current = indexed.pop(config.destination, {})
+            if any(current.get(ref) != self._reference_item(config, ref) for ref in refs) or set(current) != refs:
+                changed.append(config)
+                stale.extend([(config.destination, ref) for ref in set(current) - refs])
+
+        # Anything left over belongs to destinations that are no longer merge configs.
+        for destination, refs in indexed.items():
+            stale.extend([(destination, ref) for ref in refs])
+
+        self._write_merge_references(changed, stale)
+
+    def _get_indexed_references(self, destination: str) -> Set[str]:
+        items = paginate(self._refs_table.query, KeyConditionExpression=Key(REPL_DEST_KEY_NAME).eq(destination),
+                         **projection([REPL_REFS_REFERENCE_KEY_NAME]))
+        return set([item[REPL_REFS_REFERENCE_KEY_NAME] for item in items])
+
+    def _write_merge_references(self, configs: List[ReplicationConfig], stale_refs: List[Tuple[str, str]]) -> None:
+        with self._refs_table.batch_writer() as batch:
+            for destination, ref in stale_refs:
+                batch.delete_item(Key={REPL_DEST_KEY_NAME: destination, REPL_REFS_REFERENCE_KEY_NAME: ref})
+
+            for config in configs:
+                for ref in config.merge_references():
+                    batch.put_item(Item=self._reference_item(config, ref))
+
+    @staticmethod
+    def _reference_item(config: ReplicationConfig, ref: str) -> Dict:
+        item = dict(config.props)
+        item[REPL_DEST_KEY_NAME] = config.destination
+        item[REPL_REFS_REFERENCE_KEY_NAME] = ref
+        if config.run_env:
+            item[REPL_RUN_ENV_KEY_NAME] = config.run_env
+
+        return item
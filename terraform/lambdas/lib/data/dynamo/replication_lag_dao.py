@@ -0,0 +1,185 @@
+import logging
+import math
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from boto3.dynamodb.conditions import Key
+
+from lib.data.dynamo.batch_writer import BatchWriter
+from lib.utils.metrics import metrics
+from lib.utils.utils import Utils
+from config.constants import *
+
+log = Utils.get_logger(__name__, logging.INFO)
+BATCH_GET_MAX_KEYS = 100  # Hard limit imposed by the BatchGetItem API
+BATCH_GET_MAX_RETRIES = 8
+
+LAG_SAMPLES_ATTR = 'samples'
+LAG_LAST_ATTR = 'last_lag'
+LAG_MAX_ATTR = 'max_lag'
+LAG_LAST_COMPLETED_ATTR = 'last_completed'
+LAG_TRIGGER_ATTR = 'trigger'
+
+
+@dataclass(frozen=True)
+class LagSample:
+    """
+    One replicated destination. `event_time` is when the change that triggered replication happened (the CloudTrail
+    eventTime of a PutParameter, or the ApproximateCreationDateTime of a replication table stream record) and
+    `completed_at` when the destination was written. Both are epoch millis.
+    """
+    destination: str
+    trigger: str
+    event_time: int
+    completed_at: int
+
+    @property
+    def lag(self) -> int:
+        return max(0, self.completed_at - self.event_time)
+
+
+@dataclass(frozen=True)
+class DestinationLag:
+    destination: str
+    rolling_lag: int
+    last_lag: int
+    max_lag: int
+    last_completed: int
+    trigger: str
+
+    @staticmethod
+    def from_item(item: Dict) -> "DestinationLag":
+        return DestinationLag(
+            destination=item[REPL_DEST_KEY_NAME],
+            rolling_lag=int(item.get(REPL_LAG_ROLLING_ATTR_NAME, 0)),
+            last_lag=int(item.get(LAG_LAST_ATTR, 0)),
+            max_lag=int(item.get(LAG_MAX_ATTR, 0)),
+            last_completed=int(item.get(LAG_LAST_COMPLETED_ATTR, 0)),
+            trigger=item.get(LAG_TRIGGER_ATTR),
+        )
+
+
+def percentile(values: List[int], p: float) -> int:
+    """
+    Nearest-rank percentile of `values`.
+    """
+    if not values:
+        return 0
+
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p * len(ordered)) - 1)]
+
+
+# For interacting with the replication lag DDB table.
+class ReplicationLagDao:
+    """
+    Keeps the last REPL_LAG_WINDOW lag samples of every destination along with their P90 (`rolling_lag`). Items are
+    spread over REPL_LAG_PARTITION_SHARDS lag-index partitions by a hash of their destination, so writes do not all
+    land on one hot index partition. Each shard is sorted by rolling lag and `get_slowest` merges them.
+
+    Lag is bookkeeping, not replication state: two invocations recording the same destination at once may drop a
+    sample, and destinations not replicated for REPL_LAG_RETENTION expire.
+    """
+
+    def __init__(self, dynamo_resource, window: int = REPL_LAG_WINDOW, retention: int = REPL_LAG_RETENTION,
+                 shards: int = REPL_LAG_PARTITION_SHARDS):
+        self._dynamo_resource = dynamo_resource
+        self._table = self._dynamo_resource.Table(REPL_LAG_TABLE_NAME)
+        self._window = window
+        self._retention = retention
+        self._shards = shards
+
+    def _partition(self, destination: str) -> str:
+        # crc32 rather than hash(), which is salted per process.
+        return f"{REPL_LAG_PARTITION}-{zlib.crc32(destination.encode('utf-8')) % self._shards}"
+
+    def _batch_get(self, destinations: List[str]) -> Dict[str, Dict]:
+        client = self._table.meta.client
+        found: Dict[str, Dict] = {}
+        for i in range(0, len(destinations), BATCH_GET_MAX_KEYS):
+            request = {self._table.name: {'Keys': [{REPL_DEST_KEY_NAME: destination}
+                                                   for destination in destinations[i:i + BATCH_GET_MAX_KEYS]]}}
+            attempt = 0
+            while request:
+                if attempt > BATCH_GET_MAX_RETRIES:
+                    raise RuntimeError(f"Unable to read lag of {len(destinations)} destinations from "
+                                       f"{self._table.name} after {BATCH_GET_MAX_RETRIES} retries.")
+                if attempt:
+                    time.sleep(0.05 * 2 ** attempt)
+
+                result = client.batch_get_item(RequestItems=request)
+                for item in result.get('Responses', {}).get(self._table.name, []):
+                    found[item[REPL_DEST_KEY_NAME]] = item
+
+                request = result.get('UnprocessedKeys') or None
+                attempt += 1
+
+        return found
+
+    def record(self, samples: List[LagSample]) -> None:
+        """
+        Adds `samples` to the ReplicationLag metric of the invocation and to the rolling lag of their destinations.
+        Lag is bookkeeping, so failing to store it is logged and never fails the replication that produced it.
+        """
+        for sample in samples:
+            metrics.observe('ReplicationLag', sample.lag)
+
+        try:
+            self._store(samples)
+        except Exception as e:
+            log.warning(f"Unable to record replication lag of {len(samples)} destinations: {e}")
+
+    def _store(self, samples: List[LagSample]) -> None:
+        """
+        Stores `samples` with one BatchGetItem and one BatchWriteItem per batch of destinations.
+        """
+        by_destination: Dict[str, List[LagSample]] = {}
+        for sample in samples:
+            by_destination.setdefault(sample.destination, []).append(sample)
+
+        if not by_destination:
+            return
+
+        existing = self._batch_get(list(by_destination.keys()))
+        now = int(time.time())
+
+        with BatchWriter(self._table, [REPL_DEST_KEY_NAME]) as writer:
+            for destination, new_samples in by_destination.items():
+                new_samples.sort(key=lambda sample: sample.completed_at)
+                window = [int(lag) for lag in existing.get(destination, {}).get(LAG_SAMPLES_ATTR, [])]
+                window = (window + [sample.lag for sample in new_samples])[-self._window:]
+                latest = new_samples[-1]
+                writer.put({
+                    REPL_DEST_KEY_NAME: destination,
+                    REPL_LAG_PARTITION_ATTR_NAME: self._partition(destination),
+                    REPL_LAG_ROLLING_ATTR_NAME: percentile(window, 0.9),
+                    LAG_SAMPLES_ATTR: window,
+                    LAG_LAST_ATTR: latest.lag,
+                    LAG_MAX_ATTR: max(window),
+                    LAG_LAST_COMPLETED_ATTR: latest.completed_at,
+                    LAG_TRIGGER_ATTR: latest.trigger,
+                    REPL_LAG_EXPIRES_AT_ATTR_NAME: now + self._retention,
+                })
+
+    def get_lag(self, destination: str) -> Optional[DestinationLag]:
+        item = self._table.get_item(Key={REPL_DEST_KEY_NAME: destination}).get('Item')
+        return DestinationLag.from_item(item) if item else None
+
+    def get_slowest(self, limit: int = 25) -> List[DestinationLag]:
+        """
+        Returns the `limit` destinations with the highest rolling lag, slowest first. Reads the `limit` slowest of
+        every shard in parallel and merges them.
+        """
+        def query_shard(shard: int) -> List[Dict]:
+            key = Key(REPL_LAG_PARTITION_ATTR_NAME).eq(f"{REPL_LAG_PARTITION}-{shard}")
+            return self._table.query(IndexName=REPL_LAG_INDEX_NAME, KeyConditionExpression=key,
+                                     ScanIndexForward=False, Limit=limit).get('Items', [])
+
+        with ThreadPoolExecutor(max_workers=self._shards) as pool:
+            items = [item for shard_items in pool.map(query_shard, range(self._shards)) for item in shard_items]
+
+        items.sort(key=lambda item: item[REPL_LAG_ROLLING_ATTR_NAME], reverse=True)
+        return [DestinationLag.from_item(item) for item in items[:limit]]
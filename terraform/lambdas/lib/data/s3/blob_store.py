@@ -0,0 +1,138 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from typing import Optional, Set
+
+from botocore.exceptions import ClientError
+
+from config.constants import *
+from lib.utils.utils import Utils
+
+log = Utils.get_logger(__name__, logging.INFO)
+
+
+class BlobStore(ABC):
+    """
+    Content-addressed store for large values. Values are zlib compressed and keyed by the SHA-256 of their
+    uncompressed content, so identical values are only ever stored once.
+    """
+
+    def __init__(self):
+        self._known: Set[str] = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def put(self, data: bytes) -> str:
+        """
+        Stores `data` unless a blob with the same content already exists.
+        :return: The digest to pass to `get`.
+        """
+        digest = self.digest(data)
+        with self._lock:
+            if digest in self._known:
+                return digest
+
+        if not self._exists(digest):
+            self._write(digest, zlib.compress(data))
+
+        with self._lock:
+            self._known.add(digest)
+
+        return digest
+
+    def get(self, digest: str) -> Optional[bytes]:
+        compressed = self._read(digest)
+        return zlib.decompress(compressed) if compressed is not None else None
+
+    @abstractmethod
+    def _exists(self, digest: str) -> bool:
+        pass
+
+    @abstractmethod
+    def _write(self, digest: str, compressed: bytes) -> None:
+        pass
+
+    @abstractmethod
+    def _read(self, digest: str) -> Optional[bytes]:
+        pass
+
+
+class S3BlobStore(BlobStore):
+    """
+    Stores blobs under BLOB_S3_PREFIX in the figgy deploy bucket, encrypted with the given KMS key.
+    """
+
+    def __init__(self, boto_s3_client, bucket: str, kms_key_id: str, prefix: str = BLOB_S3_PREFIX):
+        super().__init__()
+        self._s3 = boto_s3_client
+        self._bucket = bucket
+        self._kms_key_id = kms_key_id
+        self._prefix = prefix
+
+    def _exists(self, digest: str) -> bool:
+        try:
+            self._s3.head_object(Bucket=self._bucket, Key=f"{self._prefix}{digest}")
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def _write(self, digest: str, compressed: bytes) -> None:
+        # The deploy bucket may belong to the user and default to S3 Bucket Keys, which would make the KMS encryption
+        # context the bucket ARN instead of the object ARN. User roles may only decrypt with the replication key for
+        # objects under figgy/blobs/ (see iam_role_policies.tf), so blobs always opt out of Bucket Keys.
+        self._s3.put_object(
+            Bucket=self._bucket,
+            Key=f"{self._prefix}{digest}",
+            Body=compressed,
+            ServerSideEncryption='aws:kms',
+            SSEKMSKeyId=self._kms_key_id,
+            BucketKeyEnabled=False,
+        )
+
+    def _read(self, digest: str) -> Optional[bytes]:
+        try:
+            return self._s3.get_object(Bucket=self._bucket, Key=f"{self._prefix}{digest}")['Body'].read()
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+
+class LocalBlobStore(BlobStore):
+    """
+    Stores blobs as files under a local directory. A stand-in for S3BlobStore in local runs and benchmarks.
+    """
+
+    def __init__(self, root: str):
+        super().__init__()
+        self._root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self._root, digest)
+
+    def _exists(self, digest: str) -> bool:
+        return os.path.exists(self._path(digest))
+
+    def _write(self, digest: str, compressed: bytes) -> None:
+        # Write then rename, so readers never see a partially written blob.
+        fd, tmp_path = tempfile.mkstemp(dir=self._root)
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(compressed)
+        os.replace(tmp_path, self._path(digest))
+
+    def _read(self, digest: str) -> Optional[bytes]:
+        if not self._exists(digest):
+            return None
+
+        with open(self._path(digest), 'rb') as blob:
+            return blob.read()
@@ -0,0 +1,114 @@
+import gzip
+import json
+import logging
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional
+
+from config.constants import *
+from lib.data.dynamo.audit_dao import AuditRecord
+from lib.utils.utils import Utils
+
+log = Utils.get_logger(__name__, logging.INFO)
+
+
+@dataclass
+class Snapshot:
+    """
+    Compacted state of every parameter as of `as_of` (millis since epoch): the latest audit record of each parameter
+    that existed at that time, keyed by parameter name.
+    """
+    as_of: int
+    parameters: Dict[str, AuditRecord]
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "as_of": self.as_of,
+            "parameters": [asdict(record) for record in self.parameters.values()],
+        })
+
+    @staticmethod
+    def from_json(document: str) -> "Snapshot":
+        obj = json.loads(document)
+        records = [AuditRecord(**record) for record in obj["parameters"]]
+        return Snapshot(as_of=obj["as_of"], parameters=dict((record.name, record) for record in records))
+
+
+class SnapshotDao:
+    """
+    Stores config snapshots as gzipped JSON documents under SNAPSHOT_S3_PREFIX in the figgy deploy bucket. Snapshots
+    hold decrypted values, so they are encrypted at rest with the given KMS key. Object keys are the zero padded
+    `as_of` timestamp, which keeps lexical and chronological order the same, so lookups only list the keys from
+    SNAPSHOT_LOOKBACK before the time they are after. The last snapshot read or written is kept in memory.
+    """
+
+    def __init__(self, boto_s3_client, bucket: str, kms_key_id: str, max_size: int = SNAPSHOT_MAX_SIZE):
+        self._s3 = boto_s3_client
+        self._bucket = bucket
+        self._kms_key_id = kms_key_id
+        self._max_size = max_size
+        self._last: Optional[Snapshot] = None
+
+    @staticmethod
+    def _key(as_of: int) -> str:
+        return f"{SNAPSHOT_S3_PREFIX}{as_of:013d}.json.gz"
+
+    def put_snapshot(self, snapshot: Snapshot) -> None:
+        document = snapshot.to_json().encode('utf-8')
+        if len(document) > self._max_size:
+            raise ValueError(f"Snapshot of {len(snapshot.parameters)} parameters is {len(document)} bytes, over the "
+                             f"{self._max_size} bytes the snapshotter is sized for. Raise its memory_size along with "
+                             f"SNAPSHOT_MAX_SIZE.")
+
+        body = gzip.compress(document)
+        self._s3.put_object(
+            Bucket=self._bucket,
+            Key=self._key(snapshot.as_of),
+            Body=body,
+            ContentType='application/json',
+            ContentEncoding='gzip',
+            ServerSideEncryption='aws:kms',
+            SSEKMSKeyId=self._kms_key_id,
+        )
+        log.info(f"Stored snapshot of {len(snapshot.parameters)} parameters as of {snapshot.as_of}, "
+                 f"{len(body)} bytes.")
+        self._last = snapshot
+
+    def get_snapshot(self, as_of: int) -> Snapshot:
+        if self._last and self._last.as_of == as_of:
+            return self._last
+
+        result = self._s3.get_object(Bucket=self._bucket, Key=self._key(as_of))
+        self._last = None  # Let the previous snapshot be freed before the next one is loaded
+        self._last = Snapshot.from_json(gzip.decompress(result['Body'].read()).decode('utf-8'))
+        return self._last
+
+    def list_snapshots(self, after: int = None, until: int = None) -> List[int]:
+        """
+        Returns the `as_of` timestamp of the stored snapshots, oldest first. Listing starts after the key of `after`
+        and stops at the first snapshot past `until`.
+        """
+        kwargs = {'Bucket': self._bucket, 'Prefix': SNAPSHOT_S3_PREFIX}
+        if after is not None:
+            kwargs['StartAfter'] = self._key(after)
+
+        timestamps = []
+        for page in self._s3.get_paginator('list_objects_v2').paginate(**kwargs):
+            for obj in page.get('Contents', []):
+                name = obj['Key'][len(SNAPSHOT_S3_PREFIX):].split('.')[0]
+                if not name.isdigit():
+                    continue
+
+                if until is not None and int(name) > until:
+                    return timestamps
+                timestamps.append(int(name))
+
+        return timestamps
+
+    def get_nearest_snapshot(self, as_of: int) -> Optional[Snapshot]:
+        """
+        Returns the most recent snapshot taken at or before `as_of`, or None if there is none. Only lists the last
+        SNAPSHOT_LOOKBACK before `as_of` unless there is no snapshot in it.
+        """
+        candidates = self.list_snapshots(after=max(0, as_of - SNAPSHOT_LOOKBACK), until=as_of) or \
+            self.list_snapshots(until=as_of)
+        return self.get_snapshot(candidates[-1]) if candidates else None
@@ -1 +1,2 @@
-from lib.data.ssm.ssm import SsmDao
\ No newline at end of file
+from lib.data.ssm.ssm import SsmDao
+from lib.data.ssm.cached_ssm import CachedSsmDao
\ No newline at end of file
@@ -0,0 +1,137 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from lib.data.ssm.ssm import SsmDao
+from lib.utils.rate_limiter import RateLimiter
+
+SSM_CACHE_TTL = 30  # seconds
+SSM_CACHE_NEGATIVE_TTL = 10  # seconds, how long a missing parameter is remembered as missing
+SSM_CACHE_MAX_SIZE = 5000
+
+
+class CachedSsmDao(SsmDao):
+    """
+    Opt-in read-through cache in front of SsmDao. Construct it at module level and the cache survives warm lambda
+    invocations.
+
+    - Each entry expires on its own. The TTL is `ttl`, unless the longest matching prefix in `ttl_overrides` says
+      otherwise. A TTL of 0 disables caching for matching keys.
+    - Missing parameters are cached as well, for at most `negative_ttl` seconds.
+    - The cache holds at most `max_size` entries and evicts the least recently used one first.
+    - set_parameter / delete_parameter invalidate the key they write.
+    """
+
+    def __init__(self, boto_ssm_client, rate_limiter: RateLimiter = None, ttl: int = SSM_CACHE_TTL,
+                 negative_ttl: int = SSM_CACHE_NEGATIVE_TTL, max_size: int = SSM_CACHE_MAX_SIZE,
+                 ttl_overrides: Dict[str, int] = None):
+        super().__init__(boto_ssm_client, rate_limiter)
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._max_size = max_size
+        self._ttl_overrides = sorted((ttl_overrides or {}).items(), key=lambda override: len(override[0]),
+                                     reverse=True)
+        self._entries: "OrderedDict[str, Tuple[float, Optional[Dict]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _ttl_for(self, key: str) -> int:
+        for prefix, ttl in self._ttl_overrides:
+            if key.startswith(prefix):
+                return ttl
+
+        return self._ttl
+
+    def _lookup(self, key: str) -> Tuple[bool, Optional[Dict]]:
+        """
+        Returns (found, parameter). `parameter` is None for cached misses.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+
+            if entry:
+                del self._entries[key]
+
+            self.misses += 1
+            return False, None
+
+    def _store(self, key: str, param: Optional[Dict]) -> None:
+        ttl = self._ttl_for(key)
+        ttl = min(ttl, self._negative_ttl) if param is None else ttl
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, param)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+    def get_parameter(self, key) -> Dict:
+        found, param = self._lookup(key)
+        if not found:
+            result = super().get_parameter(key)
+            param = result['Parameter'] if result else None
+            self._store(key, param)
+
+        return {'Parameter': param} if param else None
+
+    def get_parameter_value(self, key) -> str:
+        param = self.get_parameter(key)
+        return param['Parameter']['Value'] if param else None
+
+    def get_parameters_batch(self, keys: Iterable[str]) -> Dict[str, Optional[Dict]]:
+        params: Dict[str, Optional[Dict]] = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            found, param = self._lookup(key)
+            if found:
+                params[key] = param
+            else:
+                missing.append(key)
+
+        for key, param in super().get_parameters_batch(missing).items():
+            self._store(key, param)
+            params[key] = param
+
+        return params
+
+    def set_parameter(self, key, value, desc, type, key_id=None) -> None:
+        try:
+            super().set_parameter(key, value, desc, type, key_id=key_id)
+        finally:
+            self.invalidate(key)
+
+    def delete_parameter(self, key) -> None:
+        try:
+            super().delete_parameter(key)
+        finally:
+            self.invalidate(key)
@@ -1,68 +1,180 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError
-from typing import Dict, List, Set
+from typing import Dict, List, Set, Iterable, Iterator, Optional, Callable, Any
+
+from lib.utils.rate_limiter import RateLimiter
 
 SSM_SECURE_STRING = "SecureString"
+GET_PARAMETERS_MAX_BATCH = 10  # Hard limit imposed by the GetParameters API
+DESCRIBE_PARAMETERS_PAGE_SIZE = 50  # Hard limit imposed by the DescribeParameters API
+ENUMERATION_BUFFERED_PAGES = 8  # Pages fetched ahead of the consumer while enumerating namespaces
+SET_PARAMETERS_MAX_WORKERS = 5  # PutParameter has no batch API, bulk writes are spread over this many threads
+
+# Default pacing for all PS API calls made from a lambda container. Tune via SsmDao(rate_limiter=...)
+SSM_RATE_LIMIT = 40  # calls / second, the default GetParameter(s) quota
+SSM_RATE_BURST = 40
+SSM_THROTTLE_RETRIES = 5
+SSM_THROTTLE_ERROR_CODES = ['ThrottlingException', 'Throttling', 'TooManyUpdates']
+
+# Shared by every SsmDao that isn't handed its own limiter, so all PS calls in a container draw from one bucket.
+shared_rate_limiter = RateLimiter(SSM_RATE_LIMIT, SSM_RATE_BURST)
 
 
 class SsmDao:
-    def __init__(self, boto_ssm_client):
+    def __init__(self, boto_ssm_client, rate_limiter: RateLimiter = None):
         self._ssm = boto_ssm_client
+        self.rate_limiter = rate_limiter if rate_limiter else shared_rate_limiter
+
+    def _call(self, api_call: Callable, **kwargs) -> Any:
+        """
+        Invokes a boto SSM client method once a rate limiter token is available. Throttling errors slow the limiter
+        down and the call is retried up to SSM_THROTTLE_RETRIES times before the error is raised.
+        """
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            try:
+                result = api_call(**kwargs)
+                self.rate_limiter.on_success()
+                return result
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') not in SSM_THROTTLE_ERROR_CODES \
+                        or attempt >= SSM_THROTTLE_RETRIES:
+                    raise
+
+                self.rate_limiter.on_throttle()
+                attempt += 1
+
+    def get_all_param_names(self, prefixes: List[str], option: str = 'Recursive') -> Set[str]:
+        return set(self.iter_param_names(prefixes, option))
 
-    def get_all_param_names(self, prefixes: List[str], option: str = 'Recursive', page: str = None) -> Set[str]:
-        params = self.get_all_parameters(prefixes, option, page)
-        return set([param['Name'] for param in params])
+    def get_all_parameters(self, prefixes: List[str], option: str = 'Recursive') -> List[dict]:
+        """
+        Returns all parameters under the provided prefixes. See `iter_parameters`.
+        Returns: List[dict] -> Parameter details as returned from AWS API
+        """
+        return list(self.iter_parameters(prefixes, option))
+
+    def iter_param_names(self, prefixes: List[str], option: str = 'Recursive') -> Iterator[str]:
+        for param in self.iter_parameters(prefixes, option):
+            yield param['Name']
 
-    def get_all_parameters(self, prefixes: List[str], option: str = 'Recursive', page: str = None) -> List[dict]:
+    def iter_parameters(self, prefixes: List[str], option: str = 'Recursive') -> Iterator[dict]:
         """
-        Returns all parameters under prefix. Automatically pages recursively then returns full result set
+        Lazily yields all parameters under the provided prefixes as pages arrive. Each prefix is paged by its own
+        thread. Pages reach the caller through a bounded buffer, so memory use stays flat however many parameters
+        exist. Results are yielded in arrival order. If one prefix is also a sub-path of another, its parameters are
+        yielded twice.
         Args:
             prefixes: List of prefixes to query. E.G. [ '/shared', '/data', '/app' ]
-            existing_params: Used in recursive calls to build a total result set
-            page: Used in recursive calls if more pages exist.
             option: Must be 'Recursive' or 'OneLevel' - Indiates # of levels below the prefix to recurse.
-        Returns: List[dict] -> Parameter details as returned from AWS API
+        Returns: Iterator[dict] -> Parameter details as returned from AWS API
         """
-        filters = {
-                      'Key': 'Path',
-                      'Option': f'{option}',
-                      'Values': prefixes
-                  },
-        total_params = []
-        if page:
-            params = self._ssm.describe_parameters(ParameterFilters=filters, NextToken=page,
-                                                   MaxResults=50)
-        else:
-            params = self._ssm.describe_parameters(ParameterFilters=filters, MaxResults=50)
+        if not prefixes:
+            return
+
+        pages: queue.Queue = queue.Queue(maxsize=ENUMERATION_BUFFERED_PAGES)
+        stopped = threading.Event()
+        finished = object()
+
+        def page_prefix(prefix: str):
+            try:
+                kwargs = {
+                    'ParameterFilters': [{'Key': 'Path', 'Option': option, 'Values': [prefix]}],
+                    'MaxResults': DESCRIBE_PARAMETERS_PAGE_SIZE,
+                }
+                while not stopped.is_set():
+                    result = self._call(self._ssm.describe_parameters, **kwargs)
+                    pages.put(result.get('Parameters', []))
 
-        total_params = total_params + params['Parameters']
+                    if not result.get('NextToken'):
+                        break
 
-        if params and 'NextToken' in params:
-            total_params = total_params + self.get_all_parameters(prefixes, option=option, page=params['NextToken'])
+                    kwargs['NextToken'] = result['NextToken']
+            except Exception as e:
+                pages.put(e)
+            finally:
+                pages.put(finished)
 
-        return total_params
+        with ThreadPoolExecutor(max_workers=len(prefixes)) as pool:
+            for prefix in prefixes:
+                pool.submit(page_prefix, prefix)
+
+            running = len(prefixes)
+            try:
+                while running:
+                    page = pages.get()
+                    if page is finished:
+                        running -= 1
+                    elif isinstance(page, Exception):
+                        raise page
+                    else:
+                        yield from page
+            finally:
+                # Unblock any producers still waiting on the buffer so the pool can shut down.
+                stopped.set()
+                while running:
+                    if pages.get() is finished:
+                        running -= 1
 
     def delete_parameter(self, key) -> None:
-        response = self._ssm.delete_parameter(Name=key)
+        response = self._call(self._ssm.delete_parameter, Name=key)
         assert response and response['ResponseMetadata'] and response['ResponseMetadata']['HTTPStatusCode'] \
                and response['ResponseMetadata']['HTTPStatusCode'] == 200, \
             f"Error deleting key: [{key}] from PS. Please try again."
 
     def get_parameter(self, key) -> Dict:
         try:
-            return self._ssm.get_parameter(Name=key, WithDecryption=True)
+            return self._call(self._ssm.get_parameter, Name=key, WithDecryption=True)
         except ClientError:
             return None
 
+    def get_parameters_batch(self, keys: Iterable[str]) -> Dict[str, Optional[Dict]]:
+        """
+        Fetches (and decrypts) many parameters at once using GetParameters, GET_PARAMETERS_MAX_BATCH names per call.
+        Args:
+            keys: Parameter names to look up. Duplicates are only fetched once.
+        Returns: Dict[str, Optional[Dict]] -> Parameter name -> Parameter details as returned from the AWS API. Names
+                 that do not exist in PS map to None.
+        """
+        names = list(dict.fromkeys(keys))
+        params: Dict[str, Optional[Dict]] = {}
+
+        for i in range(0, len(names), GET_PARAMETERS_MAX_BATCH):
+            batch = names[i:i + GET_PARAMETERS_MAX_BATCH]
+            try:
+                result = self._call(self._ssm.get_parameters, Names=batch, WithDecryption=True)
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') in SSM_THROTTLE_ERROR_CODES:
+                    raise
+
+                # A single malformed name fails the whole batch, fall back to individual lookups.
+                for name in batch:
+                    param = self.get_parameter(name)
+                    params[name] = param['Parameter'] if param else None
+                continue
+
+            for param in result.get('Parameters', []):
+                params[param['Name']] = param
+
+            for name in result.get('InvalidParameters', []):
+                params[name] = None
+
+        return params
+
     def get_parameter_value(self, key) -> str:
         try:
-            parameter = self._ssm.get_parameter(Name=key, WithDecryption=True)
+            parameter = self._call(self._ssm.get_parameter, Name=key, WithDecryption=True)
             return parameter['Parameter']['Value']
         except ClientError:
             return None
 
     def set_parameter(self, key, value, desc, type, key_id=None) -> None:
         if key_id and type == SSM_SECURE_STRING:
-            self._ssm.put_parameter(
+            self._call(
+                self._ssm.put_parameter,
                 Name=key,
                 Description=desc,
                 Value=value,
@@ -71,10 +183,33 @@ class SsmDao:
                 KeyId=key_id
             )
         else:
-            self._ssm.put_parameter(
+            self._call(
+                self._ssm.put_parameter,
                 Name=key,
                 Description=desc,
                 Value=value,
                 Overwrite=True,
                 Type=type
             )
+
+    def set_parameters(self, params: Iterable[Dict],
+                       max_workers: int = SET_PARAMETERS_MAX_WORKERS) -> Dict[str, Optional[Exception]]:
+        """
+        Writes many parameters concurrently. Calls are still paced by the rate limiter, which backs off when
+        PutParameter is throttled. A failed write does not stop the others.
+        Args:
+            params: Parameters in PutParameter form: Name, Value, Type and optionally Description and KeyId.
+            max_workers: Max # of concurrent PutParameter calls.
+        Returns: Dict[str, Optional[Exception]] -> Parameter name -> the error raised writing it, or None on success.
+        """
+        def put(param: Dict) -> Optional[Exception]:
+            try:
+                self.set_parameter(param['Name'], param['Value'], param.get('Description') or '', param['Type'],
+                                   key_id=param.get('KeyId'))
+                return None
+            except Exception as e:
+                return e
+
+        params = list(params)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return dict(zip([param['Name'] for param in params], pool.map(put, params)))
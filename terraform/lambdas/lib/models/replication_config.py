@@ -1,8 +1,10 @@
 import getpass
-from typing import Dict, List
+from dataclasses import dataclass
+from typing import Dict, List, Set, Optional
 from config.constants import *
 from lib.utils.utils import Utils
 from lib.models.run_env import RunEnv
+from lib.utils.merge_template import MergeTemplate
 
 
 class ReplicationType:
@@ -78,6 +80,16 @@ class ReplicationConfig:
                                           run_env=run_env, namespace=namespace, user=user))
         return cfgs
 
+    def merge_references(self) -> Set[str]:
+        """
+        Returns the PS names referenced by the `${...}` tokens of a merge source. `:uri` suffixes are stripped.
+        Always empty for non-merge configs.
+        """
+        if self.type != REPL_TYPE_MERGE:
+            return set()
+
+        return set(MergeTemplate.compile(self.source).references)
+
     def __str__(self):
         return f"{self.__dict__}"
 
@@ -88,3 +100,14 @@ class ReplicationConfig:
         if isinstance(other, ReplicationConfig):
             return self.destination == other.destination and self.source == other.source and self.type == other.type
         return False
+
+
+@dataclass
+class ReplicationResult:
+    """
+    Outcome of syncing a single replication config as part of a batch.
+    """
+    config: ReplicationConfig
+    updated: bool = False
+    error: Optional[Exception] = None
+    completed_at: Optional[int] = None  # Epoch millis at which the destination was written, set when updated
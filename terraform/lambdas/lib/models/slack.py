@@ -1,10 +1,11 @@
 from abc import abstractmethod, ABC
-from typing import Dict
+from typing import Dict, List
 
 from dataclasses import dataclass
 from enum import Enum
 from typing import Optional
 
+from config.constants import SLACK_DIGEST_MAX_LINES
 from lib.models.replication_config import ReplicationConfig
 
 
@@ -146,3 +147,73 @@ class FigDeletedMessage(SlackMessage):
                     }
                 ]
             }
+
+
+@dataclass
+class FigReplicationDigestMessage(SlackMessage):
+    """
+    Summarizes every fig replicated during a single run in one message, in place of one FigReplicationMessage each.
+    """
+    messages: List[FigReplicationMessage]
+    max_lines: int = SLACK_DIGEST_MAX_LINES
+
+    def slack_format(self):
+        lines = []
+        for message in self.messages[:self.max_lines]:
+            cfg = message.replication_cfg
+            user_note = f" (triggered by *{message.triggering_user}*)" if message.triggering_user else ""
+            lines.append(f"`{cfg.source}` → `{cfg.destination}`  owner: {cfg.user}{user_note}")
+
+        if len(self.messages) > self.max_lines:
+            lines.append(f"...and {len(self.messages) - self.max_lines} more.")
+
+        # Section text is capped at 3000 characters by Slack, so the list is split across sections.
+        sections, chunk = [], []
+        for line in lines:
+            if chunk and sum(len(text) + 1 for text in chunk) + len(line) > 2900:
+                sections.append(chunk)
+                chunk = []
+            chunk.append(line)
+        chunk and sections.append(chunk)
+
+        return \
+            {
+                "attachments": [
+                    {
+                        "color": SlackColor.GREEN.value,
+                        "blocks": [
+                            {
+                                "type": "section",
+                                "text": {
+                                    "type": "mrkdwn",
+                                    "text": f"*Figgy Event:* {len(self.messages)} figs successfully replicated by "
+                                            f"Figgy in {self.messages[0].replication_cfg.run_env}."
+                                }
+                            },
+                            {
+                                "type": "divider"
+                            },
+                            *[
+                                {
+                                    "type": "section",
+                                    "text": {
+                                        "type": "mrkdwn",
+                                        "text": "\n".join(chunk)
+                                    }
+                                } for chunk in sections
+                            ],
+                            {
+                                "type": "context",
+                                "elements": [
+                                    {
+                                        "type": "mrkdwn",
+                                        "text": "For more information on what this means, check out the "
+                                                "<https://www.figgy.dev/getting-started/basics/#the-solution-config-"
+                                                "replication|Figgy Docs>"
+                                    }
+                                ]
+                            }
+                        ]
+                    }
+                ]
+            }
@@ -1,9 +1,16 @@
-import re
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
 from config.constants import *
 from lib.data.dynamo.replication_dao import ReplicationDao
 from lib.data.ssm.ssm import SsmDao
 from urllib.parse import quote_plus, urlencode
-from lib.models.replication_config import ReplicationConfig
+from lib.models.replication_config import ReplicationConfig, ReplicationResult
+from lib.utils.merge_template import MergeTemplate
+from lib.utils.utils import Utils
+
+log = Utils.get_logger(__name__, logging.INFO)
 
 
 class ReplicationService:
@@ -12,75 +19,188 @@ class ReplicationService:
         self._replication_dao = replication_dao
         self._ssm = ssm
 
-    def sync_config(self, config: ReplicationConfig) -> bool:
+    def sync_many(self, configs: List[ReplicationConfig],
+                  max_workers: int = REPL_SYNC_MAX_WORKERS) -> List[ReplicationResult]:
+        """
+        Bulk variant of `sync_config`. Every source, destination and merge reference across `configs` is fetched up
+        front with batched GetParameters calls, then configs are diffed and synced on a bounded thread pool. Configs
+        sharing a destination are synced in order by the same worker so their writes never race. A failing config
+        does not abort the batch, its error is captured on its result instead.
+
+        Configs that read another config's destination (e.g. a merge referencing a merged value) are synced after the
+        config they depend on. Configs caught in a dependency cycle are not synced and are returned with an error.
+        :param configs: Replication configs to ensure are synchronized.
+        :param max_workers: Max # of configs synced concurrently. PS calls are still paced by the SsmDao rate limiter.
+        :return: One ReplicationResult per config, in the same order as `configs`.
+        """
+        prefetched = self._ssm.get_parameters_batch(self.referenced_keys(configs))
+
+        by_destination: Dict[str, List[Tuple[int, ReplicationConfig]]] = {}
+        for index, config in enumerate(configs):
+            by_destination.setdefault(config.destination, []).append((index, config))
+
+        layers, cyclic = self._dependency_layers(by_destination)
+
+        results: List[Optional[ReplicationResult]] = [None] * len(configs)
+        for destination in cyclic:
+            log.error(f"Unable to sync {destination}, it is part of or depends on a replication cycle.")
+            for index, config in by_destination[destination]:
+                error = ValueError(f"Replication cycle detected involving destination: {destination}")
+                results[index] = ReplicationResult(config, error=error)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for layer in layers:
+                groups = [by_destination[destination] for destination in layer]
+                for group_results in pool.map(lambda group: self._sync_group(group, prefetched), groups):
+                    for index, result in group_results:
+                        results[index] = result
+
+        return results
+
+    @staticmethod
+    def _dependency_layers(by_destination: Dict[str, List[Tuple[int, ReplicationConfig]]]) \
+            -> Tuple[List[List[str]], List[str]]:
+        """
+        Orders destinations so each one is synced after every destination it reads from (Kahn's algorithm).
+        :return: (layers, cyclic) - layers of destinations that may be synced concurrently, in dependency order, and
+        the destinations that could not be ordered due to a cycle.
+        """
+        depends_on: Dict[str, Set[str]] = {}
+        dependents: Dict[str, Set[str]] = {destination: set() for destination in by_destination}
+        for destination, group in by_destination.items():
+            reads = ReplicationService.referenced_keys([config for _, config in group]) - {destination}
+            depends_on[destination] = set([key for key in reads if key in by_destination])
+            for dependency in depends_on[destination]:
+                dependents[dependency].add(destination)
+
+        layers: List[List[str]] = []
+        ready = [destination for destination, deps in depends_on.items() if not deps]
+        while ready:
+            layers.append(ready)
+            next_ready = []
+            for destination in ready:
+                for dependent in dependents[destination]:
+                    depends_on[dependent].discard(destination)
+                    if not depends_on[dependent]:
+                        next_ready.append(dependent)
+            ready = next_ready
+
+        ordered = set([destination for layer in layers for destination in layer])
+        cyclic = [destination for destination in by_destination if destination not in ordered]
+        return layers, cyclic
+
+    def _sync_group(self, group: List[Tuple[int, ReplicationConfig]],
+                    prefetched: Dict[str, Optional[Dict]]) -> List[Tuple[int, ReplicationResult]]:
+        results = []
+        for index, config in group:
+            try:
+                updated = self.sync_config(config, prefetched)
+                completed_at = int(time.time() * 1000) if updated else None
+                results.append((index, ReplicationResult(config, updated=updated, completed_at=completed_at)))
+            except Exception as e:
+                log.error(f"Error syncing {config.source} -> {config.destination}: {e}")
+                results.append((index, ReplicationResult(config, error=e)))
+
+        return results
+
+    @staticmethod
+    def referenced_keys(configs: List[ReplicationConfig]) -> Set[str]:
+        """
+        Returns every PS name that must be read to sync the provided configs.
+        """
+        keys: Set[str] = {REPL_KEY_PS_PATH}
+        for config in configs:
+            keys.add(config.destination)
+            if config.type == REPL_TYPE_MERGE:
+                keys.update(config.merge_references())
+            else:
+                keys.add(config.source)
+
+        return keys
+
+    def sync_config(self, config: ReplicationConfig, prefetched: Optional[Dict[str, Optional[Dict]]] = None) -> bool:
         """
         Ensures a replication configuration is synchronized. Returns True if any action to sync the config takes place,
         False otherwise.
         :param config: Defined replication config to ensure is synchronized.
+        :param prefetched: Optional: PS name -> parameter map as returned by `SsmDao.get_parameters_batch`. Names found
+        in this map are not looked up again.
         :return: True/False. True is returned if a change is maded in PS to sync this config.
         """
-        dest_param = self._ssm.get_parameter(config.destination)
-        dest_val = dest_param['Parameter']['Value'] if dest_param else None
-        dest_type = dest_param['Parameter']['Type'] if dest_param else None
+        dest_param = self._get_parameter(config.destination, prefetched)
+        dest_val = dest_param['Value'] if dest_param else None
+        dest_type = dest_param['Type'] if dest_param else None
 
         if config.type == REPL_TYPE_MERGE:
             src_type = SSM_SECURE_STRING
-            src_val = self.get_merge_value(config.source)
+            src_val = self.get_merge_value(config.source, prefetched)
         else:
-            src_param = self._ssm.get_parameter(config.source)
-            src_val = src_param['Parameter']['Value'] if src_param else None
-            src_type = src_param['Parameter']['Type'] if src_param else None
+            src_param = self._get_parameter(config.source, prefetched)
+            src_val = src_param['Value'] if src_param else None
+            src_type = src_param['Type'] if src_param else None
 
         if (dest_val != src_val and src_val is not None) or \
                 (dest_type != src_type and src_val is not None):
             self.replicate_config(config.source, config.destination,
-                                  src_type, src_val, config.user)
+                                  src_type, src_val, config.user, prefetched)
             return True
         else:
             print(f"{config.source} -> {config.destination} is valid")
 
         return False
 
-    def replicate_config(self, source, dest, src_type, src_val, user):
+    def replicate_config(self, source, dest, src_type, src_val, user, prefetched=None):
         desc = f"Replicated from: {source} by: {user}"
+        key_id = self._get_parameter_value(REPL_KEY_PS_PATH, prefetched)
         if src_type == REPL_TYPE_MERGE:
-            merge_val = self.get_merge_value(src_val)
-            self._ssm.set_parameter(dest, merge_val, desc, src_type,
-                                    key_id=self._ssm.get_parameter_value(REPL_KEY_PS_PATH))
-        else:
-            self._ssm.set_parameter(dest, src_val, desc, src_type,
-                                    key_id=self._ssm.get_parameter_value(REPL_KEY_PS_PATH))
+            src_val = self.get_merge_value(src_val, prefetched)
+
+        self._ssm.set_parameter(dest, src_val, desc, src_type, key_id=key_id)
+
+        # Keep the prefetched view current so configs that read this destination later in the run see the new value.
+        if prefetched is not None:
+            prefetched[dest] = {'Name': dest, 'Value': src_val, 'Type': src_type}
 
-    def get_value(self, ps_key: str):
+    def _get_parameter(self, ps_key: str, prefetched=None) -> Optional[Dict]:
+        if prefetched is not None and ps_key in prefetched:
+            return prefetched[ps_key]
+
+        param = self._ssm.get_parameter(ps_key)
+        return param['Parameter'] if param else None
+
+    def _get_parameter_value(self, ps_key: str, prefetched=None) -> Optional[str]:
+        if prefetched is not None and ps_key in prefetched:
+            return prefetched[ps_key]['Value'] if prefetched[ps_key] else None
+
+        return self._ssm.get_parameter_value(ps_key)
+
+    def get_value(self, ps_key: str, prefetched=None):
         if ps_key.endswith(":uri"):
             ps_key = ps_key[:-4]
-            ps_val = self._ssm.get_parameter_value(ps_key)
+            ps_val = self._get_parameter_value(ps_key, prefetched)
             if ps_val is not None:
                 ps_val = quote_plus(ps_val, encoding='utf-8')
         else:
-            ps_val = self._ssm.get_parameter_value(ps_key)
+            ps_val = self._get_parameter_value(ps_key, prefetched)
 
         return ps_val
 
-    def get_merge_value(self, merge_val):
-        merged_key = ""
-        if isinstance(merge_val, list):
-            for key in merge_val:
-                match = re.match("^\${(/.*)}$", key)
-                if match is not None:
-                    ps_name = match.group(1)
-                    ps_val = self.get_value(ps_name)
-                    ps_val = ps_val if ps_val else f"KEY: {ps_name} is missing. Cannot complete merge key."
-                    merged_key = merged_key + ps_val
-                else:
-                    merged_key = merged_key + key
-        else:
-            matches = re.findall('\${([\w/-]+)}', merge_val)
-            for ps_name in matches:
-                ps_val = self.get_value(ps_name)
-                set_val = ps_val if ps_val else f"KEY: {ps_name} is missing. Cannot complete merge key."
-                merge_val = merge_val.replace(f"{ps_name}", set_val)
+    def get_merge_value(self, merge_val, prefetched=None) -> str:
+        """
+        Renders a merge source. Referenced values come from `prefetched` where possible, anything else is fetched with
+        a single batched lookup.
+        """
+        template = MergeTemplate.compile(merge_val)
+        values: Dict[str, Optional[str]] = {}
+        missing = []
+        for ps_name in template.references:
+            if prefetched is not None and ps_name in prefetched:
+                values[ps_name] = prefetched[ps_name]['Value'] if prefetched[ps_name] else None
+            else:
+                missing.append(ps_name)
 
-            merged_key = merge_val
+        if missing:
+            for ps_name, param in self._ssm.get_parameters_batch(missing).items():
+                values[ps_name] = param['Value'] if param else None
 
-        return merged_key
+        return template.render(values)
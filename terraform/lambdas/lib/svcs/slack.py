@@ -1,19 +1,142 @@
 import json
 import logging
-from botocore.vendored import requests
-from lib.models.slack import SlackMessage, SlackColor
+import math
+import queue
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+import urllib3
+
+from config.constants import *
+from lib.models.slack import SlackMessage, FigReplicationMessage, FigReplicationDigestMessage
 from lib.utils.utils import Utils
 
 log = Utils.get_logger(__name__, logging.INFO)
 
 
 class SlackService:
-    def __init__(self, webhook_url: str):
+    """
+    Posts messages to the configured Slack webhook from a background worker over a pooled, keep-alive HTTP connection.
+    `send_message` only enqueues, so handlers must call `flush` before returning or queued messages may be lost when
+    the lambda container is frozen.
+
+    FigReplicationMessages are held back until `flush` and sent as a single FigReplicationDigestMessage, so a run that
+    replicates hundreds of figs posts one message instead of hundreds. Requests Slack rate limits (429) are retried
+    after the returned Retry-After, server errors and connection failures with jittered backoff.
+    """
+
+    def __init__(self, webhook_url: str, http: urllib3.PoolManager = None, queue_size: int = SLACK_QUEUE_SIZE):
         self.webhook_url = webhook_url
+        self._http = http if http else urllib3.PoolManager(maxsize=1, retries=False)
+        self._timeout = urllib3.Timeout(connect=SLACK_CONNECT_TIMEOUT, read=SLACK_READ_TIMEOUT)
+        self._queue: "queue.Queue[Dict]" = queue.Queue(maxsize=queue_size)
+        self._replications: List[FigReplicationMessage] = []
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._worker: Optional[threading.Thread] = None
 
     def send_message(self, message: SlackMessage):
-        if self.webhook_url:
-            slack_message = message.slack_format()
-            requests.post(self.webhook_url, json.dumps(slack_message))
+        if not self.webhook_url:
+            log.warning(f"Slack webhook unconfigured. Ignoring effort to submit Slack Notification.")
+            return
+
+        if isinstance(message, FigReplicationMessage):
+            with self._lock:
+                self._replications.append(message)
         else:
-            log.warning(f"Slack webhook unconfigured. Ignoring effort to submit Slack Notification.")
\ No newline at end of file
+            self._enqueue(message.slack_format())
+
+    def flush(self, timeout: float = SLACK_FLUSH_TIMEOUT, deadline: Optional[float] = None) -> bool:
+        """
+        Sends any held back replication digest and waits for the queue to drain.
+        :param deadline: time.monotonic() value to stop waiting at if it comes before `timeout`, handlers pass
+                         Utils.deadline(context, SLACK_FLUSH_MARGIN) so flushing never outlives the invocation.
+        :return: False if messages were still queued or in flight when it stopped waiting.
+        """
+        with self._lock:
+            replications, self._replications = self._replications, []
+
+        if len(replications) == 1:
+            self._enqueue(replications[0].slack_format())
+        elif replications:
+            self._enqueue(FigReplicationDigestMessage(messages=replications).slack_format())
+
+        deadline = min(time.monotonic() + timeout, deadline) if deadline is not None else time.monotonic() + timeout
+        with self._idle:
+            while self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    log.warning(f"Gave up waiting on {self._in_flight} unsent Slack messages.")
+                    return False
+                self._idle.wait(remaining)
+
+        return True
+
+    def _enqueue(self, payload: Dict):
+        with self._lock:
+            if not self._worker or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="slack-notifier", daemon=True)
+                self._worker.start()
+            self._in_flight += 1
+
+        try:
+            self._queue.put(payload, timeout=SLACK_READ_TIMEOUT)
+        except queue.Full:
+            log.warning(f"Slack notification queue is full, dropping message: {payload}")
+            self._done()
+
+    def _done(self):
+        with self._idle:
+            self._in_flight -= 1
+            if not self._in_flight:
+                self._idle.notify_all()
+
+    def _run(self):
+        while True:
+            payload = self._queue.get()
+            try:
+                self._post(payload)
+            except Exception as e:
+                log.warning(f"Unable to send Slack notification: {e}")
+            finally:
+                self._done()
+
+    @staticmethod
+    def _retry_after(header: Optional[str], backoff: float) -> float:
+        """
+        Seconds to wait from a Retry-After header, which may be fractional. Missing, HTTP-date or otherwise
+        unusable values fall back to the jittered `backoff`.
+        """
+        try:
+            seconds = float(header)
+        except (TypeError, ValueError):
+            return backoff
+
+        return seconds if math.isfinite(seconds) and seconds >= 0 else backoff
+
+    def _post(self, payload: Dict):
+        body = json.dumps(payload).encode('utf-8')
+        for attempt in range(SLACK_MAX_RETRIES + 1):
+            delay = min(2 ** attempt * 0.5, SLACK_MAX_RETRY_AFTER) * random.uniform(0.5, 1)
+            try:
+                response = self._http.request('POST', self.webhook_url, body=body, timeout=self._timeout,
+                                              headers={'Content-Type': 'application/json'}, retries=False)
+            except urllib3.exceptions.HTTPError as e:
+                log.info(f"Slack webhook request failed, attempt {attempt + 1}: {e}")
+            else:
+                if response.status < 300:
+                    return
+                elif response.status == 429:
+                    delay = min(self._retry_after(response.headers.get('Retry-After'), delay), SLACK_MAX_RETRY_AFTER)
+                    log.info(f"Slack rate limited this webhook, retrying in {delay} seconds.")
+                elif response.status < 500:
+                    log.warning(f"Slack rejected message with status {response.status}: {response.data[:200]}")
+                    return
+
+            if attempt < SLACK_MAX_RETRIES:
+                time.sleep(delay)
+
+        log.warning(f"Giving up on Slack notification after {SLACK_MAX_RETRIES + 1} attempts.")
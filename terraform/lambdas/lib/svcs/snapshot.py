@@ -0,0 +1,135 @@
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List
+
+from config.constants import *
+from lib.data.dynamo.audit_dao import AuditDao, AuditRecord
+from lib.data.s3.snapshot_dao import Snapshot, SnapshotDao
+from lib.data.ssm.ssm import SsmDao
+from lib.utils.utils import Utils
+
+log = Utils.get_logger(__name__, logging.INFO)
+
+
+@dataclass
+class RestoreResult:
+    prefix: str
+    as_of: int
+    restored: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    unchanged: int = 0
+    errors: Dict[str, str] = field(default_factory=dict)
+
+
+class SnapshotService:
+    """
+    Reconstructs parameter state at any point in time from the audit log. Periodic checkpoints (`create_checkpoint`)
+    compact the log into the latest record per parameter, so rebuilding state at time T only replays the audit
+    records written between the nearest checkpoint and T.
+    """
+
+    def __init__(self, audit_dao: AuditDao, snapshot_dao: SnapshotDao, ssm: SsmDao):
+        self._audit = audit_dao
+        self._snapshots = snapshot_dao
+        self._ssm = ssm
+
+    @staticmethod
+    def _namespace(prefix: str) -> str:
+        return prefix.rstrip('/') + '/'
+
+    @staticmethod
+    def _replay(state: Dict[str, AuditRecord], records: Iterable[AuditRecord]) -> Dict[str, AuditRecord]:
+        """
+        Applies audit records to `state` in event time order. Puts made in the same millisecond are ordered by version.
+        """
+        ordered = sorted(records, key=lambda record: (record.time, int(record.version) if record.version else 0))
+        for record in ordered:
+            if record.action in (DELETE_PARAM_ACTION, DELETE_PARAMS_ACTION):
+                state.pop(record.name, None)
+            else:
+                state[record.name] = record
+
+        return state
+
+    def create_checkpoint(self, as_of: int = None) -> Snapshot:
+        """
+        Materializes and stores a snapshot as of `as_of`, by default SNAPSHOT_SETTLE_TIME ago so that audit events
+        which are still in flight are not left out. Deltas are selected by event time, so a record written after a
+        checkpoint covering its event time is missing from it and from every checkpoint built on it; the auditor
+        warns about such records (see config_auditor). The first checkpoint is built from a full scan of the audit log,
+        every later one from the previous checkpoint plus the records written since.
+        """
+        as_of = as_of if as_of else int(time.time() * 1000) - SNAPSHOT_SETTLE_TIME
+        base = self._snapshots.get_nearest_snapshot(as_of)
+        if base and base.as_of == as_of:
+            return base
+
+        if base:
+            state = self._replay(dict(base.parameters), self._audit.iter_records(base.as_of + 1, as_of))
+        else:
+            log.info("No previous snapshot found, building the first one from the full audit log.")
+            state = self._replay({}, self._audit.scan_records(end=as_of))
+
+        snapshot = Snapshot(as_of=as_of, parameters=state)
+        self._snapshots.put_snapshot(snapshot)
+        return snapshot
+
+    def state_at(self, as_of: int, prefix: str) -> Dict[str, AuditRecord]:
+        """
+        Returns the latest audit record of every parameter under `prefix` that existed at `as_of`.
+        """
+        namespace = self._namespace(prefix)
+        base = self._snapshots.get_nearest_snapshot(as_of)
+        if base:
+            state = dict((name, record) for name, record in base.parameters.items() if name.startswith(namespace))
+            records = self._audit.iter_records(base.as_of + 1, as_of, prefix=namespace)
+        else:
+            state = {}
+            records = self._audit.scan_records(end=as_of, prefix=namespace)
+
+        return self._replay(state, records)
+
+    def restore(self, as_of: int, prefix: str, prune: bool = False) -> RestoreResult:
+        """
+        Restores every parameter under `prefix` to its value at `as_of`. Only parameters whose current value or type
+        differ are written, through concurrent SsmDao puts.
+        :param prune: Also delete parameters that did not exist at `as_of`.
+        """
+        result = RestoreResult(prefix=prefix, as_of=as_of)
+        target = self.state_at(as_of, prefix)
+        current_names = set(self._ssm.iter_param_names([prefix.rstrip('/')]))
+        current = self._ssm.get_parameters_batch(set(target.keys()) | current_names)
+
+        writes = []
+        for name, record in target.items():
+            param = current.get(name)
+            value = self._audit.get_value(record)
+            if param and param.get('Value') == value and (not record.type or param.get('Type') == record.type):
+                result.unchanged += 1
+            elif value is None:
+                result.errors[name] = "The audit log holds no value for this parameter."
+            else:
+                write = {'Name': name, 'Value': value, 'Type': record.type or 'String',
+                         'Description': record.description}
+                if record.key_id:
+                    write['KeyId'] = record.key_id
+                writes.append(write)
+
+        for name, error in self._ssm.set_parameters(writes).items():
+            if error:
+                result.errors[name] = str(error)
+            else:
+                result.restored.append(name)
+
+        if prune:
+            for name in sorted(current_names - set(target.keys())):
+                try:
+                    self._ssm.delete_parameter(name)
+                    result.deleted.append(name)
+                except Exception as e:
+                    result.errors[name] = str(e)
+
+        log.info(f"Restored {prefix} to {as_of}: {len(result.restored)} restored, {len(result.deleted)} deleted, "
+                 f"{result.unchanged} unchanged, {len(result.errors)} errors.")
+        return result
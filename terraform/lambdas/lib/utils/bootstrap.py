@@ -0,0 +1,181 @@
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import boto3
+
+from config.constants import *
+from lib.utils.metrics import metrics
+from lib.utils.utils import Utils
+
+log = Utils.get_logger(__name__, logging.INFO)
+
+
+class LazyAwsObject:
+    """
+    Stands in for a boto3 client or resource and creates it on first attribute access, so a lambda only pays for the
+    clients its code path actually uses.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._target = None
+        self._lock = threading.Lock()
+
+    def _resolve(self) -> Any:
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    self._target = self._factory()
+        return self._target
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._resolve(), name)
+
+
+def _instrumented_client(service: str) -> Any:
+    boto_client = boto3.client(service)
+    metrics.instrument(boto_client)
+    return boto_client
+
+
+def _instrumented_resource(service: str) -> Any:
+    boto_resource = boto3.resource(service)
+    metrics.instrument(boto_resource.meta.client)
+    return boto_resource
+
+
+_clients: Dict[str, LazyAwsObject] = {}
+_resources: Dict[str, LazyAwsObject] = {}
+_clients_lock = threading.Lock()
+
+
+def client(service: str) -> Any:
+    """
+    Returns the container wide client for `service`, created on first use and reporting to the invocation metrics.
+    """
+    with _clients_lock:
+        if service not in _clients:
+            _clients[service] = LazyAwsObject(lambda: _instrumented_client(service))
+        return _clients[service]
+
+
+def resource(service: str) -> Any:
+    """
+    Returns the container wide resource for `service`, created on first use and reporting to the invocation metrics.
+    """
+    with _clients_lock:
+        if service not in _resources:
+            _resources[service] = LazyAwsObject(lambda: _instrumented_resource(service))
+        return _resources[service]
+
+
+def install(clients: Dict[str, Any] = None, resources: Dict[str, Any] = None) -> None:
+    """
+    Points the container wide clients / resources at pre-built objects, e.g. the in-memory fakes used by the offline
+    benchmarks. Objects already handed out by `client` / `resource` follow along, and settings are reloaded on next
+    use.
+    """
+    for service, target in (clients or {}).items():
+        client(service)._target = target
+    for service, target in (resources or {}).items():
+        resource(service)._target = target
+
+    settings.refresh()
+
+
+class FiggySettings:
+    """
+    Figgy's own settings under FIGGY_SETTINGS_PREFIX. The first read loads (and decrypts) the whole prefix with
+    paged GetParametersByPath calls instead of one GetParameter round trip per setting. Values are reloaded once they
+    are older than `ttl` seconds, so settings changed in PS reach warm containers.
+    """
+
+    def __init__(self, boto_ssm_client, prefix: str = FIGGY_SETTINGS_PREFIX, ttl: int = FIGGY_SETTINGS_CACHE_TTL):
+        self._ssm = boto_ssm_client
+        self._prefix = prefix
+        self._ttl = ttl
+        self._values: Optional[Dict[str, str]] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, str]:
+        values = {}
+        kwargs = {'Path': self._prefix.rstrip('/'), 'Recursive': True, 'WithDecryption': True}
+        while True:
+            result = self._ssm.get_parameters_by_path(**kwargs)
+            for param in result.get('Parameters', []):
+                values[param['Name']] = param['Value']
+
+            if not result.get('NextToken'):
+                return values
+
+            kwargs['NextToken'] = result['NextToken']
+
+    def _settings(self) -> Dict[str, str]:
+        with self._lock:
+            if self._values is None or time.monotonic() - self._loaded_at > self._ttl:
+                self._values = self._load()
+                self._loaded_at = time.monotonic()
+                log.info(f"Loaded {len(self._values)} figgy settings from {self._prefix}")
+            return self._values
+
+    def refresh(self) -> None:
+        with self._lock:
+            self._values = None
+
+    def get(self, path: str, default: str = None) -> Optional[str]:
+        return self._settings().get(path, default)
+
+    def migrated(self, migration: str) -> bool:
+        """
+        True once `mark_migrated` has been called for `migration`, by this or any other lambda.
+        """
+        return self.get(f"{FIGGY_MIGRATIONS_PREFIX}{migration}") is not None
+
+    def mark_migrated(self, migration: str) -> None:
+        """
+        Records that a one-off data migration has completed. Other containers see it on their next settings reload.
+        """
+        name = f"{FIGGY_MIGRATIONS_PREFIX}{migration}"
+        completed_at = str(int(time.time() * 1000))
+        self._ssm.put_parameter(Name=name, Value=completed_at, Type='String', Overwrite=True)
+        with self._lock:
+            if self._values is not None:
+                self._values[name] = completed_at
+
+        log.info(f"Marked migration {migration} as complete.")
+
+    @property
+    def webhook_url(self) -> Optional[str]:
+        return self.get(FIGGY_WEBHOOK_URL_PATH)
+
+    @property
+    def account_id(self) -> Optional[str]:
+        return self.get(ACCOUNT_ID_PS_PATH)
+
+    @property
+    def account_env(self) -> Optional[str]:
+        return self.get(ACCOUNT_ENV_PS_PATH)
+
+    @property
+    def notify_deletes(self) -> bool:
+        return (self.get(NOTIFY_DELETES_PS_PATH) or '').lower() == 'true'
+
+    @property
+    def namespaces(self) -> List[str]:
+        namespaces = self.get(FIGGY_NAMESPACES_PATH)
+        return json.loads(namespaces) if namespaces else []
+
+    @property
+    def deploy_bucket(self) -> Optional[str]:
+        return self.get(FIGGY_DEPLOY_BUCKET_PS_PATH)
+
+    @property
+    def replication_key_id(self) -> Optional[str]:
+        return self.get(REPL_KEY_PS_PATH)
+
+
+settings = FiggySettings(client('ssm'))
@@ -0,0 +1,83 @@
+import re
+from functools import lru_cache
+from typing import FrozenSet, List, Mapping, NamedTuple, Optional, Tuple, Union
+from urllib.parse import quote_plus
+
+LIST_REFERENCE = re.compile(r"^\${(/.*)}$")
+STRING_REFERENCE = re.compile(r"\${([\w/-]+)}")
+URI_SUFFIX = ":uri"
+MISSING_KEY_MESSAGE = "KEY: {} is missing. Cannot complete merge key."
+COMPILED_TEMPLATE_CACHE_SIZE = 4096
+
+
+class Reference(NamedTuple):
+    name: str
+    uri_encode: bool
+
+
+class MergeTemplate:
+    """
+    A merge config source parsed into an ordered list of literal strings and `${...}` references.
+
+    Merge sources come in two forms:
+        List:   ["jdbc:", "${/shared/db/host}", ":5432"] - every element is either a literal or a single reference.
+        String: "jdbc:${/shared/db/host}:5432" - references are embedded in the literal text.
+
+    A `:uri` suffix on a reference URL-encodes the resolved value. Compile templates through `MergeTemplate.compile`,
+    which caches by source.
+    """
+
+    def __init__(self, parts: Tuple[Union[str, Reference], ...]):
+        self.parts = parts
+        self.references: FrozenSet[str] = frozenset(part.name for part in parts if isinstance(part, Reference))
+
+    @staticmethod
+    def compile(source: Union[str, List[str]]) -> "MergeTemplate":
+        return _compile(tuple(source) if isinstance(source, list) else source)
+
+    def render(self, values: Mapping[str, Optional[str]]) -> str:
+        """
+        Renders the template using `values` (PS name -> value). Missing or empty values render as a placeholder that
+        names the missing key.
+        """
+        rendered = []
+        for part in self.parts:
+            if isinstance(part, Reference):
+                value = values.get(part.name)
+                if not value:
+                    value = MISSING_KEY_MESSAGE.format(part.name)
+                elif part.uri_encode:
+                    value = quote_plus(value, encoding='utf-8')
+                rendered.append(value)
+            else:
+                rendered.append(part)
+
+        return "".join(rendered)
+
+
+def _reference(name: str) -> Reference:
+    if name.endswith(URI_SUFFIX):
+        return Reference(name[:-len(URI_SUFFIX)], True)
+
+    return Reference(name, False)
+
+
+@lru_cache(maxsize=COMPILED_TEMPLATE_CACHE_SIZE)
+def _compile(source: Union[str, Tuple[str, ...]]) -> MergeTemplate:
+    parts: List[Union[str, Reference]] = []
+    if isinstance(source, tuple):
+        for element in source:
+            match = LIST_REFERENCE.match(element)
+            parts.append(_reference(match.group(1)) if match else element)
+    else:
+        position = 0
+        for match in STRING_REFERENCE.finditer(source):
+            if match.start() > position:
+                parts.append(source[position:match.start()])
+            parts.append(_reference(match.group(1)))
+            position = match.end()
+
+        if position < len(source):
+            parts.append(source[position:])
+
+    return MergeTemplate(tuple(parts))
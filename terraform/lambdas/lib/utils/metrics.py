@@ -0,0 +1,221 @@
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, List, Tuple
+
+from config.constants import *
+from lib.utils.utils import Utils
+
+log = Utils.get_logger(__name__, logging.INFO)
+
+# Upper bounds (ms) of the latency histogram buckets. Each bucket is emitted as its midpoint and sample count.
+LATENCY_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000]
+EMF_MAX_METRICS_PER_DIRECTIVE = 100  # Hard limit imposed by the embedded metric format
+THROTTLE_ERROR_CODES = {'ThrottlingException', 'Throttling', 'TooManyUpdates', 'ProvisionedThroughputExceededException',
+                        'RequestLimitExceeded', 'SlowDown', 'TooManyRequestsException'}
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.min = 0.0
+        self.max = 0.0
+
+    def add(self, millis: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, millis)] += 1
+        self.min = min(self.min, millis) if self.total else millis
+        self.max = max(self.max, millis)
+        self.sum += millis
+        self.total += 1
+
+    def distribution(self) -> Dict:
+        """
+        The histogram as an embedded metric format distribution: bucket midpoints in `Values` with their sample
+        counts in `Counts`. Unlike per invocation percentiles, these can be aggregated across invocations, so
+        CloudWatch computes real percentiles over any period.
+        """
+        values, counts = [], []
+        for bucket, count in enumerate(self.counts):
+            if count:
+                lower = LATENCY_BUCKETS[bucket - 1] if bucket else 0
+                upper = LATENCY_BUCKETS[bucket] if bucket < len(LATENCY_BUCKETS) else self.max
+                values.append(round(min(max((lower + upper) / 2, self.min), self.max), 1))
+                counts.append(count)
+
+        return {"Values": values, "Counts": counts, "Min": round(self.min, 1), "Max": round(self.max, 1),
+                "Count": self.total, "Sum": round(self.sum, 1)}
+
+
+class Metrics:
+    """
+    Per invocation AWS call metrics. Boto clients passed to `instrument` report every call: the count per API
+    operation, a latency histogram (time spent in the call, SDK retries included), SDK retries, throttles and errors.
+    Handlers time their phases with `phase` and record other distributions (e.g. replication lag) with `observe`.
+    Everything is written to stdout as a single CloudWatch Embedded Metric Format document when the invocation ends,
+    which CloudWatch turns into metrics with no extra API calls.
+    """
+
+    def __init__(self, namespace: str = METRICS_NAMESPACE):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._instrumented = set()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls: Dict[str, int] = {}
+            self.errors: Dict[str, int] = {}
+            self.retries: Dict[str, int] = {}
+            self.throttles: Dict[str, int] = {}
+            self.latency: Dict[str, LatencyHistogram] = {}
+            self.phases: Dict[str, float] = {}
+            self.observed: Dict[str, LatencyHistogram] = {}
+
+    def instrument(self, boto_client) -> None:
+        """
+        Hooks into the botocore events of a client (for resources, pass `resource.meta.client`).
+        """
+        if id(boto_client) in self._instrumented:
+            return
+
+        events = boto_client.meta.events
+        events.register('before-call.*.*', self._before_call)
+        events.register('after-call.*.*', self._after_call)
+        events.register('after-call-error.*.*', self._after_call_error)
+        events.register('needs-retry.*.*', self._needs_retry)
+        self._instrumented.add(id(boto_client))
+
+    @staticmethod
+    def _operation(event_name: str) -> str:
+        _, service, operation = event_name.split('.', 2)
+        return f"{service}.{operation}"
+
+    def _increment(self, counter: Dict[str, int], operation: str) -> None:
+        with self._lock:
+            counter[operation] = counter.get(operation, 0) + 1
+
+    def _before_call(self, context: Dict, **kwargs) -> None:
+        context['metrics_start'] = time.perf_counter()
+
+    def _record(self, event_name: str, context: Dict, error: bool) -> None:
+        operation = self._operation(event_name)
+        millis = (time.perf_counter() - context.get('metrics_start', time.perf_counter())) * 1000
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+            self.latency.setdefault(operation, LatencyHistogram()).add(millis)
+            if error:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def _after_call(self, event_name: str, http_response, parsed: Dict, context: Dict, **kwargs) -> None:
+        self._record(event_name, context, error=http_response.status_code >= 300)
+
+    def _after_call_error(self, event_name: str, context: Dict, **kwargs) -> None:
+        self._record(event_name, context, error=True)
+
+    def _needs_retry(self, event_name: str, response=None, attempts: int = 1, **kwargs) -> None:
+        operation = self._operation(event_name)
+        if attempts > 1:
+            self._increment(self.retries, operation)
+
+        parsed = response[1] if response else {}
+        if parsed.get('Error', {}).get('Code') in THROTTLE_ERROR_CODES:
+            self._increment(self.throttles, operation)
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Times a phase of the current invocation. Repeated phases add up.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def observe(self, name: str, millis: float) -> None:
+        """
+        Adds a sample to a named distribution, emitted as a histogram of all samples of the invocation.
+        """
+        with self._lock:
+            self.observed.setdefault(name, LatencyHistogram()).add(millis)
+
+    def document(self, function: str, duration: float, failed: bool) -> Dict:
+        """
+        Builds the embedded metric format document for the current invocation.
+        """
+        values: List[Tuple[str, str, Any]] = [
+            ("Duration", "Milliseconds", round(duration, 1)),
+            ("Errors", "Count", 1 if failed else 0),
+            ("AwsCalls", "Count", sum(self.calls.values())),
+            ("AwsThrottles", "Count", sum(self.throttles.values())),
+        ]
+        for name, millis in sorted(self.phases.items()):
+            values.append((f"Phase.{name}", "Milliseconds", round(millis, 1)))
+
+        for name, histogram in sorted(self.observed.items()):
+            values.append((name, "Milliseconds", histogram.distribution()))
+
+        for operation in sorted(set(self.calls) | set(self.throttles) | set(self.retries)):
+            values.extend([
+                (f"{operation}.Calls", "Count", self.calls.get(operation, 0)),
+                (f"{operation}.Errors", "Count", self.errors.get(operation, 0)),
+                (f"{operation}.Retries", "Count", self.retries.get(operation, 0)),
+                (f"{operation}.Throttles", "Count", self.throttles.get(operation, 0)),
+            ])
+            if operation in self.latency:
+                values.append((f"{operation}.Latency", "Milliseconds", self.latency[operation].distribution()))
+
+        definitions = [{"Name": name, "Unit": unit} for name, unit, _ in values]
+        document = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": self.namespace,
+                        "Dimensions": [["Function"]],
+                        "Metrics": definitions[i:i + EMF_MAX_METRICS_PER_DIRECTIVE],
+                    } for i in range(0, len(definitions), EMF_MAX_METRICS_PER_DIRECTIVE)
+                ],
+            },
+            "Function": function,
+        }
+        document.update(dict((name, value) for name, _, value in values))
+        return document
+
+    def handler(self, function: str) -> Callable:
+        """
+        Decorates a lambda handler. Metrics are reset when the invocation starts and emitted when it ends, whether it
+        succeeds or raises.
+        """
+        def decorator(handle: Callable) -> Callable:
+            @wraps(handle)
+            def wrapper(event, context):
+                self.reset()
+                start = time.perf_counter()
+                failed = False
+                try:
+                    return handle(event, context)
+                except Exception:
+                    failed = True
+                    raise
+                finally:
+                    try:
+                        duration = (time.perf_counter() - start) * 1000
+                        print(json.dumps(self.document(function, duration, failed)))
+                    except Exception as e:
+                        log.warning(f"Unable to emit invocation metrics: {e}")
+
+            return wrapper
+
+        return decorator
+
+
+metrics = Metrics()
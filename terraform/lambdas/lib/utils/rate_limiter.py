@@ -0,0 +1,72 @@
+import threading
+import time
+from typing import Dict
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket used to pace calls to rate-limited AWS APIs.
+
+    Callers `acquire()` a token before each call. Tokens refill at `rate` per second up to `burst`. The refill rate is
+    adaptive: it is halved each time the API reports throttling and climbs back towards the configured rate by
+    `recovery_step` per successful call.
+    """
+
+    def __init__(self, rate: float, burst: int, min_rate: float = 1.0, recovery_step: float = None):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.burst = burst
+        self.min_rate = min_rate
+        self._recovery_step = recovery_step if recovery_step else max(self.max_rate / 50, 0.1)
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.throttled = 0
+        self.wait_time = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self) -> float:
+        """
+        Blocks until a token is available.
+        Returns: float -> Seconds spent waiting for the token.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    self.calls += 1
+                    self.wait_time += waited
+                    return waited
+
+                delay = (1 - self._tokens) / self.rate
+
+            time.sleep(delay)
+            waited += delay
+
+    def on_success(self) -> None:
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self._recovery_step)
+
+    def on_throttle(self) -> None:
+        with self._lock:
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = 0.0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "throttled": self.throttled,
+                "wait_time": round(self.wait_time, 3),
+                "current_rate": round(self.rate, 2),
+            }
@@ -1,7 +1,9 @@
 import re
 import logging
 import sys
+import time
 import traceback
+from typing import Optional
 
 
 class Utils:
@@ -23,6 +25,17 @@ class Utils:
 
         return logging.getLogger(name)
 
+    @staticmethod
+    def deadline(context, margin: float) -> Optional[float]:
+        """
+        Returns the time.monotonic() value `margin` seconds before the current invocation times out, or None when
+        there is no lambda context (e.g. local runs).
+        """
+        if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+            return None
+
+        return time.monotonic() + context.get_remaining_time_in_millis() / 1000 - margin
+
     @staticmethod
     def printable_exception(e: Exception):
         printable_exception = ''.join(traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__))
@@ -2,6 +2,7 @@ data "archive_file" "figgy" {
   source_dir  = "lambdas/"
   output_path = "figgy.zip"
   type        = "zip"
+  excludes    = ["benchmarks"]
   depends_on = [time_sleep.wait_45_seconds]
 }
 
@@ -3,7 +3,7 @@ resource "aws_dynamodb_table" "config_replication" {
   hash_key         = "destination"
   billing_mode     = "PAY_PER_REQUEST"
   stream_enabled   = "true"
-  stream_view_type = "KEYS_ONLY"
+  stream_view_type = "NEW_IMAGE"
 
   point_in_time_recovery {
     enabled = true
@@ -14,6 +14,18 @@ resource "aws_dynamodb_table" "config_replication" {
     type = "S"
   }
 
+  # Only set on `app` configs, merge configs keep a list in `source` and are indexed by figgy-config-repl-merge-refs.
+  attribute {
+    name = "source_key"
+    type = "S"
+  }
+
+  global_secondary_index {
+    name            = "source-index"
+    hash_key        = "source_key"
+    projection_type = "ALL"
+  }
+
   tags = {
     Name        = "figgy-config-replication"
     Environment = var.env_alias
@@ -23,6 +35,84 @@ resource "aws_dynamodb_table" "config_replication" {
   }
 }
 
+# Reverse index of merge replication configs, keyed by every parameter a merge source references.
+# Maintained by the replication lambdas.
+resource "aws_dynamodb_table" "config_repl_merge_refs" {
+  name         = "figgy-config-repl-merge-refs"
+  hash_key     = "destination"
+  range_key    = "reference"
+  billing_mode = "PAY_PER_REQUEST"
+
+  attribute {
+    name = "destination"
+    type = "S"
+  }
+
+  attribute {
+    name = "reference"
+    type = "S"
+  }
+
+  global_secondary_index {
+    name            = "reference-index"
+    hash_key        = "reference"
+    range_key       = "destination"
+    projection_type = "ALL"
+  }
+
+  tags = {
+    Name        = "figgy-config-repl-merge-refs"
+    Environment = var.env_alias
+    owner       = "devops"
+    application = "figgy"
+    created_by  = "figgy"
+  }
+}
+
+# Rolling replication lag per destination, written by the replication lambdas. The lag-index sorts every destination
+# by its recent lag so the slowest ones can be read with a single query.
+resource "aws_dynamodb_table" "config_repl_lag" {
+  name         = "figgy-config-repl-lag"
+  hash_key     = "destination"
+  billing_mode = "PAY_PER_REQUEST"
+
+  attribute {
+    name = "destination"
+    type = "S"
+  }
+
+  attribute {
+    name = "lag_partition"
+    type = "S"
+  }
+
+  attribute {
+    name = "rolling_lag"
+    type = "N"
+  }
+
+  global_secondary_index {
+    name               = "lag-index"
+    hash_key           = "lag_partition"
+    range_key          = "rolling_lag"
+    projection_type    = "INCLUDE"
+    non_key_attributes = ["last_lag", "max_lag", "last_completed", "trigger"]
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "figgy-config-repl-lag"
+    Environment = var.env_alias
+    owner       = "devops"
+    application = "figgy"
+    created_by  = "figgy"
+  }
+}
+
 resource "aws_dynamodb_table" "config_auditor" {
   name         = "figgy-config-auditor"
   hash_key     = "parameter_name"
@@ -43,6 +133,37 @@ resource "aws_dynamodb_table" "config_auditor" {
     type = "N"
   }
 
+  # Day-sized shard of time, for "what changed between x and y" queries.
+  attribute {
+    name = "time_bucket"
+    type = "N"
+  }
+
+  attribute {
+    name = "user"
+    type = "S"
+  }
+
+  global_secondary_index {
+    name            = "time-index"
+    hash_key        = "time_bucket"
+    range_key       = "time"
+    projection_type = "ALL"
+  }
+
+  global_secondary_index {
+    name            = "user-index"
+    hash_key        = "user"
+    range_key       = "time"
+    projection_type = "ALL"
+  }
+
+  # Set on records written by automated E2E tests so DynamoDB expires them.
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
   tags = {
     Name        = "figgy-config-auditor"
     Environment = var.env_alias
@@ -68,6 +189,45 @@ resource "aws_dynamodb_table" "config_cache" {
     type = "N"
   }
 
+  # Only present on DELETED items, which keeps the tombstone-index sparse.
+  attribute {
+    name = "tombstone"
+    type = "S"
+  }
+
+  global_secondary_index {
+    name            = "tombstone-index"
+    hash_key        = "tombstone"
+    range_key       = "last_updated"
+    projection_type = "ALL"
+  }
+
+  # When an item was written, which can be minutes after the CloudTrail eventTime in last_updated.
+  attribute {
+    name = "written_at"
+    type = "N"
+  }
+
+  # Day-sized shard of written_at, lets clients query for changes since their last sync.
+  attribute {
+    name = "time_bucket"
+    type = "N"
+  }
+
+  global_secondary_index {
+    name               = "changes-index"
+    hash_key           = "time_bucket"
+    range_key          = "written_at"
+    projection_type    = "INCLUDE"
+    non_key_attributes = ["state"]
+  }
+
+  # Set on DELETED items so DynamoDB expires tombstones once clients have had time to sync them.
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
   tags = {
     Name        = "figgy-config-cache"
     Environment = var.env_alias
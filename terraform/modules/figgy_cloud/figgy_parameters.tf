@@ -117,6 +117,14 @@ resource "aws_ssm_parameter" "env_alias" {
   overwrite   = true
 }
 
+resource "aws_ssm_parameter" "deploy_bucket" {
+  name        = "/figgy/deploy_bucket"
+  type        = "String"
+  value       = var.deploy_bucket
+  description = "Bucket figgy is deployed from. Also holds config snapshots under figgy/snapshots/"
+  overwrite   = true
+}
+
 ## Slack Configurations
 resource "aws_ssm_parameter" "notify_deletes" {
   name        = "/figgy/integrations/slack/notify-deletes"
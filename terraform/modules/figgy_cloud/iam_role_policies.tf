@@ -112,10 +112,47 @@ data "aws_iam_policy_document" "dynamic_policy" {
     resources = [
       aws_dynamodb_table.config_replication.arn,
       aws_dynamodb_table.config_auditor.arn,
-      aws_dynamodb_table.config_cache.arn
+      "${aws_dynamodb_table.config_auditor.arn}/index/*",
+      aws_dynamodb_table.config_cache.arn,
+      "${aws_dynamodb_table.config_cache.arn}/index/*",
+      aws_dynamodb_table.config_repl_lag.arn,
+      "${aws_dynamodb_table.config_repl_lag.arn}/index/*"
     ]
   }
 
+  # Audit values over AUDIT_VALUE_OFFLOAD_THRESHOLD are stored under figgy/blobs/<value_ref> in the deploy bucket,
+  # zlib compressed and SSE-KMS encrypted with the replication key.
+  statement {
+    sid       = "ReadAuditValueBlobs"
+    actions   = ["s3:GetObject"]
+    resources = ["arn:aws:s3:::${var.deploy_bucket}/figgy/blobs/*"]
+  }
+
+  # Decrypt with the replication key is only usable through S3 reads of audit blobs, not for replicated parameters.
+  statement {
+    sid       = "DecryptAuditValueBlobs"
+    actions   = ["kms:Decrypt"]
+    resources = [aws_kms_key.replication_key.arn]
+
+    condition {
+      test     = "StringLike"
+      variable = "kms:ViaService"
+      values   = ["s3.*.amazonaws.com"]
+    }
+
+    # S3BlobStore writes blobs with Bucket Keys off, so their context is the object ARN. Blobs written before that, to
+    # a bucket with Bucket Keys on by default, carry the bucket ARN instead and are never rewritten. Allowing it does
+    # not widen access, S3 only decrypts for objects the role can GetObject, which is figgy/blobs/* alone.
+    condition {
+      test     = "StringLike"
+      variable = "kms:EncryptionContext:aws:s3:arn"
+      values = [
+        "arn:aws:s3:::${var.deploy_bucket}/figgy/blobs/*",
+        "arn:aws:s3:::${var.deploy_bucket}"
+      ]
+    }
+  }
+
   # Provide replication key access to appropriate environments
   dynamic "statement" {
     for_each = contains(var.cfgs.replication_key_access_envs, var.env_alias) ? [true] : []
@@ -39,4 +39,11 @@ module "config_auditor_trigger" {
   }
 }
 PATTERN
-}
\ No newline at end of file
+}
+# Bounds how late an audit record can be written. Config snapshot checkpoints wait SNAPSHOT_SETTLE_TIME, which
+# includes this age, keep the two in sync.
+resource "aws_lambda_function_event_invoke_config" "config_auditor" {
+  function_name                = module.config_auditor.name
+  maximum_event_age_in_seconds = 3600
+  maximum_retry_attempts       = 2
+}
@@ -0,0 +1,23 @@
+module "config_snapshotter" {
+  source                  = "../figgy_lambda"
+  deploy_bucket           = local.lambda_bucket
+  description             = "Stores point-in-time config snapshots built from the audit log and restores namespaces from them."
+  handler                 = "functions/config_snapshotter.handle"
+  lambda_name             = "figgy-config-snapshotter"
+  lambda_timeout          = 900
+  policies                = [aws_iam_policy.config_snapshotter.arn, aws_iam_policy.lambda_default.arn, aws_iam_policy.lambda_read_configs.arn]
+  zip_path                = data.archive_file.figgy.output_path
+  layers                  = [var.cfgs.aws_sdk_layer_map[var.region]]
+  cw_lambda_log_retention = var.figgy_cw_log_retention
+  sns_alarm_topic         = aws_sns_topic.figgy_alarms.arn
+  sha256                  = data.archive_file.figgy.output_base64sha256
+  memory_size             = 1024
+  concurrent_executions   = 1
+}
+
+module "config_snapshotter_trigger" {
+  source              = "../triggers/cron_trigger"
+  lambda_name         = module.config_snapshotter.name
+  lambda_arn          = module.config_snapshotter.arn
+  schedule_expression = "rate(1 day)"
+}
@@ -14,8 +14,14 @@ module "dynamo_stream_replicator" {
   memory_size             = 256
 }
 
+# Failed destinations are returned as batchItemFailures. Batches that fail outright are bisected, and records that
+# still fail after the retries are skipped. The replication syncer resyncs every config each run, so it repairs them.
 module "dynamo_stream_replicator_trigger" {
-  source            = "../triggers/ddb_trigger"
-  lambda_name       = module.dynamo_stream_replicator.name
-  dynamo_stream_arn = aws_dynamodb_table.config_replication.stream_arn
+  source                         = "../triggers/ddb_trigger"
+  lambda_name                    = module.dynamo_stream_replicator.name
+  dynamo_stream_arn              = aws_dynamodb_table.config_replication.stream_arn
+  message_batch_size             = 100
+  bisect_batch_on_function_error = true
+  maximum_retry_attempts         = 5
+  function_response_types        = ["ReportBatchItemFailures"]
 }
@@ -44,7 +44,7 @@ data "aws_iam_policy_document" "config_auditor_document" {
       "dynamodb:UpdateItem",
       "dynamodb:UpdateTimeToLive"
     ]
-    resources = [aws_dynamodb_table.config_auditor.arn]
+    resources = [aws_dynamodb_table.config_auditor.arn, "${aws_dynamodb_table.config_auditor.arn}/index/*"]
   }
 
   statement {
@@ -57,6 +57,31 @@ data "aws_iam_policy_document" "config_auditor_document" {
     ]
     resources = ["*"]
   }
+
+  # Large audit values are offloaded to a content-addressed blob store in the deploy bucket.
+  statement {
+    sid       = "BlobBucketList"
+    actions   = ["s3:ListBucket"]
+    resources = ["arn:aws:s3:::${var.deploy_bucket}"]
+  }
+
+  statement {
+    sid = "BlobObjectAccess"
+    actions = [
+      "s3:GetObject",
+      "s3:PutObject"
+    ]
+    resources = ["arn:aws:s3:::${var.deploy_bucket}/figgy/blobs/*"]
+  }
+
+  statement {
+    sid = "BlobKMSAccess"
+    actions = [
+      "kms:Decrypt",
+      "kms:GenerateDataKey"
+    ]
+    resources = [aws_kms_key.replication_key.arn]
+  }
 }
 
 # Config cache manager / syncer lambdas
@@ -77,9 +102,10 @@ data "aws_iam_policy_document" "config_cache_manager_document" {
       "dynamodb:Query",
       "dynamodb:Scan",
       "dynamodb:UpdateItem",
-      "dynamodb:UpdateTimeToLive"
+      "dynamodb:UpdateTimeToLive",
+      "dynamodb:BatchWriteItem"
     ]
-    resources = [aws_dynamodb_table.config_cache.arn]
+    resources = [aws_dynamodb_table.config_cache.arn, "${aws_dynamodb_table.config_cache.arn}/index/*"]
   }
 
   statement {
@@ -108,9 +134,19 @@ data "aws_iam_policy_document" "config_replication_document" {
       "dynamodb:Query",
       "dynamodb:Scan",
       "dynamodb:UpdateItem",
-      "dynamodb:UpdateTimeToLive"
+      "dynamodb:UpdateTimeToLive",
+      "dynamodb:BatchWriteItem",
+      "dynamodb:BatchGetItem",
+      "dynamodb:DescribeTable"
+    ]
+    resources = [
+      aws_dynamodb_table.config_replication.arn,
+      "${aws_dynamodb_table.config_replication.arn}/index/*",
+      aws_dynamodb_table.config_repl_merge_refs.arn,
+      "${aws_dynamodb_table.config_repl_merge_refs.arn}/index/*",
+      aws_dynamodb_table.config_repl_lag.arn,
+      "${aws_dynamodb_table.config_repl_lag.arn}/index/*"
     ]
-    resources = [aws_dynamodb_table.config_replication.arn]
   }
 
   statement {
@@ -165,6 +201,13 @@ data "aws_iam_policy_document" "config_replication_document" {
     ))
   }
 
+  # The replication syncer marks the source-index backfill complete once every app config has been indexed.
+  statement {
+    sid       = "FiggyMigrationMarkers"
+    actions   = ["ssm:PutParameter"]
+    resources = ["arn:aws:ssm:*:${data.aws_caller_identity.current.account_id}:parameter/figgy/migrations/*"]
+  }
+
   statement {
     sid       = "SSMDescribe"
     actions   = ["ssm:DescribeParameters"]
@@ -173,6 +216,92 @@ data "aws_iam_policy_document" "config_replication_document" {
 }
 
 
+# Config snapshotter lambda
+resource "aws_iam_policy" "config_snapshotter" {
+  name        = "config-snapshotter"
+  path        = "/"
+  description = "IAM policy for figgy config_snapshotter lambda"
+  policy      = data.aws_iam_policy_document.config_snapshotter_document.json
+}
+
+data "aws_iam_policy_document" "config_snapshotter_document" {
+  statement {
+    sid = "AuditTableRead"
+    actions = [
+      "dynamodb:Query",
+      "dynamodb:Scan"
+    ]
+    resources = [aws_dynamodb_table.config_auditor.arn, "${aws_dynamodb_table.config_auditor.arn}/index/*"]
+  }
+
+  # One-off backfills of the audit table, each marked complete under /figgy/migrations once it has finished.
+  statement {
+    sid       = "AuditTableBackfill"
+    actions   = ["dynamodb:UpdateItem"]
+    resources = [aws_dynamodb_table.config_auditor.arn]
+  }
+
+  statement {
+    sid       = "FiggyMigrationMarkers"
+    actions   = ["ssm:PutParameter"]
+    resources = ["arn:aws:ssm:*:${data.aws_caller_identity.current.account_id}:parameter/figgy/migrations/*"]
+  }
+
+  statement {
+    sid       = "SnapshotBucketList"
+    actions   = ["s3:ListBucket"]
+    resources = ["arn:aws:s3:::${var.deploy_bucket}"]
+  }
+
+  statement {
+    sid = "SnapshotObjectAccess"
+    actions = [
+      "s3:GetObject",
+      "s3:PutObject"
+    ]
+    resources = ["arn:aws:s3:::${var.deploy_bucket}/figgy/snapshots/*"]
+  }
+
+  statement {
+    sid       = "BlobObjectRead"
+    actions   = ["s3:GetObject"]
+    resources = ["arn:aws:s3:::${var.deploy_bucket}/figgy/blobs/*"]
+  }
+
+  # Snapshots are encrypted with the replication key, restores may write SecureStrings with any figgy key.
+  statement {
+    sid = "FiggyKMSAccess"
+    actions = [
+      "kms:DescribeKey",
+      "kms:Decrypt",
+      "kms:Encrypt",
+      "kms:GenerateDataKey"
+    ]
+
+    resources = concat([for x in aws_kms_key.encryption_key : x.arn], [aws_kms_key.replication_key.arn])
+  }
+
+  statement {
+    sid = "FiggySSMRestore"
+    actions = [
+      "ssm:DeleteParameter",
+      "ssm:GetParameter",
+      "ssm:GetParameters",
+      "ssm:PutParameter"
+    ]
+    resources = [
+      for x in var.cfgs.root_namespaces :
+      format("arn:aws:ssm:*:%s:parameter%s/*", data.aws_caller_identity.current.account_id, x)
+    ]
+  }
+
+  statement {
+    sid       = "SSMDescribe"
+    actions   = ["ssm:DescribeParameters"]
+    resources = ["*"]
+  }
+}
+
 # Read configs under /figgy namespace
 resource "aws_iam_policy" "lambda_read_configs" {
   name        = "figgy-lambda-read-configs"
@@ -189,7 +318,11 @@ data "aws_iam_policy_document" "lambda_read_figgy_configs" {
       "ssm:GetParameters",
       "ssm:GetParametersByPath"
     ]
-    resources = ["arn:aws:ssm:*:${data.aws_caller_identity.current.account_id}:parameter/figgy/*"]
+    # GetParametersByPath(Path="/figgy") is authorized against the path itself, not the parameters under it.
+    resources = [
+      "arn:aws:ssm:*:${data.aws_caller_identity.current.account_id}:parameter/figgy",
+      "arn:aws:ssm:*:${data.aws_caller_identity.current.account_id}:parameter/figgy/*"
+    ]
   }
 
   statement {
@@ -2,9 +2,12 @@ data "aws_caller_identity" "current" {}
 
 
 resource "aws_lambda_event_source_mapping" "event_source_mapping" {
-  batch_size        = var.message_batch_size
-  event_source_arn  = var.dynamo_stream_arn
-  enabled           = true
-  function_name     = var.lambda_name
-  starting_position = "LATEST"
+  batch_size                     = var.message_batch_size
+  event_source_arn               = var.dynamo_stream_arn
+  enabled                        = true
+  function_name                  = var.lambda_name
+  starting_position              = "LATEST"
+  bisect_batch_on_function_error = var.bisect_batch_on_function_error
+  maximum_retry_attempts         = var.maximum_retry_attempts
+  function_response_types        = var.function_response_types
 }
\ No newline at end of file
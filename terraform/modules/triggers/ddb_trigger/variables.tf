@@ -10,4 +10,19 @@ variable "dynamo_stream_arn" {
 variable "message_batch_size" {
   description = "Batch size to retrieve DDB updates as"
   default = 10
-}
\ No newline at end of file
+}
+
+variable "bisect_batch_on_function_error" {
+  description = "Split a failed batch in two and retry each half, isolating the records that keep failing"
+  default = false
+}
+
+variable "maximum_retry_attempts" {
+  description = "Retries of a failed batch before its records are skipped, -1 retries until the records expire"
+  default = -1
+}
+
+variable "function_response_types" {
+  description = "Set to [\"ReportBatchItemFailures\"] if the lambda returns the records that failed as batchItemFailures"
+  default = []
+}